@@ -1,39 +1,113 @@
 import asyncio
 import os
+from datetime import timedelta
 from tomllib import load
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage
 
-from app.db.models import db_init
+from app.config.bot import (
+    ALLOWED_UPDATES,
+    BOT_MODE,
+    TELEGRAM_API_URL,
+    UPDATES_CONCURRENCY,
+    USER_QUEUE_SIZE,
+)
+from app.config.fsm import FSM_CLEANUP_INTERVAL_SEC, FSM_STORAGE, FSM_TTL_HOURS
+from app.db.models import async_session, db_init, engine
+from app.db.stats import setup_db_stats
+from app.db.storage import PostgresStorage
 from app.middlewares.album import AlbumMiddleware
+from app.middlewares.fsm import FSMSnapshotMiddleware, SnapshotStorage
 from app.middlewares.logging import LoggingMiddleware
+from app.middlewares.ordering import UserOrderMiddleware
 from app.roles import admin, master, owner, user
 from app.utils import setup_logger
+from app.utils.scheduler import ReportScheduler
+from app.utils.sender import Sender
+from app.webhook import run_webhook
 
 logger = setup_logger(__name__)
 
 
-async def main():
-    """Настройка конфигурации бота и подключение роутеров."""
+def get_storage() -> BaseStorage:
+    """Хранилище FSM согласно конфигурации."""
+    if FSM_STORAGE == "memory":
+        logger.info("FSM хранится в памяти")
+        return MemoryStorage()
+    logger.info("FSM хранится в Postgres")
+    storage = PostgresStorage(async_session, ttl=timedelta(hours=FSM_TTL_HOURS))
+    storage.start_cleanup(FSM_CLEANUP_INTERVAL_SEC)
+    return storage
 
-    await db_init()
 
+def create_dispatcher(storage: BaseStorage) -> Dispatcher:
+    """Диспетчер с роутерами и middleware бота.
+
+    Args:
+        storage (BaseStorage): Хранилище FSM.
+
+    Returns:
+        Dispatcher: Диспетчер.
+    """
     master.message.middleware(AlbumMiddleware())
     admin.message.middleware(AlbumMiddleware())
 
-    dp = Dispatcher()
+    storage = SnapshotStorage(storage)
+    dp = Dispatcher(storage=storage)
+    # Очередь пользователя и снимок FSM должны охватывать и чтение состояния
+    # в FSMContextMiddleware
+    dp.update.outer_middleware.unregister(dp.fsm)
+    dp.update.outer_middleware(UserOrderMiddleware(UPDATES_CONCURRENCY, USER_QUEUE_SIZE))
+    dp.update.outer_middleware(FSMSnapshotMiddleware(storage))
+    dp.update.outer_middleware(dp.fsm)
     dp.include_routers(admin, master, owner, user)
     dp.callback_query.middleware(LoggingMiddleware())
     dp.message.middleware(LoggingMiddleware())
+    return dp
+
 
-    bot = Bot(
+def create_bot() -> Bot:
+    """Бот. При заданном TELEGRAM_API_URL запросы идут на указанный сервер Bot API."""
+    session = None
+    if TELEGRAM_API_URL:
+        logger.info(f"Используется сервер Bot API {TELEGRAM_API_URL}")
+        session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL))
+    return Bot(
         token=os.getenv("TOKEN_BOT"),
+        session=session,
         default=DefaultBotProperties(parse_mode="html"),
     )
 
-    logger.info("Старт бота")
-    await dp.start_polling(bot)
+
+async def main():
+    """Настройка конфигурации бота и подключение роутеров."""
+
+    setup_db_stats(engine)
+    await db_init()
+
+    dp = create_dispatcher(get_storage())
+    bot = create_bot()
+    sender = Sender(bot)
+    dp["sender"] = sender
+    dp.startup.register(sender.start)
+    dp.shutdown.register(sender.close)
+    report_scheduler = ReportScheduler()
+    dp["report_scheduler"] = report_scheduler
+    dp.startup.register(report_scheduler.start)
+    dp.shutdown.register(report_scheduler.close)
+    allowed_updates = ALLOWED_UPDATES or dp.resolve_used_update_types()
+
+    logger.info(f"Старт бота (mode={BOT_MODE}, allowed_updates={allowed_updates})")
+    if BOT_MODE == "webhook":
+        await run_webhook(dp, bot, allowed_updates)
+    else:
+        await bot.delete_webhook()
+        await dp.start_polling(bot, allowed_updates=allowed_updates)
 
 
 def get_version():
@@ -0,0 +1,197 @@
+import argparse
+import asyncio
+import json
+import sys
+from datetime import timedelta
+from typing import Iterator
+
+from sqlalchemy import desc, event, select, text
+
+from app.bench.seed import SeedConfig, add_seed_arguments, check_allow_write, seeded
+from app.db import requests
+from app.db.models import Timesheet, WorkerPosition, async_session, db_init, engine
+from app.utils import setup_logger
+from app.utils.month import month_bounds
+
+logger = setup_logger(__name__)
+
+# Таблицы, которые растут со сменами: по ним запросы должны идти через индексы
+WATCHED_TABLES = ("timesheet", "worker_position", "correction")
+INDEX_NODES = ("Index Scan", "Index Only Scan", "Bitmap Index Scan")
+
+
+class Capture:
+    """Запись SQL выражений, которые выполняют helper'ы из app.db.requests."""
+
+    def __init__(self):
+        self.active = False
+        self.statements: list[tuple[str, tuple]] = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if self.active:
+            self.statements.append((statement, parameters))
+
+    async def run(self, coro) -> list[tuple[str, tuple]]:
+        self.statements = []
+        self.active = True
+        try:
+            await coro
+        finally:
+            self.active = False
+        return self.statements
+
+
+def cases(factory_id: int, year: int, month: int, timesheet: Timesheet, worker_id: int) -> dict:
+    """Запросы отчёта и поиска на синтетическом заводе.
+
+    Returns:
+        dict: {название: корутина helper'а}.
+    """
+    start, end = month_bounds(year, month)
+    day = timesheet.datetime.date()
+
+    async def stream():
+        async for _ in requests.stream_positions(
+            start.date(), end.date() - timedelta(1), factory_id
+        ):
+            pass
+
+    return {
+        "get_shifts_count": requests.get_shifts_count(factory_id, year, month),
+        "get_report_users": requests.get_report_users(factory_id, year, month),
+        "get_report_profiles": requests.get_report_profiles([worker_id], year, month),
+        "get_report_positions": requests.get_report_positions(factory_id, year, month),
+        "get_report_activities": requests.get_report_activities(factory_id, year, month),
+        "get_report_corrections": requests.get_report_corrections(factory_id, year, month),
+        "get_report_version": requests.get_report_version(factory_id, year, month),
+        "get_shift_by_date": requests.get_shift_by_date(timesheet.user_id, factory_id),
+        "get_shift_by_date(day)": requests.get_shift_by_date(timesheet.user_id, factory_id, day),
+        "get_positions_by_shift_id": requests.get_positions_by_shift_id(timesheet.id),
+        "stream_positions": stream(),
+    }
+
+
+def plan_nodes(plan: dict) -> Iterator[dict]:
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+async def explain(statement: str, parameters: tuple) -> dict:
+    async with engine.connect() as conn:
+        result = await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+        plan = result.scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+
+async def table_rows() -> dict[str, float]:
+    async with engine.begin() as conn:
+        await conn.execute(text(f"ANALYZE {', '.join(WATCHED_TABLES)}"))
+        rows = await conn.execute(
+            text("SELECT relname, reltuples FROM pg_class WHERE relname = ANY(:names)"),
+            {"names": list(WATCHED_TABLES)},
+        )
+        return dict(rows.all())
+
+
+async def check(config: SeedConfig, min_rows: int) -> list[str]:
+    """Планы запросов отчёта и поиска на синтетических данных.
+
+    Args:
+        config (SeedConfig): Размеры данных.
+        min_rows (int): Таблица меньше этого числа строк может читаться целиком.
+
+    Returns:
+        list[str]: Описания последовательных чтений больших таблиц.
+    """
+    async with seeded(config) as data:
+        return await _check(data.factory_ids[0], config, min_rows)
+
+
+async def _check(factory_id: int, config: SeedConfig, min_rows: int) -> list[str]:
+    sizes = await table_rows()
+    logger.info(f"Строк в таблицах: {sizes}")
+    async with async_session() as session:
+        timesheet = await session.scalar(
+            select(Timesheet)
+            .where(Timesheet.factory_id == factory_id)
+            .order_by(desc(Timesheet.datetime))
+            .limit(1)
+        )
+        worker_id = await session.scalar(
+            select(WorkerPosition.user_id).where(WorkerPosition.timesheet_id == timesheet.id)
+        )
+
+    capture = Capture()
+    event.listen(engine.sync_engine, "before_cursor_execute", capture)
+    try:
+        captured = {}
+        for name, coro in cases(
+            factory_id, config.year, config.month, timesheet, worker_id
+        ).items():
+            captured[name] = await capture.run(coro)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", capture)
+
+    violations = []
+    for name, statements in captured.items():
+        for i, (statement, parameters) in enumerate(statements, start=1):
+            nodes = list(plan_nodes(await explain(statement, parameters)))
+            indexes = sorted(
+                {node["Index Name"] for node in nodes if node["Node Type"] in INDEX_NODES}
+            )
+            seq_scans = sorted(
+                {
+                    node["Relation Name"]
+                    for node in nodes
+                    if node["Node Type"] == "Seq Scan"
+                    and node.get("Relation Name") in WATCHED_TABLES
+                    and sizes.get(node["Relation Name"], 0) >= min_rows
+                }
+            )
+            print(f"{name} #{i}: индексы {', '.join(indexes) or '-'}")
+            for table in seq_scans:
+                violations.append(f"{name} #{i}: Seq Scan по {table}")
+                logger.warning(f"{name} #{i}: Seq Scan по {table}:\n{statement}")
+    return violations
+
+
+async def run(config: SeedConfig, min_rows: int) -> list[str]:
+    await db_init()
+    try:
+        return await check(config, min_rows)
+    finally:
+        await engine.dispose()
+
+
+def main(argv: list[str] = None) -> int:
+    """Проверка планов запросов отчёта и поиска на большом наборе данных.
+
+    Helper'ы из app.db.requests выполняются на временном синтетическом заводе, каждое их
+    выражение повторяется под `EXPLAIN (FORMAT JSON)`. Последовательное чтение таблиц
+    timesheet, worker_position и correction больше `--min-rows` строк - ошибка. Запуск:
+    `python -m app.bench.explain --allow-write --months 6`.
+
+    Returns:
+        int: Код завершения: 1 - есть последовательные чтения больших таблиц.
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m app.bench.explain", description="Проверка планов запросов"
+    )
+    add_seed_arguments(parser)
+    parser.set_defaults(factories=5, workers=200, masters=4, months=6, corrections=0.1)
+    parser.add_argument("--min-rows", type=int, default=10000, help="Порог строк для Seq Scan")
+    args = vars(parser.parse_args(argv))
+    check_allow_write(parser, args)
+    min_rows = args.pop("min_rows")
+
+    violations = asyncio.run(run(SeedConfig(**args), min_rows))
+    for violation in violations:
+        print(violation, file=sys.stderr)
+    return 1 if violations else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,471 @@
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import Update
+from aiohttp import web
+from sqlalchemy import delete, select, update
+
+from app.__main__ import create_dispatcher
+from app.bench.seed import SeedConfig, check_allow_write, seeded
+from app.config import labels
+from app.config.fsm import FSM_STORAGE, FSM_TTL_HOURS
+from app.config.roles import Role
+from app.db import requests
+from app.db.models import FSMRecord, MasterFactory, User, async_session, db_init, engine
+from app.db.stats import setup_db_stats, stats
+from app.db.storage import PostgresStorage
+from app.utils import setup_logger
+
+logger = setup_logger(__name__)
+
+TOKEN = "123456:LOAD-TEST"
+# tg_id мастеров: смещение к внутреннему id, чтобы не пересечься с реальными
+TG_ID_OFFSET = 10**9
+# Методы Bot API, которые возвращают сообщение
+MESSAGE_METHODS = {"sendMessage", "editMessageText", "editMessageReplyMarkup", "sendPhoto"}
+
+
+class FakeBotAPI:
+    """Локальный сервер Bot API.
+
+    Отвечает на запросы бота правдоподобными объектами и запоминает inline кнопки
+    сообщений в каждом чате, чтобы симулированный мастер мог их нажимать.
+    """
+
+    def __init__(self):
+        self.calls: Counter[str] = Counter()
+        self.buttons: dict[int, dict[int, list[str]]] = defaultdict(dict)
+        self._message_ids = itertools.count(1)
+        self._runner: web.AppRunner = None
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", 0).start()
+        host, port = self._runner.addresses[0][:2]
+        return f"http://{host}:{port}"
+
+    async def close(self):
+        await self._runner.cleanup()
+
+    def last_buttons(self, chat_id: int) -> tuple[int, list[str]]:
+        """Последнее сообщение чата с inline кнопками.
+
+        Args:
+            chat_id (int): id чата.
+
+        Returns:
+            tuple[int, list[str]]: id сообщения и callback_data его кнопок.
+        """
+        messages = self.buttons[chat_id]
+        if not messages:
+            return None, []
+        message_id = max(messages)
+        return message_id, messages[message_id]
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        data = await request.post()
+        result = True
+        if method in MESSAGE_METHODS:
+            result = self._message(method, data)
+        elif method == "getFile":
+            result = {
+                "file_id": data["file_id"],
+                "file_unique_id": data["file_id"],
+                "file_path": f"photos/{data['file_id']}.jpg",
+            }
+        return web.json_response({"ok": True, "result": result})
+
+    def _message(self, method: str, data) -> dict:
+        chat_id = int(data["chat_id"])
+        if method.startswith("send"):
+            message_id = next(self._message_ids)
+        else:
+            message_id = int(data["message_id"])
+
+        # Telegram убирает клавиатуру при редактировании сообщения без reply_markup
+        markup = json.loads(data.get("reply_markup") or "null") or {}
+        callbacks = [
+            button["callback_data"]
+            for row in markup.get("inline_keyboard", [])
+            for button in row
+            if "callback_data" in button
+        ]
+        if callbacks:
+            self.buttons[chat_id][message_id] = callbacks
+        else:
+            self.buttons[chat_id].pop(message_id, None)
+
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": int(TOKEN.split(":")[0]), "is_bot": True, "first_name": "Bot"},
+            "text": data.get("text", ""),
+        }
+
+
+class Master:
+    """Мастер, проходящий отчёт о смене через кнопки бота.
+
+    Args:
+        tg_id (int): tg_id мастера.
+        load (LoadTest): Общий прогон.
+    """
+
+    def __init__(self, tg_id: int, load: "LoadTest"):
+        self.tg_id = tg_id
+        self.load = load
+        self.rnd = random.Random(tg_id)
+
+    async def shift(self):
+        """Отчёт о смене: код мастера, рабочие с листанием списка, альбом, запись."""
+        args = self.load.args
+        await self.text("start", labels.SHIFT_REPORET)
+        if self.has("shift_not_set_up"):
+            await self.click("new_shift", "shift_not_set_up")
+        await self.click("master_activity", self.pick("master_shift_activity_"))
+        await self.click("confirm_master_activity", "confirm_master_shift_activity_1")
+
+        chosen = set()
+        for _ in range(args.crew):
+            for _ in range(self.rnd.randint(0, args.pages)):
+                forward = self.forward()
+                if forward is None:
+                    break
+                await self.click("worker_page", forward)
+            worker = self.pick(f"shift_choose_worker_{Role.WORKER}_", exclude=chosen)
+            if worker is None:
+                break
+            chosen.add(worker.split("_")[-3])
+            await self.click("worker", worker)
+            await self.click("worker_activity", self.pick("shift_choose_activity_activity_"))
+
+        await self.click("save_choise", self.pick("save_shift_choise_"))
+        await self.click("write_shift", "write_shift")
+        await self.album("album", args.photos)
+        await self.click("save_photo", "save_shift_photo")
+        await self.click("confirm_write", "confirm_write_shift")
+
+    def has(self, data: str) -> bool:
+        return data in self.load.api.last_buttons(self.tg_id)[1]
+
+    def pick(self, prefix: str, exclude: set = ()) -> str:
+        buttons = [
+            data
+            for data in self.load.api.last_buttons(self.tg_id)[1]
+            if data.startswith(prefix) and data.split("_")[-3] not in exclude
+        ]
+        return self.rnd.choice(buttons) if buttons else None
+
+    def forward(self) -> str:
+        # Номер страницы - предпоследнее поле и у рабочего, и у кнопок листания
+        buttons = self.load.api.last_buttons(self.tg_id)[1]
+        page = max(
+            int(data.split("_")[-2])
+            for data in buttons
+            if data.startswith(f"shift_choose_worker_{Role.WORKER}_")
+        )
+        return next(
+            (
+                data
+                for data in buttons
+                if data.startswith("shift_choose_worker_page_") and int(data.split("_")[-2]) > page
+            ),
+            None,
+        )
+
+    async def text(self, step: str, text: str):
+        await self.load.feed(step, [self._message(text=text)])
+
+    async def album(self, step: str, count: int):
+        group_id = f"{self.tg_id}{next(self.load.update_ids)}"
+        photos = [
+            self._message(
+                media_group_id=group_id,
+                photo=[{"file_id": f"p{i}", "file_unique_id": f"p{i}", "width": 1, "height": 1}],
+            )
+            for i in range(count)
+        ]
+        await self.load.feed(step, photos)
+
+    async def click(self, step: str, data: str):
+        if data is None:
+            raise RuntimeError(f"Нет кнопки для шага {step}")
+        await asyncio.sleep(self.load.args.think)
+        message_id, _ = self.load.api.last_buttons(self.tg_id)
+        callback = {
+            "id": str(next(self.load.update_ids)),
+            "from": self._user(),
+            "chat_instance": str(self.tg_id),
+            "data": data,
+            "message": {
+                "message_id": message_id or 1,
+                "date": int(time.time()),
+                "chat": {"id": self.tg_id, "type": "private"},
+                "text": "",
+            },
+        }
+        await self.load.feed(step, [{"callback_query": callback}])
+
+    def _user(self) -> dict:
+        return {"id": self.tg_id, "is_bot": False, "first_name": f"Master {self.tg_id}"}
+
+    def _message(self, **fields) -> dict:
+        return {
+            "message": {
+                "message_id": next(self.load.update_ids),
+                "date": int(time.time()),
+                "chat": {"id": self.tg_id, "type": "private"},
+                "from": self._user(),
+                **fields,
+            }
+        }
+
+
+class LoadTest:
+    """Прогон: одновременные мастера на одном диспетчере.
+
+    Args:
+        dp (Dispatcher): Диспетчер бота.
+        bot (Bot): Бот, подключённый к FakeBotAPI.
+        api (FakeBotAPI): Сервер Bot API.
+        args (argparse.Namespace): Параметры прогона.
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, api: FakeBotAPI, args: argparse.Namespace):
+        self.dp = dp
+        self.bot = bot
+        self.api = api
+        self.args = args
+        self.update_ids = itertools.count(1)
+        self.latency: dict[str, list[float]] = defaultdict(list)
+        self.updates = 0
+        self.errors: Counter[str] = Counter()
+
+    async def feed(self, step: str, updates: list[dict]):
+        """Передача обновлений диспетчеру с замером времени обработки.
+
+        Несколько обновлений (альбом) передаются одновременно и замеряются как одно.
+        """
+        updates = [
+            Update.model_validate(
+                {"update_id": next(self.update_ids), **update}, context={"bot": self.bot}
+            )
+            for update in updates
+        ]
+        start = time.perf_counter()
+        await asyncio.gather(*(self.dp.feed_update(self.bot, update) for update in updates))
+        self.latency[step].append(time.perf_counter() - start)
+        self.updates += len(updates)
+
+    async def run_master(self, master: Master) -> int:
+        shifts = 0
+        for _ in range(self.args.rounds):
+            try:
+                await master.shift()
+                shifts += 1
+            except Exception as ex:
+                logger.error(f"Мастер (tg_id={master.tg_id}) не закончил смену:\n{ex}")
+                self.errors[type(ex).__name__] += 1
+        return shifts
+
+    async def run(self, tg_ids: list[int]) -> dict:
+        """Прогон мастеров `tg_ids` одновременно.
+
+        Returns:
+            dict: Метрики прогона.
+        """
+        stats.reset()
+        start = time.perf_counter()
+        shifts = await asyncio.gather(*(self.run_master(Master(tg_id, self)) for tg_id in tg_ids))
+        seconds = time.perf_counter() - start
+        latency = [value for values in self.latency.values() for value in values]
+        return {
+            "masters": len(tg_ids),
+            "shifts": sum(shifts),
+            "errors": sum(self.errors.values()),
+            "updates": self.updates,
+            "updates_per_sec": self.updates / seconds,
+            "p50_ms": percentile(latency, 50) * 1000,
+            "p95_ms": percentile(latency, 95) * 1000,
+            "p99_ms": percentile(latency, 99) * 1000,
+            "queries_per_update": stats.total / max(self.updates, 1),
+            "steps": {
+                step: (len(values), percentile(values, 50) * 1000, percentile(values, 95) * 1000)
+                for step, values in self.latency.items()
+            },
+        }
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q / 100))]
+
+
+def seed_config(args: argparse.Namespace) -> SeedConfig:
+    today = datetime.now()
+    return SeedConfig(
+        workers=args.workers,
+        masters=max(args.masters),
+        activities=args.activities,
+        corrections=0,
+        year=today.year,
+        month=today.month,
+        seed=args.seed,
+    )
+
+
+async def prepare_masters(factory_id: int) -> list[int]:
+    """Выдача tg_id мастерам синтетического завода.
+
+    Returns:
+        list[int]: tg_id мастеров.
+    """
+    async with async_session() as session:
+        master_ids = (
+            await session.scalars(
+                select(MasterFactory.user_id)
+                .where(MasterFactory.factory_id == factory_id)
+                .order_by(MasterFactory.user_id)
+            )
+        ).all()
+        await session.execute(
+            update(User).where(User.id.in_(master_ids)).values(tg_id=User.id + TG_ID_OFFSET)
+        )
+        await session.commit()
+    return [master_id + TG_ID_OFFSET for master_id in master_ids]
+
+
+def create_storage(name: str) -> BaseStorage:
+    """Хранилище FSM как в боте: "postgres" или "memory" (см. FSM_STORAGE)."""
+    if name == "memory":
+        return MemoryStorage()
+    return PostgresStorage(async_session, ttl=timedelta(hours=FSM_TTL_HOURS))
+
+
+async def cleanup_fsm(bot_id: int):
+    # Ключи FSM начинаются с id бота: состояния настоящего бота не затрагиваются
+    async with async_session() as session:
+        await session.execute(delete(FSMRecord).where(FSMRecord.key.startswith(f"fsm:{bot_id}:")))
+        await session.commit()
+
+
+def stub_disk(delay: float):
+    """Замена загрузки фото табеля на Яндекс Диск задержкой `delay` секунд."""
+
+    async def upload_photos(photo_paths: list[str], factory, username: str, current) -> str:
+        await asyncio.sleep(delay)
+        return f"https://disk.example/load/{factory.id}/{current:%Y%m%d%H%M%S%f}"
+
+    requests.upload_photos = upload_photos
+
+
+def print_results(results: list[dict]):
+    print(
+        f"{'мастеров':>8} {'смен':>6} {'ошибок':>6} {'upd/s':>8} {'p50 мс':>8} {'p95 мс':>8} \
+{'p99 мс':>8} {'запр/upd':>8}"
+    )
+    for result in results:
+        print(
+            f"{result['masters']:>8} {result['shifts']:>6} {result['errors']:>6} \
+{result['updates_per_sec']:>8.1f} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} \
+{result['p99_ms']:>8.1f} {result['queries_per_update']:>8.2f}"
+        )
+    print(f"\n{'шаг':>24} {'кол-во':>7} {'p50 мс':>8} {'p95 мс':>8}")
+    for step, (count, p50, p95) in results[-1]["steps"].items():
+        print(f"{step:>24} {count:>7} {p50:>8.1f} {p95:>8.1f}")
+
+
+async def run(args: argparse.Namespace) -> list[dict]:
+    stub_disk(args.disk_delay)
+    setup_db_stats(engine)
+    await db_init()
+    api = FakeBotAPI()
+    url = await api.start()
+    bot = Bot(
+        token=TOKEN,
+        session=AiohttpSession(api=TelegramAPIServer.from_base(url)),
+        default=DefaultBotProperties(parse_mode="html"),
+    )
+    dp = create_dispatcher(create_storage(args.storage))
+    results = []
+    try:
+        async with seeded(seed_config(args)) as data:
+            tg_ids = await prepare_masters(data.factory_ids[0])
+            for masters in args.masters:
+                logger.info(f"Нагрузка: {masters} мастеров")
+                results.append(await LoadTest(dp, bot, api, args).run(tg_ids[:masters]))
+    finally:
+        await dp.storage.close()
+        if args.storage == "postgres":
+            await cleanup_fsm(bot.id)
+        await bot.session.close()
+        await api.close()
+        await engine.dispose()
+    return results
+
+
+def main(argv: list[str] = None) -> int:
+    """Нагрузочный прогон бота с одновременными мастерами.
+
+    Диспетчер и роутеры из app.__main__ получают обновления напрямую через
+    `feed_update`, ответы бота принимает локальный FakeBotAPI, загрузка фото на
+    Яндекс Диск заменена задержкой `--disk-delay`. FSM по умолчанию хранится так же,
+    как в боте (FSM_STORAGE), `--storage` выбирает хранилище явно. Мастера создаются
+    на временном синтетическом заводе (см. app.bench.seed). Запуск:
+    `python -m app.bench.load --allow-write --masters 10 50 100`.
+
+    Returns:
+        int: Код завершения: 1 - есть незаконченные смены.
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m app.bench.load", description="Нагрузочный прогон отчёта о смене"
+    )
+    parser.add_argument(
+        "--masters", type=int, nargs="+", default=[10, 50], help="Одновременных мастеров"
+    )
+    parser.add_argument("--workers", type=int, default=300, help="Рабочих на заводе")
+    parser.add_argument("--activities", type=int, default=20)
+    parser.add_argument("--crew", type=int, default=10, help="Рабочих в смене")
+    parser.add_argument("--pages", type=int, default=3, help="Перелистываний списка рабочих")
+    parser.add_argument("--photos", type=int, default=3, help="Фото в альбоме")
+    parser.add_argument("--rounds", type=int, default=1, help="Смен на мастера")
+    parser.add_argument("--think", type=float, default=0, help="Пауза перед нажатием, сек")
+    parser.add_argument("--disk-delay", type=float, default=0, help="Загрузка фото, сек")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--storage", choices=("memory", "postgres"), default=FSM_STORAGE, help="Хранилище FSM"
+    )
+    parser.add_argument(
+        "--allow-write", action="store_true", help="Разрешить запись в БД из POSTGRES_*"
+    )
+    args = parser.parse_args(argv)
+    check_allow_write(parser, vars(args))
+
+    results = asyncio.run(run(args))
+    print_results(results)
+    return 1 if any(result["errors"] for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
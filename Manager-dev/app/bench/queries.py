@@ -0,0 +1,175 @@
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import CallbackQuery
+from sqlalchemy import desc, select
+
+from app import keyboards as kb
+from app.bench.load import TOKEN, FakeBotAPI
+from app.bench.seed import SeedConfig, add_seed_arguments, check_allow_write, seeded
+from app.db import requests
+from app.db.models import Timesheet, async_session, db_init, engine
+from app.db.stats import setup_db_stats, stats
+from app.roles.master import save_shift_choise, view_shift
+from app.utils import setup_logger, uploader
+from app.utils.genexcel import GeneratorExcel
+
+logger = setup_logger(__name__)
+
+# Предел запросов на вызов. Не зависит от количества рабочих, смен и позиций:
+# запрос в цикле по ним превысит предел уже на небольших данных
+BUDGETS = {
+    "get_workers_by_shift": 1,
+    "view_shift": 2,
+    "save_shift_choise": 2,
+    "report": 9,
+}
+
+
+class Cases:
+    """Горячие пути бота на синтетическом заводе.
+
+    Args:
+        bot (Bot): Бот, подключённый к FakeBotAPI.
+        timesheet (Timesheet): Последняя смена завода.
+        year (int): Год отчёта.
+        month (int): Месяц отчёта.
+    """
+
+    def __init__(self, bot: Bot, timesheet: Timesheet, year: int, month: int):
+        self.bot = bot
+        self.timesheet = timesheet
+        self.year = year
+        self.month = month
+
+    async def get_workers_by_shift(self):
+        await kb.get_workers_by_shift(str(self.timesheet.id))
+
+    async def view_shift(self):
+        callback, state = await self._callback("view_shift")
+        await view_shift(callback, state)
+
+    async def save_shift_choise(self):
+        callback, state = await self._callback("save_shift_choise_1")
+        positions = await requests.get_positions_by_shift_id(self.timesheet.id)
+        await state.update_data(
+            workers_activities_list=[
+                [str(position.user_id), str(position.activity_id)] for position, _, _ in positions
+            ]
+        )
+        stats.reset()
+        await save_shift_choise(callback, state)
+
+    async def report(self):
+        with tempfile.TemporaryDirectory() as directory:
+            excel = GeneratorExcel(self.timesheet.factory_id, self.year, self.month, directory)
+            await excel.generate()
+            await excel.free()
+
+    async def _callback(self, data: str) -> tuple[CallbackQuery, FSMContext]:
+        user = {"id": self.timesheet.user_id, "is_bot": False, "first_name": "Master"}
+        chat = {"id": self.timesheet.user_id, "type": "private"}
+        callback = CallbackQuery.model_validate(
+            {
+                "id": "1",
+                "from": user,
+                "chat_instance": "1",
+                "data": data,
+                "message": {"message_id": 1, "date": int(time.time()), "chat": chat},
+            },
+            context={"bot": self.bot},
+        )
+        state = FSMContext(
+            MemoryStorage(), StorageKey(self.bot.id, chat["id"], self.timesheet.user_id)
+        )
+        await state.update_data(
+            master_id=self.timesheet.user_id, factory_id=self.timesheet.factory_id
+        )
+        return callback, state
+
+
+async def measure(cases: Cases) -> dict[str, int]:
+    """Количество запросов каждого горячего пути из BUDGETS.
+
+    Подготовка данных случая может сбросить счётчик сама, чтобы не попасть в замер.
+
+    Returns:
+        dict[str, int]: {путь: запросов}.
+    """
+    results = {}
+    for name in BUDGETS:
+        stats.reset()
+        await getattr(cases, name)()
+        results[name] = stats.total
+        for callsite, stat in stats.top_callsites():
+            logger.info(f"{name}: {callsite} - {stat.count} запросов")
+    return results
+
+
+async def run(config: SeedConfig) -> dict[str, int]:
+    # Ссылка на Яндекс Диск в листе отчёта: результат не должен зависеть от сети
+    # и TOKEN_YADISK
+    uploader.disk_link_hash = "https://disk.example/bench"
+    setup_db_stats(engine)
+    await db_init()
+    api = FakeBotAPI()
+    bot = Bot(
+        token=TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(await api.start()))
+    )
+    try:
+        async with seeded(config) as data:
+            async with async_session() as session:
+                timesheet = await session.scalar(
+                    select(Timesheet)
+                    .where(Timesheet.factory_id == data.factory_ids[0])
+                    .order_by(desc(Timesheet.datetime))
+                    .limit(1)
+                )
+            return await measure(Cases(bot, timesheet, config.year, config.month))
+    finally:
+        await bot.session.close()
+        await api.close()
+        await engine.dispose()
+
+
+def main(argv: list[str] = None) -> int:
+    """Проверка количества SQL запросов горячих путей бота.
+
+    На временном синтетическом заводе (см. app.bench.seed) запросы каждого пути из BUDGETS
+    считаются через события движка. Путь, выполнивший больше запросов, чем ему
+    отведено, - регрессия (обычно запрос в цикле по рабочим). Запуск:
+    `python -m app.bench.queries --allow-write --workers 300`.
+
+    Returns:
+        int: Код завершения: 1 - есть превышения бюджета.
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m app.bench.queries", description="Бюджеты SQL запросов горячих путей"
+    )
+    add_seed_arguments(parser)
+    args = vars(parser.parse_args(argv))
+    check_allow_write(parser, args)
+
+    results = asyncio.run(run(SeedConfig(**args)))
+    exceeded = 0
+    print(f"{'путь':>22} {'запросов':>9} {'бюджет':>7}")
+    for name, queries in results.items():
+        mark = ""
+        if queries > BUDGETS[name]:
+            exceeded += 1
+            mark = " превышен"
+        print(f"{name:>22} {queries:>9} {BUDGETS[name]:>7}{mark}")
+    return 1 if exceeded else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
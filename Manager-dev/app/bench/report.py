@@ -0,0 +1,170 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from app.bench.seed import SeedConfig, add_seed_arguments, check_allow_write, seeded
+from app.db.models import db_init, engine
+from app.db.stats import setup_db_stats, stats
+from app.utils import setup_logger, uploader
+from app.utils.genexcel import GeneratorExcel
+
+logger = setup_logger(__name__)
+
+# Метрики результата и допустимый рост относительно базового запуска
+METRICS = ("seconds", "queries", "peak_mb")
+
+
+async def measure(factory_id: int, year: int, month: int, repeat: int) -> dict:
+    """Замер генерации отчёта завода.
+
+    Время - лучшее из `repeat` запусков без трассировки памяти. Количество запросов и
+    пик памяти Python - отдельным запуском под tracemalloc.
+
+    Args:
+        factory_id (int): id завода.
+        year (int): Год.
+        month (int): Месяц.
+        repeat (int): Количество запусков для замера времени.
+
+    Returns:
+        dict: seconds, queries, peak_mb.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        seconds = []
+        for _ in range(repeat):
+            excel = GeneratorExcel(factory_id, year, month, directory)
+            start = time.perf_counter()
+            await excel.generate()
+            seconds.append(time.perf_counter() - start)
+            await excel.free()
+
+        excel = GeneratorExcel(factory_id, year, month, directory)
+        stats.reset()
+        tracemalloc.start()
+        try:
+            await excel.generate()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        queries = stats.total
+        await excel.free()
+    return {"seconds": min(seconds), "queries": queries, "peak_mb": peak / 2**20}
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Сравнение с базовым запуском.
+
+    Время и память могут вырасти не больше чем на `tolerance`, количество запросов
+    не должно расти вовсе.
+
+    Args:
+        results (dict): {масштаб: метрики}.
+        baseline (dict): Базовый запуск того же вида.
+        tolerance (float): Допустимый относительный рост времени и памяти.
+
+    Returns:
+        list[str]: Описания регрессий.
+    """
+    regressions = []
+    for scale, metrics in results.items():
+        base = baseline.get(scale)
+        if base is None:
+            continue
+        for name in METRICS:
+            limit = base[name] if name == "queries" else base[name] * (1 + tolerance)
+            if metrics[name] > limit:
+                regressions.append(f"{scale}: {name} {base[name]:.2f} -> {metrics[name]:.2f}")
+    return regressions
+
+
+def print_results(results: dict, baseline: dict):
+    print(f"{'рабочих':>8} {'сек':>9} {'запросов':>9} {'МБ':>9}")
+    for scale, metrics in results.items():
+        base = baseline.get(scale, {})
+        cells = []
+        for name in METRICS:
+            cell = f"{metrics[name]:.2f}"
+            if base.get(name):
+                cell += f" ({(metrics[name] / base[name] - 1) * 100:+.0f}%)"
+            cells.append(cell)
+        print(f"{scale:>8} " + " ".join(f"{cell:>9}" for cell in cells))
+
+
+async def run(args: argparse.Namespace) -> dict:
+    # Ссылка на Яндекс Диск в листе отчёта: без заглушки каждый замер ходил бы в сеть
+    uploader.disk_link_hash = "https://disk.example/bench"
+    setup_db_stats(engine)
+    await db_init()
+    results = {}
+    try:
+        for scale in args.scales:
+            config = SeedConfig(
+                workers=scale,
+                masters=args.masters,
+                activities=args.activities,
+                months=args.months,
+                shifts=args.shifts,
+                corrections=args.corrections,
+                year=args.year,
+                month=args.month,
+                seed=args.seed,
+            )
+            async with seeded(config) as data:
+                factory_id = data.factory_ids[0]
+                logger.info(f"Замер отчёта (factory_id={factory_id}, workers={scale})")
+                results[str(scale)] = await measure(factory_id, args.year, args.month, args.repeat)
+    finally:
+        await engine.dispose()
+    return results
+
+
+def main(argv: list[str] = None) -> int:
+    """Замер генерации отчёта на синтетических данных нескольких масштабов.
+
+    Для каждого масштаба создаётся отдельный завод (см. app.bench.seed), после замера
+    он удаляется. Результат сравнивается с базовым запуском из `--baseline`, `--save`
+    сохраняет его как новый базовый. Запуск:
+    `python -m app.bench.report --allow-write --scales 50 300 1000`.
+
+    Returns:
+        int: Код завершения: 1 - есть регрессии относительно базового запуска.
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m app.bench.report", description="Бенчмарк генерации отчёта"
+    )
+    add_seed_arguments(parser, sizes=False)
+    parser.add_argument(
+        "--scales", type=int, nargs="+", default=[50, 300, 1000], help="Рабочих на завод"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Запусков для замера времени")
+    parser.add_argument("--baseline", default="bench_baseline.json", help="Базовый запуск")
+    parser.add_argument("--save", action="store_true", help="Сохранить как базовый")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2, help="Допустимый рост времени и памяти"
+    )
+    args = parser.parse_args(argv)
+    check_allow_write(parser, vars(args))
+
+    results = asyncio.run(run(args))
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+    print_results(results, baseline)
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"Регрессия: {regression}", file=sys.stderr)
+    if args.save:
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+        print(f"Базовый запуск сохранён в {args.baseline}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
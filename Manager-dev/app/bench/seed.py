@@ -0,0 +1,349 @@
+import argparse
+import asyncio
+import os
+import random
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import AsyncIterator
+
+from sqlalchemy import Date, cast, delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config.roles import Role
+from app.db.models import (
+    Activity,
+    Correction,
+    Factory,
+    MasterFactory,
+    MonthClose,
+    PayrollPosition,
+    PayrollWorker,
+    ReportCache,
+    Timesheet,
+    User,
+    WorkerDailyHours,
+    WorkerPosition,
+    WorkerPositionActual,
+    WorkerProfile,
+    async_session,
+    db_init,
+    engine,
+)
+from app.utils import setup_logger
+from app.utils.month import month_bounds
+
+logger = setup_logger(__name__)
+
+# Строк в одном INSERT: asyncpg принимает не больше 32767 параметров в запросе
+CHUNK_ROWS = 4000
+
+
+@dataclass
+class SeedConfig:
+    """Размеры синтетических данных.
+
+    Args:
+        factories (int): Количество заводов.
+        workers (int): Рабочих на завод.
+        masters (int): Мастеров на завод. Рабочие делятся между мастерами поровну.
+        activities (int): Количество кодов.
+        months (int): Сколько месяцев табелей, по `year`/`month` включительно.
+        shifts (int): Смен в день.
+        corrections (float): Доля исправленных позиций.
+        year (int): Год последнего месяца.
+        month (int): Последний месяц.
+        seed (int): Зерно генератора случайных чисел.
+    """
+
+    factories: int = 1
+    workers: int = 100
+    masters: int = 3
+    activities: int = 10
+    months: int = 1
+    shifts: int = 1
+    corrections: float = 0.01
+    year: int = date.today().year
+    month: int = date.today().month
+    seed: int = 1
+
+    def month_list(self) -> list[tuple[int, int]]:
+        index = self.year * 12 + self.month - 1
+        return [((index - i) // 12, (index - i) % 12 + 1) for i in reversed(range(self.months))]
+
+
+@dataclass
+class SeedData:
+    """id строк, созданных `seed`.
+
+    Args:
+        factory_ids (list[int]): Заводы.
+        user_ids (list[int]): Пользователи.
+        activity_ids (list[int]): Коды.
+    """
+
+    factory_ids: list[int] = field(default_factory=list)
+    user_ids: list[int] = field(default_factory=list)
+    activity_ids: list[int] = field(default_factory=list)
+
+
+async def _insert(session: AsyncSession, model, rows: list[dict], returning=None) -> list:
+    """Вставка строк пачками. Возвращает значения `returning` в порядке строк."""
+    result = []
+    for start in range(0, len(rows), CHUNK_ROWS):
+        stmt = insert(model).values(rows[start : start + CHUNK_ROWS])
+        if returning is None:
+            await session.execute(stmt)
+        else:
+            result.extend(await session.scalars(stmt.returning(returning)))
+    return result
+
+
+async def _add_users(session: AsyncSession, prefix: str, role: Role, count: int) -> list[int]:
+    return await _insert(
+        session,
+        User,
+        [{"fullname": f"{prefix} {i:05d}", "role": role} for i in range(count)],
+        User.id,
+    )
+
+
+async def seed(config: SeedConfig) -> SeedData:
+    """Заполнение БД синтетическими данными.
+
+    Каждый запуск создаёт новые заводы, пользователей и коды, существующие данные не
+    меняются. Удалить созданное - `cleanup`.
+
+    Args:
+        config (SeedConfig): Размеры данных.
+
+    Returns:
+        SeedData: id созданных строк.
+    """
+    rnd = random.Random(config.seed)
+    tag = datetime.now().strftime("%y%m%d%H%M%S")
+    months = config.month_list()
+    logger.info(f"Генерация данных {config} (tag={tag})")
+
+    async with async_session() as session:
+        activity_ids = await _insert(
+            session,
+            Activity,
+            [
+                {
+                    "code": f"B{i}"[:5],
+                    "duration": rnd.choice((4, 8, 10, 11, 12)),
+                    "description": f"Синтетический код {i}",
+                    "color": f"{rnd.randrange(0x1000000):06x}",
+                }
+                for i in range(config.activities)
+            ],
+            Activity.id,
+        )
+        admin_id = (await _add_users(session, "Админ", Role.ADMIN, 1))[0]
+        data = SeedData(activity_ids=activity_ids, user_ids=[admin_id])
+
+        for f in range(config.factories):
+            factory_id = await session.scalar(
+                insert(Factory)
+                .values(company_name=f"Bench {tag}", factory_name=f"Завод {f + 1}")
+                .returning(Factory.id)
+            )
+            data.factory_ids.append(factory_id)
+            master_ids = await _add_users(session, f"Мастер {f + 1}", Role.MASTER, config.masters)
+            worker_ids = await _add_users(session, f"Рабочий {f + 1}", Role.WORKER, config.workers)
+            data.user_ids += master_ids + worker_ids
+            await _insert(
+                session,
+                MasterFactory,
+                [{"user_id": user_id, "factory_id": factory_id} for user_id in master_ids],
+            )
+            await _insert(
+                session,
+                WorkerProfile,
+                [
+                    {
+                        "user_id": user_id,
+                        "year": year,
+                        "month": month,
+                        "job": "мастер" if user_id in master_ids else "рабочий",
+                        "rate": rnd.choice((1, 1.25, 1.5, 2)),
+                    }
+                    for user_id in master_ids + worker_ids
+                    for year, month in months
+                ],
+            )
+            # Бригада мастера - каждый masters-й рабочий
+            crews = {
+                master_id: worker_ids[i :: len(master_ids)]
+                for i, master_id in enumerate(master_ids)
+            }
+
+            for year, month in months:
+                start, end = month_bounds(year, month)
+                timesheets = [
+                    {
+                        "user_id": master_id,
+                        "factory_id": factory_id,
+                        "datetime": start
+                        + timedelta(days=day, hours=8 + shift * 24 // config.shifts),
+                        "link": f"https://disk.example/{tag}/{factory_id}/{day}/{shift}",
+                    }
+                    for day in range((end - start).days)
+                    for shift in range(config.shifts)
+                    for master_id in master_ids
+                ]
+                timesheet_ids = await _insert(session, Timesheet, timesheets, Timesheet.id)
+                positions = [
+                    {
+                        "timesheet_id": timesheet_id,
+                        "user_id": worker_id,
+                        "activity_id": rnd.choice(activity_ids),
+                    }
+                    for timesheet_id, timesheet in zip(timesheet_ids, timesheets)
+                    for worker_id in crews[timesheet["user_id"]]
+                ]
+                position_ids = await _insert(session, WorkerPosition, positions, WorkerPosition.id)
+                corrected = rnd.sample(position_ids, int(len(position_ids) * config.corrections))
+                await _insert(
+                    session,
+                    Correction,
+                    [
+                        {
+                            "worker_position_id": position_id,
+                            "user_id": admin_id,
+                            "new_activity_id": rnd.choice(activity_ids),
+                            "reason": "Синтетическая правка",
+                        }
+                        for position_id in corrected
+                    ],
+                )
+                logger.info(
+                    f"Завод (id={factory_id}) за ({year}-{month}): табелей {len(timesheets)}, \
+позиций {len(positions)}, правок {len(corrected)}"
+                )
+
+        # Агрегат часов по дням для новых заводов, как при добавлении смен
+        day = cast(Timesheet.datetime, Date)
+        await session.execute(
+            insert(WorkerDailyHours).from_select(
+                ["factory_id", "user_id", "date", "hours", "shifts"],
+                select(
+                    Timesheet.factory_id,
+                    WorkerPositionActual.user_id,
+                    day,
+                    func.sum(Activity.duration),
+                    func.count(),
+                )
+                .join(Timesheet, Timesheet.id == WorkerPositionActual.timesheet_id)
+                .join(Activity, Activity.id == WorkerPositionActual.activity_id)
+                .where(Timesheet.factory_id.in_(data.factory_ids))
+                .group_by(Timesheet.factory_id, WorkerPositionActual.user_id, day),
+            )
+        )
+        await session.commit()
+    return data
+
+
+async def cleanup(data: SeedData):
+    """Удаление строк, созданных `seed`, и всего, что появилось на их заводах после.
+
+    Args:
+        data (SeedData): Результат `seed`.
+    """
+    logger.info(f"Удаление синтетических данных (factory_ids={data.factory_ids})")
+    timesheets = select(Timesheet.id).where(Timesheet.factory_id.in_(data.factory_ids))
+    positions = select(WorkerPosition.id).where(WorkerPosition.timesheet_id.in_(timesheets))
+    async with async_session() as session:
+        for model in (PayrollPosition, PayrollWorker, ReportCache, MonthClose, WorkerDailyHours):
+            await session.execute(delete(model).where(model.factory_id.in_(data.factory_ids)))
+        await session.execute(
+            delete(Correction).where(Correction.worker_position_id.in_(positions))
+        )
+        await session.execute(delete(WorkerPosition).where(WorkerPosition.id.in_(positions)))
+        await session.execute(delete(Timesheet).where(Timesheet.id.in_(timesheets)))
+        await session.execute(
+            delete(MasterFactory).where(MasterFactory.factory_id.in_(data.factory_ids))
+        )
+        await session.execute(delete(Factory).where(Factory.id.in_(data.factory_ids)))
+        await session.execute(
+            delete(WorkerProfile).where(WorkerProfile.user_id.in_(data.user_ids))
+        )
+        await session.execute(delete(User).where(User.id.in_(data.user_ids)))
+        await session.execute(delete(Activity).where(Activity.id.in_(data.activity_ids)))
+        await session.commit()
+
+
+@asynccontextmanager
+async def seeded(config: SeedConfig) -> AsyncIterator[SeedData]:
+    """Синтетические данные на время блока: `seed` на входе, `cleanup` на выходе."""
+    data = await seed(config)
+    try:
+        yield data
+    finally:
+        await cleanup(data)
+
+
+def check_allow_write(parser: argparse.ArgumentParser, args: dict):
+    """Отказ запуска без явного разрешения писать в БД.
+
+    Синтетические данные пишутся в БД из POSTGRES_*, то есть, возможно, в рабочую.
+    Разрешение - флаг `--allow-write` (см. add_seed_arguments) или `BENCH_ALLOW_WRITE=1`.
+    Флаг убирается из `args`.
+
+    Args:
+        parser (argparse.ArgumentParser): Парсер, через который сообщается об ошибке.
+        args (dict): Разобранные аргументы.
+    """
+    allowed = args.pop("allow_write") or os.getenv("BENCH_ALLOW_WRITE") == "1"
+    if not allowed:
+        parser.error(
+            f"синтетические данные будут записаны в БД {os.getenv('POSTGRES_DB')} на \
+{os.getenv('POSTGRES_HOST')}:{os.getenv('POSTGRES_PORT')}; используйте отдельную БД и \
+--allow-write или BENCH_ALLOW_WRITE=1"
+        )
+
+
+def add_seed_arguments(parser: argparse.ArgumentParser, sizes: bool = True):
+    """Аргументы командной строки для SeedConfig.
+
+    Args:
+        parser (argparse.ArgumentParser): Парсер.
+        sizes (bool, optional): Добавить количество заводов и рабочих. Defaults to True.
+    """
+    defaults = SeedConfig()
+    parser.add_argument(
+        "--allow-write", action="store_true", help="Разрешить запись в БД из POSTGRES_*"
+    )
+    if sizes:
+        parser.add_argument("--factories", type=int, default=defaults.factories)
+        parser.add_argument("--workers", type=int, default=defaults.workers)
+    parser.add_argument("--masters", type=int, default=defaults.masters)
+    parser.add_argument("--activities", type=int, default=defaults.activities)
+    parser.add_argument("--months", type=int, default=defaults.months)
+    parser.add_argument("--shifts", type=int, default=defaults.shifts)
+    parser.add_argument(
+        "--corrections", type=float, default=defaults.corrections, help="Доля правок"
+    )
+    parser.add_argument("--year", type=int, default=defaults.year)
+    parser.add_argument("--month", type=int, choices=range(1, 13), default=defaults.month)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+
+
+async def main(config: SeedConfig):
+    try:
+        await db_init()
+        data = await seed(config)
+        print(f"Созданы заводы: {', '.join(map(str, data.factory_ids))}")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="python -m app.bench.seed", description="Заполнение БД синтетическими данными"
+    )
+    add_seed_arguments(parser)
+    args = vars(parser.parse_args())
+    check_allow_write(parser, args)
+    asyncio.run(main(SeedConfig(**args)))
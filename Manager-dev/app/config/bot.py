@@ -0,0 +1,33 @@
+import os
+
+# Режим получения обновлений: "polling" или "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Адрес Bot API (локальный сервер Bot API или тестовый сервер). Пусто - api.telegram.org
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+# Типы обновлений через запятую. Пусто - только используемые роутерами
+ALLOWED_UPDATES = [name for name in os.getenv("ALLOWED_UPDATES", "").split(",") if name]
+
+# Webhook
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # Внешний адрес, например https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # Обязателен в режиме webhook
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+# Сколько ждать обработки принятых обновлений при остановке
+WEBHOOK_SHUTDOWN_TIMEOUT_SEC = float(os.getenv("WEBHOOK_SHUTDOWN_TIMEOUT_SEC", "30"))
+
+# Сколько обновлений обрабатывается одновременно (по всем пользователям)
+UPDATES_CONCURRENCY = int(os.getenv("UPDATES_CONCURRENCY", "32"))
+# Сколько необработанных обновлений может быть у одного пользователя. Лишние нажатия
+# кнопок отбрасываются
+USER_QUEUE_SIZE = int(os.getenv("USER_QUEUE_SIZE", "3"))
+
+# Очередь исходящих сообщений. Telegram допускает ~30 сообщений в секунду всего и
+# ~1 в секунду в один чат; общий лимит ниже 30, чтобы оставить запас прямым ответам
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "25"))
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))
+SEND_CHAT_BURST = float(os.getenv("SEND_CHAT_BURST", "3"))
+SEND_WORKERS = int(os.getenv("SEND_WORKERS", "5"))
+
+# Сколько документов Telegram принимает в одной медиагруппе
+MEDIA_GROUP_LIMIT = 10
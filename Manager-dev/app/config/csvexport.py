@@ -0,0 +1,19 @@
+import os
+
+CSV_FILENAME_TEMPLATE = "Позиции {} - {} ч{}.csv.gz"
+# Строк в одном файле выгрузки. Telegram принимает документы до 50 МБ
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", "200000"))
+CSV_COLUMNS = (
+    "position_id",
+    "timesheet_id",
+    "datetime",
+    "factory_id",
+    "factory",
+    "master",
+    "worker_id",
+    "worker",
+    "code",
+    "duration",
+    "job",
+    "rate",
+)
@@ -28,3 +28,19 @@ class TimesheetLen:
 
 class CorrectionLen:
     reason = 100
+
+
+class FSMLen:
+    key = 100
+    state = 100
+
+
+class ReportCacheLen:
+    version = 32
+    filename = 150
+
+
+class JobLen:
+    type = 30
+    status = 10
+    error = 500
@@ -0,0 +1,8 @@
+import os
+
+# Хранилище FSM: "postgres" или "memory"
+FSM_STORAGE = os.getenv("FSM_STORAGE", "postgres")
+# Время жизни неактивного состояния FSM
+FSM_TTL_HOURS = int(os.getenv("FSM_TTL_HOURS", "72"))
+# Период очистки устаревших состояний
+FSM_CLEANUP_INTERVAL_SEC = int(os.getenv("FSM_CLEANUP_INTERVAL_SEC", "3600"))
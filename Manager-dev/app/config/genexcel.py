@@ -1,12 +1,19 @@
+import os
 from enum import Enum, IntEnum
 
 from app.db.models import Activity, User, WorkerPositionActual, WorkerProfile
 
 FILENAME_TEMPLATE = "Отчёт {} за {} {} на {}.xlsx"
+ZIP_FILENAME_TEMPLATE = "Отчёты за {} {}.zip"
+# Увеличивается при изменении вида отчёта, чтобы не отдавать из кэша отчёты старого вида
+REPORT_FORMAT_VERSION = 5
+# С какого количества рабочих отчёт пишется в режиме constant_memory xlsxwriter
+REPORT_CONSTANT_MEMORY_ROWS = int(os.getenv("REPORT_CONSTANT_MEMORY_ROWS", "300"))
 
 ACTIVITIES = "Коды"
 CORRECTIONS = "Исправления"
 REPORT = "Отчёт"
+PHOTOS = "Фото"
 
 
 class Styles(Enum):
@@ -147,3 +154,15 @@ report_table = {
     },
     Table.ROW: {0: 40, 1: 40, 2: 40, 3: 80},
 }
+
+
+photos_table = {
+    Table.DESC: {
+        "Дата наряда": ("datetime", Styles.DATETIME),
+        "Фото": ("link", Styles.LINK),
+    },
+    Table.COLUMN: {
+        "A:A": 20,
+        "B:B": 80,
+    },
+}
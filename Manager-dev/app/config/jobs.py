@@ -0,0 +1,42 @@
+import os
+
+# Где готовятся отчёты: "inline" - в обработчике бота, "queue" - процессами app.worker
+REPORTS_MODE = os.getenv("REPORTS_MODE", "inline")
+# Как часто свободный worker проверяет очередь, если задач нет
+JOB_POLL_INTERVAL_SEC = float(os.getenv("JOB_POLL_INTERVAL_SEC", "2"))
+# Сколько задач один процесс worker выполняет одновременно
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "1"))
+# Сколько раз задача запускается, прежде чем считается неудавшейся
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Задержка перед повтором, умножается на номер попытки
+JOB_RETRY_DELAY_SEC = int(os.getenv("JOB_RETRY_DELAY_SEC", "60"))
+# Через сколько задача, взятая worker'ом, снова доступна другим (worker упал)
+JOB_LEASE_SEC = int(os.getenv("JOB_LEASE_SEC", "900"))
+# Как часто worker продлевает аренду выполняемой задачи
+JOB_HEARTBEAT_SEC = int(os.getenv("JOB_HEARTBEAT_SEC", "60"))
+
+# Заранее готовятся отчёты за прошлый месяц в первые REPORT_PREGEN_DAYS дней месяца,
+# в REPORT_PREGEN_HOUR часов (вне рабочего времени)
+REPORT_PREGEN_HOUR = int(os.getenv("REPORT_PREGEN_HOUR", "3"))
+REPORT_PREGEN_DAYS = int(os.getenv("REPORT_PREGEN_DAYS", "5"))
+# Через сколько после правки прошлого месяца перегенерировать отчёт завода. Правки,
+# внесённые за это время, попадают в одну генерацию
+REPORT_REFRESH_DELAY_SEC = int(os.getenv("REPORT_REFRESH_DELAY_SEC", "300"))
+
+
+class JobType:
+    REPORT = "report"
+    REPORT_CACHE = "report_cache"
+
+
+class LockKey:
+    """Ключи advisory блокировок Postgres."""
+
+    REPORT_PREGEN = 1
+
+
+class JobStatus:
+    NEW = "new"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
@@ -85,6 +85,7 @@ CURRENT_MONTH = "Текущий ({})"
 PREV_MONTH = "Предыдущий ({})"
 ANOTHER = "Другой"
 ALL_FACTORIES = "Все"
+ALL_FACTORIES_ZIP = "Все (архив)"
 
 # Редактирование отчёта
 NO_FACTORIES = "Список предприятий пуст"
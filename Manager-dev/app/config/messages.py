@@ -177,9 +177,22 @@ CONFIRM_WRITE_SHIFT = "Записать смену?"
 SHIFT_SAVED = "Смена записана"
 EMPTY_MASTER_ACTIVITY = "Система не настроена, обратитесь к администратору"
 SHIFT_SAVING = "Смена сохраняется..."
+SHIFT_MONTH_CLOSED = "{} {} закрыт, смена не записана. Обратитесь к администратору и \
+повторите запись после открытия месяца"
 NOT_PHOTO = "Вы отправили не фото, прикрепите фото!"
 SHIFT_HEADER_TOTAL = "<b>Смена:</b>\n"
 
+# Статистика запросов к БД
+DB_STATS_EMPTY = "Запросов к БД ещё не было"
+DB_STATS_HEADER = "<b>Запросов к БД:</b> {}\n"
+DB_STATS_CALLSITES = "\n<b>Helper'ы (по суммарному времени):</b>\n"
+DB_STATS_STATEMENTS = "\n<b>Выражения (по суммарному времени):</b>\n"
+DB_STATS_ROW = "{} — {} шт., {:.0f} мс (макс. {:.0f} мс)\n"
+
+BROADCAST_USAGE = "Укажите текст рассылки: /broadcast <текст>"
+BROADCAST_STARTED = "Рассылка начата, получателей: {}"
+BROADCAST_DONE = "Рассылка завершена: доставлено {} из {}"
+
 UNEXPECTED_ERROR = "Возникла непредвиденная ошибка. Обратитесь к разработчикам"
 
 # Выгрузка отчёта
@@ -189,8 +202,26 @@ CHOOSEN_MONTH = "Месяц — {}"
 TYPE_MONTH = "Введите год и название месяца <i>(например: 2024 апрель)</i>"
 CHOOSE_FACTORY_REPORT = "Отчёт какого предприятия скачать?"
 REPORT_PROCESS = "Генерация отчётов..."
+REPORT_QUEUED = "Отчёты поставлены в очередь и придут сюда, как только будут готовы"
 CANT_GENERATE_REPORT = "Невозможно отправить отчёт"
 
+# Закрытие месяца
+CLOSE_MONTH_USAGE = "Укажите год и месяц: <i>/{} 2024 апрель</i>"
+CLOSE_MONTH_NOT_PAST = "Закрыть можно только прошедший месяц"
+MONTH_CLOSED = "{} {} закрыт, зафиксировано позиций: {}"
+MONTH_REOPENED = "{} {} открыт, отчёт снова строится по текущим данным"
+MONTH_NOT_CLOSED = "{} {} не был закрыт"
+
+# Выгрузка позиций
+EXPORT_USAGE = "Укажите период: <i>/export 01.01.2024 31.12.2024</i>"
+EXPORT_EMPTY = "За период нет позиций"
+EXPORT_DONE = "Выгружено позиций: {}"
+
+# Сводка часов
+HOURS_HEADER = "<b>Часы за {} {}</b>\n"
+HOURS_ROW = "{} — рабочих: {}, смен: {}, часов: {:g}\n"
+HOURS_EMPTY = "За {} {} смен нет"
+
 # Редактирование смены
 CHOOSE_FACTORY_FOR_EDIT_SHIFT = "Выберите предприятие для редактирования отчета"
 FACTORY_CHOOSE = "Выбрано предприятие - {}"
@@ -31,3 +31,12 @@ class AlreadyExistsError(DBError):
     """
 
     pass
+
+
+class MonthClosedError(DBError):
+    """Запись в закрытый месяц: отчёт строится по снимку и её бы не учёл.
+    Args:
+        Exception (_type_): DBError
+    """
+
+    pass
@@ -1,12 +1,15 @@
-from datetime import datetime
+from datetime import date, datetime
 
 from sqlalchemy import (
     DDL,
     BigInteger,
     Boolean,
     CheckConstraint,
+    Date,
     DateTime,
     ForeignKey,
+    Index,
+    LargeBinary,
     Numeric,
     SmallInteger,
     String,
@@ -16,6 +19,7 @@ from sqlalchemy import (
     select,
     update,
 )
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.exc import ProgrammingError
 from sqlalchemy.ext.asyncio import AsyncAttrs, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, Mapped, Session, mapped_column
@@ -25,10 +29,14 @@ from app.config.db import (
     ActivityLen,
     CorrectionLen,
     FactoryLen,
+    FSMLen,
+    JobLen,
+    ReportCacheLen,
     TimesheetLen,
     UserLen,
     WorkerProfileLen,
 )
+from app.config.jobs import JobStatus
 from app.config.roles import Role
 from app.db.exceptions import BadKeyError
 
@@ -179,6 +187,12 @@ class Timesheet(Base):
     datetime: Mapped[datetime] = mapped_column(DateTime, default=datetime.now, nullable=False)
     link: Mapped[str] = mapped_column(String(TimesheetLen.link), nullable=True)
 
+    __table_args__ = (
+        # Смены завода за месяц (отчёт) и последние смены мастера
+        Index("ix_timesheet_factory_datetime", "factory_id", "datetime"),
+        Index("ix_timesheet_user_factory_datetime", "user_id", "factory_id", "datetime"),
+    )
+
 
 class WorkerPosition(Base):
 
@@ -189,6 +203,8 @@ class WorkerPosition(Base):
     user_id: Mapped[int] = mapped_column(ForeignKey("user.id"))  # Worker id
     activity_id: Mapped[int] = mapped_column(ForeignKey("activity.id"))
 
+    __table_args__ = (Index("ix_worker_position_timesheet", "timesheet_id"),)
+
 
 class Correction(Base):
 
@@ -201,6 +217,9 @@ class Correction(Base):
     reason: Mapped[str] = mapped_column(String(CorrectionLen.reason), nullable=False)
     datetime: Mapped[datetime] = mapped_column(DateTime, default=datetime.now, nullable=False)
 
+    # Последняя правка позиции в worker_position_view
+    __table_args__ = (Index("ix_correction_position_datetime", "worker_position_id", "datetime"),)
+
 
 class WorkerPositionActual(Base):
     __tablename__ = "worker_position_view"
@@ -211,6 +230,129 @@ class WorkerPositionActual(Base):
     activity_id: Mapped[int] = mapped_column()
 
 
+class FSMRecord(Base):
+    """Состояние FSM пользователя (см. app.db.storage.PostgresStorage)."""
+
+    __tablename__ = "fsm_state"
+
+    key: Mapped[str] = mapped_column(String(FSMLen.key), primary_key=True)
+    state: Mapped[str] = mapped_column(String(FSMLen.state), nullable=True)
+    data: Mapped[dict] = mapped_column(JSONB, default=dict, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.now, index=True, nullable=False
+    )
+
+
+class WorkerDailyHours(Base):
+    """Часы и смены рабочего за день. Обновляется вместе со сменами и правками."""
+
+    __tablename__ = "worker_daily_hours"
+
+    factory_id: Mapped[int] = mapped_column(ForeignKey("factory.id"), primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("user.id"), primary_key=True)  # Worker id
+    date: Mapped[date] = mapped_column(Date, primary_key=True)
+    hours: Mapped[float] = mapped_column(Numeric(6, 2), default=0, nullable=False)
+    shifts: Mapped[int] = mapped_column(SmallInteger, default=0, nullable=False)
+
+
+class MonthClose(Base):
+    """Закрытый месяц завода: отчёт строится по снимку payroll_*."""
+
+    __tablename__ = "month_close"
+
+    factory_id: Mapped[int] = mapped_column(ForeignKey("factory.id"), primary_key=True)
+    year: Mapped[int] = mapped_column(SmallInteger, primary_key=True)
+    month: Mapped[int] = mapped_column(SmallInteger, primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("user.id"))  # Admin id
+    closed_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now, nullable=False)
+
+
+class PayrollWorker(Base):
+    """Рабочий в закрытом месяце: должность и ставка на момент закрытия."""
+
+    __tablename__ = "payroll_worker"
+
+    factory_id: Mapped[int] = mapped_column(ForeignKey("factory.id"), primary_key=True)
+    year: Mapped[int] = mapped_column(SmallInteger, primary_key=True)
+    month: Mapped[int] = mapped_column(SmallInteger, primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("user.id"), primary_key=True)
+    is_master: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
+    job: Mapped[str] = mapped_column(String(WorkerProfileLen.job), nullable=False)
+    rate: Mapped[float] = mapped_column(Numeric(5, 2), nullable=False)
+
+
+class PayrollPosition(Base):
+    """Позиция табеля в закрытом месяце с зафиксированной длительностью кода."""
+
+    __tablename__ = "payroll_position"
+
+    worker_position_id: Mapped[int] = mapped_column(
+        ForeignKey("worker_position.id"), primary_key=True
+    )
+    factory_id: Mapped[int] = mapped_column(ForeignKey("factory.id"))
+    year: Mapped[int] = mapped_column(SmallInteger)
+    month: Mapped[int] = mapped_column(SmallInteger)
+    user_id: Mapped[int] = mapped_column(ForeignKey("user.id"))  # Worker id
+    activity_id: Mapped[int] = mapped_column(ForeignKey("activity.id"))
+    duration: Mapped[float] = mapped_column(Numeric(4, 2), nullable=False)
+    datetime: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    link: Mapped[str] = mapped_column(String(TimesheetLen.link), nullable=True)
+
+    __table_args__ = (Index("ix_payroll_position_month", "factory_id", "year", "month"),)
+
+
+class ReportCache(Base):
+    """Сгенерированный отчёт и версия данных, по которым он построен."""
+
+    __tablename__ = "report_cache"
+
+    factory_id: Mapped[int] = mapped_column(ForeignKey("factory.id"), primary_key=True)
+    year: Mapped[int] = mapped_column(SmallInteger, primary_key=True)
+    month: Mapped[int] = mapped_column(SmallInteger, primary_key=True)
+    version: Mapped[str] = mapped_column(String(ReportCacheLen.version), nullable=False)
+    filename: Mapped[str] = mapped_column(String(ReportCacheLen.filename), nullable=False)
+    content: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now, nullable=False)
+
+
+class ReportPregen(Base):
+    """Запущенный цикл заблаговременной генерации отчётов (см. ReportScheduler)."""
+
+    __tablename__ = "report_pregen"
+
+    date: Mapped[date] = mapped_column(Date, primary_key=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now, nullable=False)
+
+
+class Job(Base):
+    """Фоновая задача (см. app.worker).
+
+    Задача доступна worker'у, пока её `run_at` в прошлом: новая - сразу, повтор - после
+    задержки, взятая - после истечения аренды, если worker не завершил её.
+    """
+
+    __tablename__ = "job"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    type: Mapped[str] = mapped_column(String(JobLen.type), nullable=False)
+    args: Mapped[dict] = mapped_column(JSONB, default=dict, nullable=False)
+    status: Mapped[str] = mapped_column(
+        String(JobLen.status), default=JobStatus.NEW, nullable=False
+    )
+    attempts: Mapped[int] = mapped_column(SmallInteger, default=0, nullable=False)
+    error: Mapped[str] = mapped_column(String(JobLen.error), nullable=True)
+    run_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now, nullable=False)
+
+    __table_args__ = (Index("ix_job_status_run_at", "status", "run_at"),)
+
+
+def _create_indexes(conn):
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
 async def db_init():
     """Асинхронная инициализация БД, генерация таблиц."""
     from app.utils import setup_logger
@@ -220,6 +362,8 @@ async def db_init():
     async with engine.connect() as conn:
         logger.info("Инициализация БД")
         await conn.run_sync(Base.metadata.create_all)
+        # create_all не добавляет индексы в уже существующие таблицы
+        await conn.run_sync(_create_indexes)
         await conn.commit()
         try:
             # Удаление созданной таблицы WorkerPositionActual для избегания конфликтов
@@ -229,6 +373,8 @@ async def db_init():
             await conn.rollback()
         await conn.execute(VIEW_WORKERS_DDL)
         await conn.commit()
+        await conn.execute(DAILY_HOURS_BACKFILL_DDL)
+        await conn.commit()
 
 
 # Представление, которое возвращает WorkerPosition с актуальным изменением
@@ -250,3 +396,16 @@ LEFT JOIN LATERAL (
 ) c ON true;
 """
 )
+
+# Заполнение worker_daily_hours по уже существующим сменам (только если таблица пуста)
+DAILY_HOURS_BACKFILL_DDL = DDL(
+    """
+INSERT INTO worker_daily_hours (factory_id, user_id, date, hours, shifts)
+SELECT t.factory_id, wp.user_id, t.datetime::date, SUM(a.duration), COUNT(*)
+FROM worker_position_view wp
+JOIN timesheet t ON t.id = wp.timesheet_id
+JOIN activity a ON a.id = wp.activity_id
+WHERE NOT EXISTS (SELECT 1 FROM worker_daily_hours)
+GROUP BY t.factory_id, wp.user_id, t.datetime::date;
+"""
+)
@@ -1,39 +1,57 @@
-from datetime import date, datetime
-from typing import Sequence, Tuple
+import hashlib
+from datetime import date, datetime, timedelta
+from typing import AsyncIterator, Sequence, Tuple
 
 from sqlalchemy import (
-    Date,
     and_,
-    case,
-    cast,
+    delete,
     desc,
-    false,
     func,
+    literal,
+    literal_column,
     or_,
     select,
     true,
     union,
+    update,
 )
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert
 from sqlalchemy.engine.row import Row, RowMapping
 from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import aliased
 
+from app.config.jobs import JOB_LEASE_SEC, JobStatus, LockKey
 from app.config.roles import Role
-from app.db.exceptions import AlreadyExistsError, BadFormatError, BadKeyError, DBError
+from app.db.exceptions import (
+    AlreadyExistsError,
+    BadFormatError,
+    BadKeyError,
+    DBError,
+    MonthClosedError,
+)
 from app.db.models import (
     Activity,
     Correction,
     Factory,
+    Job,
     MasterFactory,
+    MonthClose,
+    PayrollPosition,
+    PayrollWorker,
+    ReportCache,
+    ReportPregen,
     Timesheet,
     User,
+    WorkerDailyHours,
     WorkerPosition,
     WorkerPositionActual,
     WorkerProfile,
     async_session,
 )
+from app.db.stats import track_callsite
 from app.utils import setup_logger
-from app.utils.month import Month
+from app.utils.month import Month, month_bounds
 from app.utils.uploader import get_disk_link, upload_photos
 
 logger = setup_logger(__name__)
@@ -42,6 +60,7 @@ logger = setup_logger(__name__)
 # Работа с User
 
 
+@track_callsite
 async def get_users_by_role(role: Role) -> Sequence[User]:
     """Получение User по Role
 
@@ -60,6 +79,7 @@ async def get_users_by_role(role: Role) -> Sequence[User]:
         return users.all()
 
 
+@track_callsite
 async def get_user(id: int, use_tg: bool = True) -> User:
     logger.debug(f"Получение user (id={id}, use_tg={use_tg})")
     async with async_session() as session:
@@ -71,6 +91,23 @@ async def get_user(id: int, use_tg: bool = True) -> User:
         return user
 
 
+@track_callsite
+async def get_users_by_ids(ids: list[int]) -> dict[int, User]:
+    """Получение нескольких User одним запросом.
+
+    Args:
+        ids (list[int]): Внутренние id пользователей.
+
+    Returns:
+        dict[int, User]: Пользователи по id.
+    """
+    logger.debug(f"Получение user'ов (ids={ids})")
+    async with async_session() as session:
+        users = await session.scalars(select(User).where(User.id.in_(ids)))
+        return {user.id: user for user in users}
+
+
+@track_callsite
 async def set_user(tg_id: int = None) -> User:
     """Добавляет пользователя в таблицу, если тот не сущесвует.
 
@@ -92,6 +129,7 @@ async def set_user(tg_id: int = None) -> User:
         return user
 
 
+@track_callsite
 async def update_user(id: int, values: dict, use_tg: bool = True) -> None:
     """Обновление сущности пользователя.
 
@@ -129,23 +167,32 @@ async def update_user(id: int, values: dict, use_tg: bool = True) -> None:
             raise BadFormatError(ex)
 
 
+@track_callsite
 async def get_report_users(factory_id: int, year: int, month: int):
+    """Рабочие завода за месяц, по одной строке на рабочего, как в снимке закрытого месяца.
+
+    Args:
+        factory_id (int): id завода.
+        year (int): Год.
+        month (int): Месяц.
+
+    Returns:
+        Sequence[Row[Tuple[User, bool]]]: Рабочий и признак, был ли он мастером своей смены.
+    """
     logger.debug(f"Получение Workers для Factory (factory_id={factory_id}) за ({year}-{month})")
+    start, end = month_bounds(year, month)
     async with async_session() as session:
         users = await session.execute(
-            select(
-                User,
-                case((User.id == Timesheet.user_id, true()), else_=false()).label("is_master"),
-            )
+            select(User, func.bool_or(User.id == Timesheet.user_id).label("is_master"))
             .join(WorkerPositionActual, WorkerPositionActual.user_id == User.id)
             .join(Timesheet, Timesheet.id == WorkerPositionActual.timesheet_id)
             .where(
                 Timesheet.factory_id == factory_id,
-                func.extract("year", Timesheet.datetime) == year,
-                func.extract("month", Timesheet.datetime) == month,
+                Timesheet.datetime >= start,
+                Timesheet.datetime < end,
             )
+            .group_by(User.id)
             .order_by(User.fullname)
-            .distinct()
         )
 
         return users.all()
@@ -154,6 +201,7 @@ async def get_report_users(factory_id: int, year: int, month: int):
 # Работа с Factory
 
 
+@track_callsite
 async def set_factory(company_name: str, factory_name: str) -> Factory:
     """Устанавливет или обновляет завод.
 
@@ -177,6 +225,7 @@ async def set_factory(company_name: str, factory_name: str) -> Factory:
         return factory
 
 
+@track_callsite
 async def get_factory(id: int) -> Factory:
     logger.debug(f"Получение factory (id={id})")
     async with async_session() as session:
@@ -187,6 +236,7 @@ async def get_factory(id: int) -> Factory:
         return factory
 
 
+@track_callsite
 async def delete_factory(id: int) -> None:
     logger.debug(f"Удаление factory (id={id})")
     async with async_session() as session:
@@ -198,6 +248,7 @@ async def delete_factory(id: int) -> None:
         await session.commit()
 
 
+@track_callsite
 async def get_factories(deleted: bool = False) -> Sequence[Factory]:
     logger.debug(f"Получение factories (deleted={deleted})")
     async with async_session() as session:
@@ -208,6 +259,7 @@ async def get_factories(deleted: bool = False) -> Sequence[Factory]:
 # Работа с Master
 
 
+@track_callsite
 async def set_factory_to_master(user_id: int, factory_id: int) -> MasterFactory:
     logger.debug(f"Назначение user'у завода (user_id={user_id}, factory_id={factory_id})")
     async with async_session() as session:
@@ -230,6 +282,7 @@ async def set_factory_to_master(user_id: int, factory_id: int) -> MasterFactory:
         return master_factory
 
 
+@track_callsite
 async def get_factory_by_user(id: int, use_tg: bool = False) -> Factory:
     """Получение сущности завода по id юзера (по умолчанию используется внутренний).
 
@@ -254,6 +307,7 @@ async def get_factory_by_user(id: int, use_tg: bool = False) -> Factory:
         return factory
 
 
+@track_callsite
 async def get_masters_by_factory(factory_id: int) -> Sequence[User]:
     logger.debug(f"Получение masters по Factory (factory_id={factory_id})")
     async with async_session() as session:
@@ -269,6 +323,7 @@ async def get_masters_by_factory(factory_id: int) -> Sequence[User]:
 # Работа с Activity
 
 
+@track_callsite
 async def set_activity(
     code: str, duration: float, description: str, color: str = "ffffff"
 ) -> Activity:
@@ -300,6 +355,7 @@ async def set_activity(
         return activity
 
 
+@track_callsite
 async def delete_activity(id: int) -> None:
     logger.debug(f"Удаление activity (id={id})")
     async with async_session() as session:
@@ -311,6 +367,7 @@ async def delete_activity(id: int) -> None:
         await session.commit()
 
 
+@track_callsite
 async def get_activities(deleted: bool = False) -> Sequence[Activity]:
     """Получение списка активностей.
 
@@ -328,62 +385,37 @@ async def get_activities(deleted: bool = False) -> Sequence[Activity]:
         return activities.all()
 
 
+@track_callsite
 async def get_report_activities(factory_id: int, year: int, month: int) -> Sequence[Activity]:
     logger.debug(f"Получение Activities для Factory (factory_id={factory_id}) за ({year}-{month})")
+    start, end = month_bounds(year, month)
     async with async_session() as session:
-        activity_subquery = union(
-            select(
-                WorkerPosition.activity_id.label("activity_id"),
-                WorkerPosition.id.label("worker_position_id"),
-            ),
-            select(
-                Correction.new_activity_id.label("activity_id"),
-                Correction.worker_position_id,
-            ),
-        ).subquery()
-
-        activities = await session.scalars(
-            select(Activity)
-            .join(activity_subquery, activity_subquery.c.activity_id == Activity.id)
-            .join(WorkerPosition, WorkerPosition.id == activity_subquery.c.worker_position_id)
+        positions = (
+            select(WorkerPosition.id, WorkerPosition.activity_id)
             .join(Timesheet, Timesheet.id == WorkerPosition.timesheet_id)
             .where(
                 Timesheet.factory_id == factory_id,
-                func.extract("year", Timesheet.datetime) == year,
-                func.extract("month", Timesheet.datetime) == month,
+                Timesheet.datetime >= start,
+                Timesheet.datetime < end,
             )
-            .order_by(Activity.is_deleted)
-            .distinct()
+            .cte("positions")
+        )
+        # Коды позиций месяца до правок и после
+        activity_ids = union(
+            select(positions.c.activity_id),
+            select(Correction.new_activity_id).join(
+                positions, positions.c.id == Correction.worker_position_id
+            ),
         )
 
-        return activities.all()
-
-
-async def get_report_user_activities(factory_id: int, user_id: int, year: int, month: int):
-    logger.debug(
-        f"Получение User Activities для Factory\
-(factory_id={factory_id}, user_id={user_id}) за ({year}-{month})"
-    )
-    async with async_session() as session:
-        activities = await session.execute(
-            select(Activity, Timesheet.datetime, Timesheet.link)
-            .join(
-                WorkerPositionActual,
-                WorkerPositionActual.activity_id == Activity.id,
-            )
-            .join(Timesheet, Timesheet.id == WorkerPositionActual.timesheet_id)
-            .where(
-                Timesheet.factory_id == factory_id,
-                WorkerPositionActual.user_id == user_id,
-                func.extract("year", Timesheet.datetime) == year,
-                func.extract("month", Timesheet.datetime) == month,
-            )
-            .order_by(Timesheet.datetime)
+        activities = await session.scalars(
+            select(Activity).where(Activity.id.in_(activity_ids)).order_by(Activity.is_deleted)
         )
 
-        return activities.fetchall()
+        return activities.all()
 
 
+@track_callsite
 async def get_activity(id: int) -> Activity:
     logger.debug(f"Получение activity (id={id})")
     async with async_session() as session:
@@ -394,9 +426,26 @@ async def get_activity(id: int) -> Activity:
         return activity
 
 
+@track_callsite
+async def get_activities_by_ids(ids: list[int]) -> dict[int, Activity]:
+    """Получение нескольких активностей одним запросом, включая удалённые.
+
+    Args:
+        ids (list[int]): id активностей.
+
+    Returns:
+        dict[int, Activity]: Активности по id.
+    """
+    logger.debug(f"Получение activities (ids={ids})")
+    async with async_session() as session:
+        activities = await session.scalars(select(Activity).where(Activity.id.in_(ids)))
+        return {activity.id: activity for activity in activities}
+
+
 # Работа с Worker
 
 
+@track_callsite
 async def set_profile(fullname: str, job: str, rate: float) -> WorkerProfile:
     logger.debug(f"Установка profile для user (fullname={fullname}, job={job}, rate={rate})")
     async with async_session() as session:
@@ -409,6 +458,7 @@ async def set_profile(fullname: str, job: str, rate: float) -> WorkerProfile:
         await session.commit()
 
 
+@track_callsite
 async def change_profile(user_id, values: dict) -> None:
     logger.debug(f"Обновление profile у User (user_id={user_id}) с values={values.values()}")
     async with async_session() as session:
@@ -444,6 +494,7 @@ async def change_profile(user_id, values: dict) -> None:
             raise BadFormatError(ex)
 
 
+@track_callsite
 async def get_profile(user_id: int, year: int = None, month: int = None) -> WorkerProfile:
     if not year:
         year = datetime.now().year
@@ -470,22 +521,35 @@ async def get_profile(user_id: int, year: int = None, month: int = None) -> Work
 
 # Работа с отчётом о смене
 
+# Строк в одном INSERT позиций: asyncpg принимает не больше 32767 параметров в запросе
+POSITIONS_CHUNK_ROWS = 4000
+
 
+@track_callsite
 async def add_shift(
     user_id: int,
     factory_id: int,
     photo_paths: list[str],
     positions: list[dict],
     shift_datetime: datetime = None,
-) -> None:
+) -> list[int]:
     """Добавление смены от мастера.
 
+    Позиции пишутся многострочными INSERT по POSITIONS_CHUNK_ROWS строк. Смена в
+    закрытом месяце завода не записывается: отчёт по снимку её бы не учёл.
+
     Args:
         user_id (int): user_id мастера.
         factory_id (int): id предприятия.
         photo_link (str): Ссылка на фото табеля.
         positions (list[{User.id: id, Activity.id: id},...]): Позиции рабочих.
         shift_datetime: (datetime): Custom shift datetime. Default: None
+
+    Returns:
+        list[int]: id добавленных позиций.
+
+    Raises:
+        MonthClosedError: Месяц смены закрыт (см. close_month).
     """
     logger.debug(f"Регистрация смены от user (user_id={user_id}), photo_paths={photo_paths}")
     if not shift_datetime:
@@ -494,6 +558,13 @@ async def add_shift(
     async with async_session() as session:
         user = await get_user(user_id, use_tg=False)
         factory = await get_factory(factory_id)
+        # До конца транзакции close_month этого месяца ждёт, пока смена не будет записана
+        await _lock_month(session, factory.id, shift_datetime.year, shift_datetime.month, True)
+        closed = await session.get(
+            MonthClose, (factory.id, shift_datetime.year, shift_datetime.month)
+        )
+        if closed:
+            raise MonthClosedError(f"Месяц ({shift_datetime.year}-{shift_datetime.month}) закрыт")
         timesheet = Timesheet(user_id=user.id, factory_id=factory.id, datetime=shift_datetime)
         session.add(timesheet)
         await session.flush()
@@ -506,17 +577,40 @@ async def add_shift(
             logger.critical("Не удалось загрузить фото табеля после попыток. Установка затычки...")
             timesheet.link = await get_disk_link()
 
-        for pos in positions:
-            session.add(
-                WorkerPosition(
-                    timesheet_id=timesheet.id,
-                    user_id=pos.get(User.id),
-                    activity_id=pos.get(Activity.id),
+        rows = [
+            {
+                "timesheet_id": timesheet.id,
+                "user_id": pos.get(User.id),
+                "activity_id": pos.get(Activity.id),
+            }
+            for pos in positions
+        ]
+        position_ids = []
+        for start in range(0, len(rows), POSITIONS_CHUNK_ROWS):
+            position_ids.extend(
+                await session.scalars(
+                    insert(WorkerPosition)
+                    .values(rows[start : start + POSITIONS_CHUNK_ROWS])
+                    .returning(WorkerPosition.id)
                 )
             )
+
+        durations = await session.execute(
+            select(Activity.id, Activity.duration).where(
+                Activity.id.in_({pos.get(Activity.id) for pos in positions})
+            )
+        )
+        durations = dict(durations.all())
+        daily = {}
+        for pos in positions:
+            hours, shifts = daily.get(pos.get(User.id), (0, 0))
+            daily[pos.get(User.id)] = (hours + durations[pos.get(Activity.id)], shifts + 1)
+        await add_daily_hours(session, factory.id, timesheet.datetime.date(), daily)
         await session.commit()
+        return position_ids
 
 
+@track_callsite
 async def get_shift_by_date(user_id: int, factory_id: int, day: date = None):
     """Получает последние n смен для данного мастера и завода.
 
@@ -532,11 +626,13 @@ async def get_shift_by_date(user_id: int, factory_id: int, day: date = None):
             Timesheet.factory_id == factory_id,
             Timesheet.user_id == user_id,
         ]
+        query = select(Timesheet).order_by(desc(Timesheet.datetime))
         if day:
-            conditions.append(cast(Timesheet.datetime, Date) == day)
-        last_timesheets = await session.scalars(
-            select(Timesheet).where(*conditions).order_by(desc(Timesheet.datetime))
-        )
+            start = datetime.combine(day, datetime.min.time())
+            conditions += [Timesheet.datetime >= start, Timesheet.datetime < start + timedelta(1)]
+        else:
+            query = query.limit(1)
+        last_timesheets = await session.scalars(query.where(*conditions))
         if day:
             return last_timesheets.all()
         else:
@@ -544,10 +640,12 @@ async def get_shift_by_date(user_id: int, factory_id: int, day: date = None):
             return [res] if res else None
 
 
+@track_callsite
 async def get_shifts_count(factory_id: int, year: int, month: int):
     logger.debug(
         f"Получение кол-ва смен в дни месяца (factory_id={factory_id}) за ({year}-{month})"
     )
+    start, end = month_bounds(year, month)
     async with async_session() as session:
         nums = await session.execute(
             select(
@@ -556,8 +654,8 @@ async def get_shifts_count(factory_id: int, year: int, month: int):
             )
             .where(
                 Timesheet.factory_id == factory_id,
-                func.extract("year", Timesheet.datetime) == year,
-                func.extract("month", Timesheet.datetime) == month,
+                Timesheet.datetime >= start,
+                Timesheet.datetime < end,
             )
             .group_by(func.date(Timesheet.datetime))
             .order_by(func.date(Timesheet.datetime))
@@ -567,13 +665,22 @@ async def get_shifts_count(factory_id: int, year: int, month: int):
         return res
 
 
+@track_callsite
 async def get_positions_by_shift_id(
     timesheet_id: int,
-) -> Sequence[Row[Tuple[WorkerPositionActual, str]]]:
+) -> Sequence[Row[Tuple[WorkerPositionActual, str, str]]]:
+    """Состав смены вместе с кодом и ФИО рабочего.
+
+    Args:
+        timesheet_id (int): id смены.
+
+    Returns:
+        Sequence[Row[Tuple[WorkerPositionActual, str, str]]]: Позиция, код и ФИО.
+    """
     logger.debug(f"Получение состава timesheet (timesheet_id={timesheet_id})")
     async with async_session() as session:
         worker_positions = await session.execute(
-            select(WorkerPositionActual, Activity.code)
+            select(WorkerPositionActual, Activity.code, User.fullname)
             .join(User, User.id == WorkerPositionActual.user_id)
             .join(Activity, WorkerPositionActual.activity_id == Activity.id)
             .where(WorkerPositionActual.timesheet_id == timesheet_id)
@@ -581,9 +688,10 @@ async def get_positions_by_shift_id(
         return worker_positions.all()
 
 
+@track_callsite
 async def correct_worker_position(
     tg_id: int, worker_position_id: int, new_activity_id: int, reason: str
-):
+) -> tuple[int, datetime]:
     """Устанавливает новое значение для позиции в табеле.
 
     Args:
@@ -591,12 +699,37 @@ async def correct_worker_position(
         worker_position_id (int): Позиция в табеле.
         new_activity_id (int): Новый код.
         reason (str): Причина редактирования.
+
+    Returns:
+        tuple[int, datetime]: id завода и время смены исправленной позиции.
     """
     logger.debug(
         f"Редактирование WorkerPosition (id={worker_position_id}) админом (tg_id={tg_id})"
     )
     async with async_session() as session:
         user = await get_user(tg_id)
+        # Параллельные правки позиции идут по очереди: иначе обе посчитают разницу часов
+        # от одного и того же кода и агрегат worker_daily_hours получит её дважды
+        await session.execute(
+            select(WorkerPosition.id)
+            .where(WorkerPosition.id == worker_position_id)
+            .with_for_update()
+        )
+        position = await session.execute(
+            select(
+                WorkerPositionActual.user_id,
+                Timesheet.factory_id,
+                Timesheet.datetime,
+                Activity.duration,
+            )
+            .join(Timesheet, Timesheet.id == WorkerPositionActual.timesheet_id)
+            .join(Activity, Activity.id == WorkerPositionActual.activity_id)
+            .where(WorkerPositionActual.id == worker_position_id)
+        )
+        position = position.one()
+        new_duration = await session.scalar(
+            select(Activity.duration).where(Activity.id == new_activity_id)
+        )
         session.add(
             Correction(
                 worker_position_id=worker_position_id,
@@ -605,13 +738,28 @@ async def correct_worker_position(
                 reason=reason,
             )
         )
+        # Правка в закрытом месяце меняет только затронутую строку снимка
+        await session.execute(
+            update(PayrollPosition)
+            .where(PayrollPosition.worker_position_id == worker_position_id)
+            .values(activity_id=new_activity_id, duration=new_duration)
+        )
+        await add_daily_hours(
+            session,
+            position.factory_id,
+            position.datetime.date(),
+            {position.user_id: (new_duration - position.duration, 0)},
+        )
         await session.commit()
+        return position.factory_id, position.datetime
 
 
+@track_callsite
 async def get_report_corrections(factory_id: int, year: int, month: int) -> Sequence[RowMapping]:
     from app.config.genexcel import CorrectionFields
 
     logger.debug(f"Получение Correction для Factory (factory_id={factory_id}) за ({year}-{month})")
+    start, end = month_bounds(year, month)
     async with async_session() as session:
         user_master = aliased(User)
         user_worker = aliased(User)
@@ -637,10 +785,745 @@ async def get_report_corrections(factory_id: int, year: int, month: int) -> Sequ
             .join(activity_init, activity_init.id == WorkerPosition.activity_id)
             .where(
                 Timesheet.factory_id == factory_id,
-                func.extract("year", Timesheet.datetime) == year,
-                func.extract("month", Timesheet.datetime) == month,
+                Timesheet.datetime >= start,
+                Timesheet.datetime < end,
             )
             .order_by(user_worker.fullname, desc(Correction.datetime))
         )
 
         return corrections.mappings().all()
+
+
+# Часы рабочих по дням
+
+
+async def add_daily_hours(
+    session: AsyncSession, factory_id: int, day: date, daily: dict[int, tuple[float, int]]
+) -> None:
+    """Прибавление часов и смен к агрегату worker_daily_hours в транзакции вызывающего.
+
+    Args:
+        session (AsyncSession): Сессия, в которой меняются смены.
+        factory_id (int): id завода.
+        day (date): День смены.
+        daily (dict[int, tuple[float, int]]): {user_id: (часы, смены)}, значения - приращения.
+    """
+    if not daily:
+        return
+    stmt = insert(WorkerDailyHours).values(
+        [
+            {"factory_id": factory_id, "user_id": user_id, "date": day, "hours": h, "shifts": n}
+            for user_id, (h, n) in daily.items()
+        ]
+    )
+    await session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[
+                WorkerDailyHours.factory_id,
+                WorkerDailyHours.user_id,
+                WorkerDailyHours.date,
+            ],
+            set_={
+                "hours": WorkerDailyHours.hours + stmt.excluded.hours,
+                "shifts": WorkerDailyHours.shifts + stmt.excluded.shifts,
+            },
+        )
+    )
+
+
+@track_callsite
+async def get_month_hours(year: int, month: int, factory_id: int = None) -> Sequence[Row]:
+    """Итоги месяца из агрегата: по рабочим завода или по всем заводам.
+
+    Args:
+        year (int): Год.
+        month (int): Месяц.
+        factory_id (int, optional): id завода. Если не задан - итоги по заводам.
+
+    Returns:
+        Sequence[Row]: (user_id, hours, shifts) для завода или
+            (factory_id, workers, hours, shifts) по заводам.
+    """
+    logger.debug(f"Получение часов за ({year}-{month}) (factory_id={factory_id})")
+    start, end = month_bounds(year, month)
+    in_month = (WorkerDailyHours.date >= start.date(), WorkerDailyHours.date < end.date())
+    async with async_session() as session:
+        if factory_id:
+            query = (
+                select(
+                    WorkerDailyHours.user_id,
+                    func.sum(WorkerDailyHours.hours).label("hours"),
+                    func.sum(WorkerDailyHours.shifts).label("shifts"),
+                )
+                .where(WorkerDailyHours.factory_id == factory_id, *in_month)
+                .group_by(WorkerDailyHours.user_id)
+            )
+        else:
+            query = (
+                select(
+                    WorkerDailyHours.factory_id,
+                    func.count(func.distinct(WorkerDailyHours.user_id)).label("workers"),
+                    func.sum(WorkerDailyHours.hours).label("hours"),
+                    func.sum(WorkerDailyHours.shifts).label("shifts"),
+                )
+                .where(*in_month)
+                .group_by(WorkerDailyHours.factory_id)
+            )
+        hours = await session.execute(query)
+        return hours.all()
+
+
+# Данные отчёта
+
+
+async def _latest_profiles(
+    session: AsyncSession, user_ids: list[int], year: int, month: int
+) -> dict[int, WorkerProfile]:
+    profiles = await session.scalars(
+        select(WorkerProfile)
+        .where(
+            WorkerProfile.user_id.in_(user_ids),
+            or_(
+                WorkerProfile.year < year,
+                and_(WorkerProfile.year == year, WorkerProfile.month <= month),
+            ),
+        )
+        .order_by(WorkerProfile.user_id, desc(WorkerProfile.year), desc(WorkerProfile.month))
+        .distinct(WorkerProfile.user_id)
+    )
+    return {profile.user_id: profile for profile in profiles}
+
+
+@track_callsite
+async def get_report_profiles(
+    user_ids: list[int], year: int, month: int
+) -> dict[int, WorkerProfile]:
+    """Профили рабочих на месяц отчёта, а если его нет - текущие.
+
+    Args:
+        user_ids (list[int]): id рабочих.
+        year (int): Год.
+        month (int): Месяц.
+
+    Returns:
+        dict[int, WorkerProfile]: Профили по id рабочего.
+    """
+    logger.debug(f"Получение профилей {len(user_ids)} рабочих за ({year}-{month})")
+    if not user_ids:
+        return {}
+    async with async_session() as session:
+        profiles = await _latest_profiles(session, user_ids, year, month)
+        missing = [user_id for user_id in user_ids if user_id not in profiles]
+        if missing:
+            now = datetime.now()
+            profiles |= await _latest_profiles(session, missing, now.year, now.month)
+    if len(profiles) < len(set(user_ids)):
+        raise BadKeyError("Не существует worker profile")
+    return profiles
+
+
+@track_callsite
+async def get_report_workers(
+    factory_id: int, year: int, month: int, snapshot: bool = False
+) -> list[tuple[User, bool, WorkerProfile | PayrollWorker]]:
+    """Рабочие отчёта с признаком мастера и профилем (job, rate).
+
+    Args:
+        factory_id (int): id завода.
+        year (int): Год.
+        month (int): Месяц.
+        snapshot (bool, optional): Читать из снимка закрытого месяца. Defaults to False.
+
+    Returns:
+        list[tuple[User, bool, WorkerProfile | PayrollWorker]]: Рабочие по ФИО.
+    """
+    logger.debug(
+        f"Получение рабочих отчёта (factory_id={factory_id}, snapshot={snapshot}) \
+за ({year}-{month})"
+    )
+    if not snapshot:
+        users = await get_report_users(factory_id, year, month)
+        profiles = await get_report_profiles([user.id for user, _ in users], year, month)
+        return [(user, is_master, profiles[user.id]) for user, is_master in users]
+    async with async_session() as session:
+        workers = await session.execute(
+            select(User, PayrollWorker.is_master, PayrollWorker)
+            .join(PayrollWorker, PayrollWorker.user_id == User.id)
+            .where(
+                PayrollWorker.factory_id == factory_id,
+                PayrollWorker.year == year,
+                PayrollWorker.month == month,
+            )
+            .order_by(User.fullname)
+        )
+        return [tuple(row) for row in workers]
+
+
+@track_callsite
+async def get_report_positions(
+    factory_id: int, year: int, month: int, snapshot: bool = False
+) -> Sequence[Row]:
+    """Все позиции табелей завода за месяц одним запросом.
+
+    Args:
+        factory_id (int): id завода.
+        year (int): Год.
+        month (int): Месяц.
+        snapshot (bool, optional): Читать из снимка закрытого месяца. Defaults to False.
+
+    Returns:
+        Sequence[Row]: Строки (user_id, activity_id, duration, datetime, link),
+            упорядоченные по рабочему и времени смены.
+    """
+    logger.debug(
+        f"Получение позиций отчёта (factory_id={factory_id}, snapshot={snapshot}) \
+за ({year}-{month})"
+    )
+    async with async_session() as session:
+        if snapshot:
+            query = (
+                select(
+                    PayrollPosition.user_id,
+                    PayrollPosition.activity_id,
+                    PayrollPosition.duration,
+                    PayrollPosition.datetime,
+                    PayrollPosition.link,
+                )
+                .where(
+                    PayrollPosition.factory_id == factory_id,
+                    PayrollPosition.year == year,
+                    PayrollPosition.month == month,
+                )
+                .order_by(PayrollPosition.user_id, PayrollPosition.datetime)
+            )
+        else:
+            start, end = month_bounds(year, month)
+            query = (
+                select(
+                    WorkerPositionActual.user_id,
+                    WorkerPositionActual.activity_id,
+                    Activity.duration,
+                    Timesheet.datetime,
+                    Timesheet.link,
+                )
+                .join(Activity, Activity.id == WorkerPositionActual.activity_id)
+                .join(Timesheet, Timesheet.id == WorkerPositionActual.timesheet_id)
+                .where(
+                    Timesheet.factory_id == factory_id,
+                    Timesheet.datetime >= start,
+                    Timesheet.datetime < end,
+                )
+                .order_by(WorkerPositionActual.user_id, Timesheet.datetime)
+            )
+        positions = await session.execute(query)
+        return positions.all()
+
+
+# Выгрузка позиций
+
+
+@track_callsite
+async def stream_positions(
+    date_from: date, date_to: date, factory_id: int = None, batch: int = 1000
+) -> AsyncIterator[Row]:
+    """Позиции табелей за период потоком через серверный курсор.
+
+    Память не зависит от длины периода: строки читаются пачками по `batch`.
+
+    Args:
+        date_from (date): Первый день периода.
+        date_to (date): Последний день периода (включительно).
+        factory_id (int, optional): id завода. Если не задан - все заводы.
+        batch (int, optional): Размер пачки курсора. Defaults to 1000.
+
+    Yields:
+        Row: Позиция с актуальным кодом, длительностью, сменой, мастером, заводом,
+            должностью и ставкой рабочего на месяц смены.
+    """
+    logger.debug(
+        f"Выгрузка позиций за ({date_from} - {date_to}) (factory_id={factory_id}, batch={batch})"
+    )
+    master = aliased(User)
+    worker = aliased(User)
+    shift_month = func.extract("year", Timesheet.datetime) * 12 + func.extract(
+        "month", Timesheet.datetime
+    )
+    # Профиль на месяц смены, а если его нет - последний (как в get_report_profiles)
+    profile = (
+        select(WorkerProfile.job, WorkerProfile.rate)
+        .where(WorkerProfile.user_id == WorkerPositionActual.user_id)
+        .order_by(
+            (WorkerProfile.year * 12 + WorkerProfile.month <= shift_month).desc(),
+            desc(WorkerProfile.year * 12 + WorkerProfile.month),
+        )
+        .limit(1)
+        .lateral()
+    )
+    conditions = [
+        Timesheet.datetime >= datetime.combine(date_from, datetime.min.time()),
+        Timesheet.datetime < datetime.combine(date_to, datetime.min.time()) + timedelta(days=1),
+    ]
+    if factory_id:
+        conditions.append(Timesheet.factory_id == factory_id)
+    query = (
+        select(
+            WorkerPositionActual.id.label("position_id"),
+            Timesheet.id.label("timesheet_id"),
+            Timesheet.datetime,
+            Factory.id.label("factory_id"),
+            Factory.factory_name,
+            master.fullname.label("master"),
+            worker.id.label("worker_id"),
+            worker.fullname.label("worker"),
+            Activity.code,
+            Activity.duration,
+            profile.c.job,
+            profile.c.rate,
+        )
+        .join(Timesheet, Timesheet.id == WorkerPositionActual.timesheet_id)
+        .join(Factory, Factory.id == Timesheet.factory_id)
+        .join(master, master.id == Timesheet.user_id)
+        .join(worker, worker.id == WorkerPositionActual.user_id)
+        .join(Activity, Activity.id == WorkerPositionActual.activity_id)
+        .outerjoin(profile, true())
+        .where(*conditions)
+        .order_by(Timesheet.datetime, WorkerPositionActual.id)
+        .execution_options(yield_per=batch)
+    )
+    async with async_session() as session:
+        rows = await session.stream(query)
+        async for row in rows:
+            yield row
+
+
+# Закрытие месяца
+
+
+async def _lock_month(
+    session: AsyncSession, factory_id: int, year: int, month: int, shared: bool = False
+):
+    """Advisory блокировка месяца завода до конца транзакции сессии.
+
+    Запись смены берёт разделяемую блокировку, закрытие месяца - исключительную.
+    """
+    lock = func.pg_advisory_xact_lock_shared if shared else func.pg_advisory_xact_lock
+    await session.execute(select(lock(factory_id, year * 12 + month - 1)))
+
+
+@track_callsite
+async def get_month_close(factory_id: int, year: int, month: int) -> MonthClose | None:
+    logger.debug(f"Получение закрытия месяца (factory_id={factory_id}) за ({year}-{month})")
+    async with async_session() as session:
+        return await session.get(MonthClose, (factory_id, year, month))
+
+
+@track_callsite
+async def close_month(factory_id: int, year: int, month: int, tg_id: int) -> int:
+    """Закрытие месяца: снимок позиций (с длительностями кодов) и профилей рабочих.
+
+    Повторное закрытие пересобирает снимок.
+
+    Args:
+        factory_id (int): id завода.
+        year (int): Год.
+        month (int): Месяц.
+        tg_id (int): tg_id админа.
+
+    Returns:
+        int: Количество зафиксированных позиций.
+    """
+    logger.debug(f"Закрытие месяца (factory_id={factory_id}) за ({year}-{month}) (tg_id={tg_id})")
+    admin = await get_user(tg_id)
+    start, end = month_bounds(year, month)
+    in_snapshot = (
+        PayrollPosition.factory_id == factory_id,
+        PayrollPosition.year == year,
+        PayrollPosition.month == month,
+    )
+    async with async_session() as session:
+        # Смены месяца, которые сейчас записываются, попадут в снимок, новые - отклоняются
+        await _lock_month(session, factory_id, year, month)
+        workers = {
+            user.id: is_master
+            for user, is_master in await get_report_users(factory_id, year, month)
+        }
+        await session.execute(delete(PayrollPosition).where(*in_snapshot))
+        await session.execute(
+            delete(PayrollWorker).where(
+                PayrollWorker.factory_id == factory_id,
+                PayrollWorker.year == year,
+                PayrollWorker.month == month,
+            )
+        )
+        positions = (
+            select(
+                WorkerPositionActual.id,
+                literal(factory_id),
+                literal(year),
+                literal(month),
+                WorkerPositionActual.user_id,
+                WorkerPositionActual.activity_id,
+                Activity.duration,
+                Timesheet.datetime,
+                Timesheet.link,
+            )
+            .join(Activity, Activity.id == WorkerPositionActual.activity_id)
+            .join(Timesheet, Timesheet.id == WorkerPositionActual.timesheet_id)
+            .where(
+                Timesheet.factory_id == factory_id,
+                Timesheet.datetime >= start,
+                Timesheet.datetime < end,
+            )
+        )
+        res = await session.execute(
+            insert(PayrollPosition).from_select(
+                [
+                    PayrollPosition.worker_position_id,
+                    PayrollPosition.factory_id,
+                    PayrollPosition.year,
+                    PayrollPosition.month,
+                    PayrollPosition.user_id,
+                    PayrollPosition.activity_id,
+                    PayrollPosition.duration,
+                    PayrollPosition.datetime,
+                    PayrollPosition.link,
+                ],
+                positions,
+            )
+        )
+        profiles = await get_report_profiles(list(workers), year, month)
+        for user_id, is_master in workers.items():
+            profile = profiles[user_id]
+            session.add(
+                PayrollWorker(
+                    factory_id=factory_id,
+                    year=year,
+                    month=month,
+                    user_id=user_id,
+                    is_master=is_master,
+                    job=profile.job,
+                    rate=profile.rate,
+                )
+            )
+        values = {"user_id": admin.id, "closed_at": datetime.now()}
+        stmt = insert(MonthClose).values(factory_id=factory_id, year=year, month=month, **values)
+        await session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[MonthClose.factory_id, MonthClose.year, MonthClose.month],
+                set_=values,
+            )
+        )
+        await session.commit()
+        return res.rowcount
+
+
+@track_callsite
+async def reopen_month(factory_id: int, year: int, month: int) -> bool:
+    """Открытие месяца: снимок удаляется, отчёт снова строится по текущим данным.
+
+    Args:
+        factory_id (int): id завода.
+        year (int): Год.
+        month (int): Месяц.
+
+    Returns:
+        bool: Был ли месяц закрыт.
+    """
+    logger.debug(f"Открытие месяца (factory_id={factory_id}) за ({year}-{month})")
+    async with async_session() as session:
+        await session.execute(
+            delete(PayrollPosition).where(
+                PayrollPosition.factory_id == factory_id,
+                PayrollPosition.year == year,
+                PayrollPosition.month == month,
+            )
+        )
+        await session.execute(
+            delete(PayrollWorker).where(
+                PayrollWorker.factory_id == factory_id,
+                PayrollWorker.year == year,
+                PayrollWorker.month == month,
+            )
+        )
+        res = await session.execute(
+            delete(MonthClose).where(
+                MonthClose.factory_id == factory_id,
+                MonthClose.year == year,
+                MonthClose.month == month,
+            )
+        )
+        await session.commit()
+        return bool(res.rowcount)
+
+
+# Кэш отчётов
+
+
+def _rows_hash(table, where, *columns):
+    """md5 от строк таблицы по условию в фиксированном порядке (для версии данных отчёта)."""
+    row = func.concat_ws(",", *columns)
+    return (
+        select(func.md5(func.string_agg(row, aggregate_order_by(literal_column("';'"), *columns))))
+        .select_from(table)
+        .where(where)
+        .scalar_subquery()
+    )
+
+
+@track_callsite
+async def get_report_version(factory_id: int, year: int, month: int, salt: str = "") -> str:
+    """Версия данных, из которых строится отчёт завода за месяц.
+
+    Смены и правки учитываются по количеству и максимальному id за месяц, справочники -
+    по хэшу содержимого, закрытие месяца - по времени закрытия. Хэшируются только
+    строки, которые читает отчёт: рабочие и мастера смен месяца, их профили, коды
+    позиций и правок месяца и сам завод. Любое изменение, влияющее на отчёт, меняет
+    версию.
+
+    Args:
+        factory_id (int): id завода.
+        year (int): Год.
+        month (int): Месяц.
+        salt (str, optional): Добавка к версии, например версия формата отчёта.
+
+    Returns:
+        str: md5 версии.
+    """
+    logger.debug(f"Получение версии данных отчёта (factory_id={factory_id}) за ({year}-{month})")
+    start, end = month_bounds(year, month)
+    in_month = (
+        Timesheet.factory_id == factory_id,
+        Timesheet.datetime >= start,
+        Timesheet.datetime < end,
+    )
+    async with async_session() as session:
+        timesheets = (
+            await session.execute(
+                select(func.count(Timesheet.id), func.max(Timesheet.id)).where(*in_month)
+            )
+        ).one()
+        corrections = (
+            await session.execute(
+                select(func.count(Correction.id), func.max(Correction.id))
+                .join(WorkerPosition, WorkerPosition.id == Correction.worker_position_id)
+                .join(Timesheet, Timesheet.id == WorkerPosition.timesheet_id)
+                .where(*in_month)
+            )
+        ).one()
+        closed_at = await session.scalar(
+            select(MonthClose.closed_at).where(
+                MonthClose.factory_id == factory_id,
+                MonthClose.year == year,
+                MonthClose.month == month,
+            )
+        )
+        positions = (
+            select(WorkerPosition.id, WorkerPosition.user_id, WorkerPosition.activity_id)
+            .join(Timesheet, Timesheet.id == WorkerPosition.timesheet_id)
+            .where(*in_month)
+            .subquery()
+        )
+        user_ids = union(select(positions.c.user_id), select(Timesheet.user_id).where(*in_month))
+        activity_ids = union(
+            select(positions.c.activity_id),
+            select(Correction.new_activity_id).where(
+                Correction.worker_position_id.in_(select(positions.c.id))
+            ),
+        )
+        references = (
+            await session.execute(
+                select(
+                    _rows_hash(User, User.id.in_(user_ids), User.id, User.fullname),
+                    _rows_hash(
+                        WorkerProfile,
+                        WorkerProfile.user_id.in_(user_ids),
+                        WorkerProfile.user_id,
+                        WorkerProfile.year,
+                        WorkerProfile.month,
+                        WorkerProfile.job,
+                        WorkerProfile.rate,
+                    ),
+                    _rows_hash(
+                        Activity,
+                        Activity.id.in_(activity_ids),
+                        Activity.id,
+                        Activity.code,
+                        Activity.is_deleted,
+                        Activity.duration,
+                        Activity.description,
+                        Activity.color,
+                    ),
+                    _rows_hash(
+                        Factory,
+                        Factory.id == factory_id,
+                        Factory.id,
+                        Factory.company_name,
+                        Factory.factory_name,
+                    ),
+                )
+            )
+        ).one()
+    parts = [salt, closed_at, *timesheets, *corrections, *references]
+    return hashlib.md5(":".join(map(str, parts)).encode()).hexdigest()
+
+
+@track_callsite
+async def get_cached_report(factory_id: int, year: int, month: int) -> ReportCache | None:
+    logger.debug(f"Получение отчёта из кэша (factory_id={factory_id}) за ({year}-{month})")
+    async with async_session() as session:
+        return await session.get(ReportCache, (factory_id, year, month))
+
+
+@track_callsite
+async def set_cached_report(
+    factory_id: int, year: int, month: int, version: str, filename: str, content: bytes
+) -> None:
+    logger.debug(
+        f"Сохранение отчёта в кэш (factory_id={factory_id}, version={version}) за ({year}-{month})"
+    )
+    values = {
+        "version": version,
+        "filename": filename,
+        "content": content,
+        "created_at": datetime.now(),
+    }
+    async with async_session() as session:
+        stmt = insert(ReportCache).values(factory_id=factory_id, year=year, month=month, **values)
+        await session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[ReportCache.factory_id, ReportCache.year, ReportCache.month],
+                set_=values,
+            )
+        )
+        await session.commit()
+
+
+# Фоновые задачи
+
+
+@track_callsite
+async def add_job(type: str, args: dict) -> int:
+    """Постановка задачи в очередь.
+
+    Args:
+        type (str): Тип задачи (JobType).
+        args (dict): Аргументы задачи.
+
+    Returns:
+        int: id задачи.
+    """
+    logger.debug(f"Постановка задачи (type={type}, args={args})")
+    async with async_session() as session:
+        job = Job(type=type, args=args)
+        session.add(job)
+        await session.commit()
+        return job.id
+
+
+@track_callsite
+async def take_job() -> Job | None:
+    """Взятие доступной задачи. Задачи, взятые другими worker'ами, пропускаются.
+
+    Взятая задача остаётся за worker'ом JOB_LEASE_SEC, после чего снова доступна, если
+    worker не продлил аренду (extend_job). Номер попытки `attempts` взятой задачи -
+    токен аренды для extend_job и finish_job.
+
+    Returns:
+        Job | None: Задача или None, если доступных нет.
+    """
+    async with async_session() as session:
+        now = datetime.now()
+        job = await session.scalar(
+            select(Job)
+            .where(Job.status.in_((JobStatus.NEW, JobStatus.RUNNING)), Job.run_at <= now)
+            .order_by(Job.run_at)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )
+        if job is None:
+            return None
+        job.status = JobStatus.RUNNING
+        job.attempts += 1
+        job.run_at = now + timedelta(seconds=JOB_LEASE_SEC)
+        await session.commit()
+        logger.debug(f"Взята задача (id={job.id}, type={job.type}, attempts={job.attempts})")
+        return job
+
+
+@track_callsite
+async def extend_job(id: int, attempt: int) -> bool:
+    """Продление аренды выполняемой задачи на JOB_LEASE_SEC.
+
+    Args:
+        id (int): id задачи.
+        attempt (int): Номер попытки, с которым задача взята.
+
+    Returns:
+        bool: False - задачу уже взял другой worker или она завершена.
+    """
+    async with async_session() as session:
+        res = await session.execute(
+            update(Job)
+            .where(Job.id == id, Job.attempts == attempt, Job.status == JobStatus.RUNNING)
+            .values(run_at=datetime.now() + timedelta(seconds=JOB_LEASE_SEC))
+        )
+        await session.commit()
+        return res.rowcount > 0
+
+
+@track_callsite
+async def finish_job(id: int, attempt: int, error: str = None, retry_at: datetime = None) -> bool:
+    """Завершение задачи.
+
+    Args:
+        id (int): id задачи.
+        attempt (int): Номер попытки, с которым задача взята.
+        error (str, optional): Ошибка выполнения. None - задача выполнена.
+        retry_at (datetime, optional): Когда повторить неудавшуюся задачу. None - не повторять.
+
+    Returns:
+        bool: False - аренда потеряна, задачу уже взял другой worker, статус не изменён.
+    """
+    if error is None:
+        values = {"status": JobStatus.DONE, "error": None}
+    elif retry_at is not None:
+        values = {"status": JobStatus.NEW, "error": error, "run_at": retry_at}
+    else:
+        values = {"status": JobStatus.FAILED, "error": error}
+    logger.debug(f"Завершение задачи (id={id}, attempt={attempt}, status={values['status']})")
+    async with async_session() as session:
+        res = await session.execute(
+            update(Job)
+            .where(Job.id == id, Job.attempts == attempt, Job.status == JobStatus.RUNNING)
+            .values(**values)
+        )
+        await session.commit()
+        return res.rowcount > 0
+
+
+# Заблаговременная генерация отчётов
+
+
+@track_callsite
+async def claim_report_pregen(day: date) -> bool:
+    """Отметка цикла подготовки отчётов за день.
+
+    Отметку ставит один процесс: он и выполняет цикл, остальные его пропускают, даже
+    если проснулись позже. Проверка и отметка идут под advisory блокировкой транзакции.
+
+    Args:
+        day (date): День цикла.
+
+    Returns:
+        bool: Цикл достался этому процессу.
+    """
+    logger.debug(f"Отметка подготовки отчётов за ({day})")
+    async with async_session() as session:
+        locked = await session.scalar(
+            select(func.pg_try_advisory_xact_lock(LockKey.REPORT_PREGEN))
+        )
+        if not locked:
+            return False
+        res = await session.execute(insert(ReportPregen).values(date=day).on_conflict_do_nothing())
+        await session.commit()
+        return bool(res.rowcount)
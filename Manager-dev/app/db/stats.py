@@ -0,0 +1,195 @@
+import inspect
+import os
+import re
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import wraps
+from threading import Lock
+from time import perf_counter
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.utils import setup_logger
+
+logger = setup_logger(__name__)
+
+# Порог медленного запроса в миллисекундах
+SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "200"))
+
+NO_CALLSITE = "<unknown>"
+
+# Цепочка helper'ов из app.db.requests, внутри которых выполняется запрос
+_callsite: ContextVar[str] = ContextVar("db_callsite", default=NO_CALLSITE)
+
+_PARAM_RE = re.compile(r"\$\d+|%\(\w+\)s|:\w+")
+_NUMBER_RE = re.compile(r"\b\d+(\.\d+)?\b")
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_IN_LIST_RE = re.compile(r"IN \((\?, )+\?\)", re.IGNORECASE)
+_SPACES_RE = re.compile(r"\s+")
+
+
+@dataclass
+class QueryStat:
+    """Агрегированная статистика по группе запросов."""
+
+    count: int = 0
+    total_ms: float = 0
+    max_ms: float = 0
+
+    def add(self, elapsed_ms: float):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+
+
+class QueryStats:
+    """Счётчики запросов по helper'ам и нормализованным выражениям."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.by_callsite: dict[str, QueryStat] = {}
+        self.by_statement: dict[str, QueryStat] = {}
+
+    def add(self, callsite: str, statement: str, elapsed_ms: float):
+        with self._lock:
+            self.by_callsite.setdefault(callsite, QueryStat()).add(elapsed_ms)
+            self.by_statement.setdefault(statement, QueryStat()).add(elapsed_ms)
+
+    def reset(self):
+        with self._lock:
+            self.by_callsite.clear()
+            self.by_statement.clear()
+
+    @property
+    def total(self) -> int:
+        return sum(stat.count for stat in self.by_callsite.values())
+
+    def top_callsites(self, limit: int = 10) -> list[tuple[str, QueryStat]]:
+        with self._lock:
+            items = list(self.by_callsite.items())
+        return sorted(items, key=lambda item: item[1].total_ms, reverse=True)[:limit]
+
+    def top_statements(self, limit: int = 10) -> list[tuple[str, QueryStat]]:
+        with self._lock:
+            items = list(self.by_statement.items())
+        return sorted(items, key=lambda item: item[1].total_ms, reverse=True)[:limit]
+
+
+stats = QueryStats()
+
+
+def normalize_statement(statement: str) -> str:
+    """Приведение SQL выражения к виду без литералов и параметров.
+
+    Args:
+        statement (str): SQL выражение.
+
+    Returns:
+        str: Нормализованное выражение.
+    """
+    statement = _STRING_RE.sub("?", statement)
+    statement = _PARAM_RE.sub("?", statement)
+    statement = _NUMBER_RE.sub("?", statement)
+    statement = _SPACES_RE.sub(" ", statement).strip()
+    return _IN_LIST_RE.sub("IN (...)", statement)
+
+
+def params_shape(parameters, executemany: bool) -> str:
+    """Описание формы параметров запроса без их значений.
+
+    Args:
+        parameters: Параметры курсора.
+        executemany (bool): Выполнение пачкой.
+
+    Returns:
+        str: Например, `(int, str, datetime)` или `100 x (int, int)`.
+    """
+
+    def shape(params) -> str:
+        if isinstance(params, dict):
+            return "{" + ", ".join(f"{k}: {type(v).__name__}" for k, v in params.items()) + "}"
+        if isinstance(params, (list, tuple)):
+            return "(" + ", ".join(type(v).__name__ for v in params) + ")"
+        return type(params).__name__
+
+    if executemany and isinstance(parameters, (list, tuple)):
+        first = shape(parameters[0]) if parameters else "()"
+        return f"{len(parameters)} x {first}"
+    return shape(parameters)
+
+
+def track_callsite(func):
+    """Декоратор helper'а БД: запросы внутри учитываются на его имя.
+
+    Вложенные вызовы складываются в цепочку, например `add_shift>get_user`.
+    Для асинхронных генераторов имя выставляется на время получения каждого элемента.
+    """
+
+    def enter():
+        parent = _callsite.get()
+        return _callsite.set(
+            func.__name__ if parent == NO_CALLSITE else f"{parent}>{func.__name__}"
+        )
+
+    if inspect.isasyncgenfunction(func):
+
+        @wraps(func)
+        async def gen_wrapper(*args, **kwargs):
+            agen = func(*args, **kwargs)
+            try:
+                while True:
+                    token = enter()
+                    try:
+                        item = await agen.__anext__()
+                    except StopAsyncIteration:
+                        return
+                    finally:
+                        _callsite.reset(token)
+                    yield item
+            finally:
+                token = enter()
+                try:
+                    await agen.aclose()
+                finally:
+                    _callsite.reset(token)
+
+        return gen_wrapper
+
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        token = enter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            _callsite.reset(token)
+
+    return wrapper
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Время начала хранится в контексте выполнения: при ошибке запроса он отбрасывается
+    # вместе с ним, а не остаётся в соединении
+    context._query_start = perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (perf_counter() - context._query_start) * 1000
+    callsite = _callsite.get()
+    stats.add(callsite, normalize_statement(statement), elapsed_ms)
+    if elapsed_ms >= SLOW_QUERY_MS:
+        logger.warning(
+            f"Медленный запрос ({elapsed_ms:.1f} мс, callsite={callsite}, \
+params={params_shape(parameters, executemany)}):\n{statement}"
+        )
+
+
+def setup_db_stats(engine: AsyncEngine):
+    """Подключение сбора статистики запросов к движку.
+
+    Args:
+        engine (AsyncEngine): Движок БД.
+    """
+    logger.info("Подключение статистики запросов к БД")
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
@@ -0,0 +1,136 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import (
+    BaseStorage,
+    DefaultKeyBuilder,
+    StateType,
+    StorageKey,
+)
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.db.models import FSMRecord
+from app.utils import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class PostgresStorage(BaseStorage):
+    """Хранилище FSM в Postgres.
+
+    Одна строка `fsm_state` на ключ: состояние и данные (JSONB). Запись - upsert,
+    поэтому состояние переживает перезапуск и доступно нескольким экземплярам бота.
+
+    Args:
+        session_maker (async_sessionmaker): Фабрика сессий БД.
+        ttl (timedelta): Время жизни неактивной записи.
+    """
+
+    def __init__(self, session_maker: async_sessionmaker, ttl: timedelta):
+        self.session_maker = session_maker
+        self.ttl = ttl
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._cleanup_task: Optional[asyncio.Task] = None
+
+    async def _upsert(self, key: StorageKey, merge_data: bool = False, **values) -> Dict[str, Any]:
+        values["updated_at"] = datetime.now()
+        stmt = insert(FSMRecord).values(key=self.key_builder.build(key), **({"data": {}} | values))
+        update_values = {name: getattr(stmt.excluded, name) for name in values}
+        if merge_data:
+            # update_data объединяет данные на стороне БД, без предварительного чтения
+            update_values["data"] = FSMRecord.data.op("||")(stmt.excluded.data)
+        async with self.session_maker() as session:
+            data = await session.scalar(
+                stmt.on_conflict_do_update(
+                    index_elements=[FSMRecord.key], set_=update_values
+                ).returning(FSMRecord.data)
+            )
+            await session.commit()
+            return data
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self._upsert(key, state=state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self.get_record(key))[0]
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self._upsert(key, data=dict(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self.get_record(key))[1]
+
+    async def update_data(self, key: StorageKey, data: Dict[str, Any]) -> Dict[str, Any]:
+        return await self._upsert(key, merge_data=True, data=dict(data))
+
+    async def get_record(self, key: StorageKey) -> Tuple[Optional[str], Dict[str, Any]]:
+        """Состояние и данные одним запросом.
+
+        Args:
+            key (StorageKey): Ключ FSM.
+
+        Returns:
+            Tuple[Optional[str], Dict[str, Any]]: Состояние и данные.
+        """
+        async with self.session_maker() as session:
+            record = await session.execute(
+                select(FSMRecord.state, FSMRecord.data).where(
+                    FSMRecord.key == self.key_builder.build(key)
+                )
+            )
+            record = record.first()
+            if not record:
+                return None, {}
+            return record.state, record.data
+
+    async def set_record(self, key: StorageKey, state: StateType, data: Dict[str, Any]) -> None:
+        """Запись состояния и данных одним запросом.
+
+        Args:
+            key (StorageKey): Ключ FSM.
+            state (StateType): Состояние.
+            data (Dict[str, Any]): Данные.
+        """
+        await self._upsert(
+            key, state=state.state if isinstance(state, State) else state, data=dict(data)
+        )
+
+    async def cleanup(self) -> int:
+        """Удаление записей, не обновлявшихся дольше ttl.
+
+        Returns:
+            int: Количество удалённых записей.
+        """
+        async with self.session_maker() as session:
+            res = await session.execute(
+                delete(FSMRecord).where(FSMRecord.updated_at < datetime.now() - self.ttl)
+            )
+            await session.commit()
+            return res.rowcount
+
+    def start_cleanup(self, interval: float):
+        """Запуск периодической очистки устаревших записей.
+
+        Args:
+            interval (float): Период очистки в секундах.
+        """
+
+        async def cleanup_loop():
+            while True:
+                try:
+                    removed = await self.cleanup()
+                    logger.debug(f"Очистка FSM: удалено {removed} записей")
+                except Exception as ex:
+                    logger.error(f"Не удалось очистить устаревшие состояния FSM:\n{ex}")
+                await asyncio.sleep(interval)
+
+        self._cleanup_task = asyncio.create_task(cleanup_loop())
+
+    async def close(self) -> None:
+        if self._cleanup_task:
+            self._cleanup_task.cancel()
+            self._cleanup_task = None
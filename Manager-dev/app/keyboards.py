@@ -344,7 +344,8 @@ async def get_factory_list(key: str = ""):
         )
     if key == "report":
         keyboard.row(
-            InlineKeyboardButton(text=labels.ALL_FACTORIES, callback_data=f"{key}factory_")
+            InlineKeyboardButton(text=labels.ALL_FACTORIES, callback_data=f"{key}factory_"),
+            InlineKeyboardButton(text=labels.ALL_FACTORIES_ZIP, callback_data=f"{key}factory_zip"),
         )
     if key == "edit_shift_":
         keyboard.row(
@@ -684,7 +685,7 @@ async def report_date_list():
     keyboard.row(
         InlineKeyboardButton(
             text=labels.PREV_MONTH.format(MONTHS.get(Month.Prev().month)),
-            callback_data=f"reportdate_{Month.Current().year}_{Month.Prev().month}",
+            callback_data=f"reportdate_{Month.Prev().year}_{Month.Prev().month}",
         )
     )
     keyboard.row(
@@ -727,11 +728,10 @@ async def get_workers_by_shift(shift_id: str):
 
     positions = await requests.get_positions_by_shift_id(int(shift_id))
 
-    for pos, _ in positions:
-        user = await requests.get_user(pos.user_id, use_tg=False)
+    for pos, _, fullname in positions:
         keyboard.row(
             InlineKeyboardButton(
-                text=user.fullname,
+                text=fullname,
                 callback_data=f"shift_pos_worker_{pos.id}_{pos.activity_id}_{pos.user_id}",
             )
         )
@@ -0,0 +1,141 @@
+from contextvars import ContextVar
+from copy import copy, deepcopy
+from typing import Any, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.types import TelegramObject
+
+from app.utils import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class _Snapshot:
+    """Состояние и данные FSM, загруженные один раз за update."""
+
+    def __init__(self, state: Optional[str], data: Dict[str, Any]):
+        self.state = state
+        self.data = data
+        self._loaded_state = state
+        self._loaded_data = deepcopy(data)
+
+    @property
+    def state_changed(self) -> bool:
+        return self.state != self._loaded_state
+
+    @property
+    def data_changed(self) -> bool:
+        # Сравнение, а не флаг: handler'ы меняют вложенные списки на месте
+        return self.data != self._loaded_data
+
+
+_snapshots: ContextVar[Optional[Dict[StorageKey, _Snapshot]]] = ContextVar(
+    "fsm_snapshots", default=None
+)
+
+
+class SnapshotStorage(BaseStorage):
+    """Обёртка хранилища FSM, которая копит изменения в пределах update.
+
+    Внутри `FSMSnapshotMiddleware` состояние и данные читаются из хранилища один раз,
+    все get/set/update работают со снимком, а изменения записываются одним запросом
+    в конце update. Вне middleware вызовы уходят в хранилище напрямую.
+
+    Args:
+        storage (BaseStorage): Основное хранилище.
+    """
+
+    def __init__(self, storage: BaseStorage):
+        self.storage = storage
+
+    async def _snapshot(self, key: StorageKey) -> Optional[_Snapshot]:
+        snapshots = _snapshots.get()
+        if snapshots is None:
+            return None
+        if key not in snapshots:
+            if hasattr(self.storage, "get_record"):
+                state, data = await self.storage.get_record(key)
+            else:
+                state = await self.storage.get_state(key)
+                data = await self.storage.get_data(key)
+            snapshots[key] = _Snapshot(state, data)
+        return snapshots[key]
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        snapshot = await self._snapshot(key)
+        if snapshot is None:
+            return await self.storage.set_state(key, state)
+        snapshot.state = state.state if isinstance(state, State) else state
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        snapshot = await self._snapshot(key)
+        if snapshot is None:
+            return await self.storage.get_state(key)
+        return snapshot.state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        snapshot = await self._snapshot(key)
+        if snapshot is None:
+            return await self.storage.set_data(key, data)
+        snapshot.data = dict(data)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        snapshot = await self._snapshot(key)
+        if snapshot is None:
+            return await self.storage.get_data(key)
+        return copy(snapshot.data)
+
+    async def update_data(self, key: StorageKey, data: Dict[str, Any]) -> Dict[str, Any]:
+        snapshot = await self._snapshot(key)
+        if snapshot is None:
+            return await self.storage.update_data(key, data)
+        snapshot.data.update(data)
+        return copy(snapshot.data)
+
+    async def flush(self, snapshots: Dict[StorageKey, _Snapshot]):
+        """Запись изменённых снимков в хранилище.
+
+        Args:
+            snapshots (Dict[StorageKey, _Snapshot]): Снимки текущего update.
+        """
+        for key, snapshot in snapshots.items():
+            if not snapshot.state_changed and not snapshot.data_changed:
+                continue
+            if hasattr(self.storage, "set_record"):
+                await self.storage.set_record(key, snapshot.state, snapshot.data)
+                continue
+            if snapshot.state_changed:
+                await self.storage.set_state(key, snapshot.state)
+            if snapshot.data_changed:
+                await self.storage.set_data(key, snapshot.data)
+
+    async def close(self) -> None:
+        await self.storage.close()
+
+
+class FSMSnapshotMiddleware(BaseMiddleware):
+    """Middleware, открывающее снимок FSM на время обработки update.
+
+    Должно быть зарегистрировано на `dp.update` до FSMContextMiddleware, чтобы
+    чтение `raw_state` тоже попадало в снимок.
+
+    Args:
+        storage (SnapshotStorage): Хранилище FSM диспетчера.
+    """
+
+    def __init__(self, storage: SnapshotStorage):
+        self.storage = storage
+
+    async def __call__(self, handler: Callable, event: TelegramObject, data: Dict[str, Any]):
+        snapshots = {}
+        token = _snapshots.set(snapshots)
+        try:
+            return await handler(event, data)
+        finally:
+            _snapshots.reset(token)
+            try:
+                await self.storage.flush(snapshots)
+            except Exception as ex:
+                logger.error(f"Не удалось сохранить состояние FSM:\n{ex}")
@@ -0,0 +1,112 @@
+import asyncio
+from collections import deque
+from typing import Any, Callable, Deque, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.types import CallbackQuery, Update
+
+from app.utils import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class _PendingCallback:
+    """Нажатие inline кнопки, ждущее своей очереди."""
+
+    def __init__(self, callback_query: CallbackQuery):
+        self.callback_query = callback_query
+        self.evicted = False
+
+
+class _UserQueue:
+    """Очередь обновлений одного пользователя."""
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.pending = 0
+        # Ждущие нажатия кнопок, от старых к новым
+        self.callbacks: Deque[_PendingCallback] = deque()
+
+
+class UserOrderMiddleware(BaseMiddleware):
+    """Последовательная обработка обновлений пользователя при параллельной обработке
+    разных пользователей.
+
+    Обновления одного `from_user.id` обрабатываются строго в порядке поступления
+    (asyncio.Lock отдаёт блокировку ожидающим по очереди), одновременно обрабатывается
+    не больше `concurrency` обновлений. Если у пользователя уже `queue_size`
+    необработанных обновлений, новое нажатие inline кнопки вытесняет самое старое
+    ждущее нажатие как устаревшее. Если ждут только сообщения, отбрасывается новое
+    нажатие.
+
+    Сообщения альбома обходят очередь: AlbumMiddleware собирает их, пока первое
+    сообщение альбома ждёт остальные.
+
+    Args:
+        concurrency (int): Общий предел одновременно обрабатываемых обновлений.
+        queue_size (int): Предел необработанных обновлений одного пользователя.
+    """
+
+    def __init__(self, concurrency: int, queue_size: int):
+        logger.info(
+            f"Инициализация очереди обновлений (concurrency={concurrency}, \
+queue_size={queue_size})"
+        )
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.queue_size = queue_size
+        self.queues: Dict[int, _UserQueue] = {}
+        # Ответы на вытесненные нажатия, выполняемые в фоне
+        self._answers: set[asyncio.Task] = set()
+
+    async def __call__(self, handler: Callable, event: Update, data: Dict[str, Any]):
+        user = data.get("event_from_user")
+        if user is None or (event.message and event.message.media_group_id):
+            async with self.semaphore:
+                return await handler(event, data)
+
+        queue = self.queues.setdefault(user.id, _UserQueue())
+        evicted = None
+        if event.callback_query and queue.pending >= self.queue_size:
+            if not queue.callbacks:
+                await self._drop(data, user.id, event.callback_query)
+                return UNHANDLED
+            evicted = queue.callbacks.popleft()
+            evicted.evicted = True
+            queue.pending -= 1
+
+        pending = None
+        if event.callback_query:
+            pending = _PendingCallback(event.callback_query)
+            queue.callbacks.append(pending)
+        queue.pending += 1
+        if evicted:
+            # Ответ в фоне: ожидание сети до постановки в очередь lock позволило бы
+            # более позднему обновлению пользователя обогнать текущее
+            task = asyncio.create_task(self._drop(data, user.id, evicted.callback_query))
+            self._answers.add(task)
+            task.add_done_callback(self._answers.discard)
+        try:
+            async with queue.lock:
+                if pending:
+                    if pending.evicted:
+                        return UNHANDLED
+                    queue.callbacks.remove(pending)
+                async with self.semaphore:
+                    return await handler(event, data)
+        finally:
+            # Вытесненное нажатие уже не учитывается в очереди
+            if not (pending and pending.evicted):
+                if pending in queue.callbacks:
+                    queue.callbacks.remove(pending)
+                queue.pending -= 1
+                if not queue.pending:
+                    del self.queues[user.id]
+
+    @staticmethod
+    async def _drop(data: Dict[str, Any], user_id: int, callback_query: CallbackQuery):
+        logger.info(f"Отброшен CallbackQuery (user_id={user_id}): {callback_query.data}")
+        try:
+            await data["bot"].answer_callback_query(callback_query.id)
+        except Exception as ex:
+            logger.debug(ex)
@@ -0,0 +1,108 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from app.db import requests
+from app.db.models import engine
+from app.utils import setup_logger
+from app.utils.genexcel import GeneratorExcel
+
+logger = setup_logger(__name__)
+
+
+async def _generate(factory_id: int, year: int, month: int, out: str) -> str:
+    try:
+        return await GeneratorExcel(factory_id, year, month, out).generate()
+    finally:
+        await engine.dispose()
+
+
+def generate(factory_id: int, year: int, month: int, out: str) -> tuple[str, float]:
+    """Генерация отчёта завода в процессе пула.
+
+    Args:
+        factory_id (int): id завода.
+        year (int): Год.
+        month (int): Месяц.
+        out (str): Каталог для отчёта.
+
+    Returns:
+        tuple[str, float]: Путь к отчёту и время генерации в секундах.
+    """
+    start = time.perf_counter()
+    filename = asyncio.run(_generate(factory_id, year, month, out))
+    return filename, time.perf_counter() - start
+
+
+async def _get_factory_ids() -> list[int]:
+    try:
+        return [factory.id for factory in await requests.get_factories()]
+    finally:
+        await engine.dispose()
+
+
+def parse_args(argv: list[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.reports", description="Генерация месячных отчётов без бота"
+    )
+    parser.add_argument("--year", type=int, required=True, help="Год")
+    parser.add_argument("--month", type=int, choices=range(1, 13), required=True, help="Месяц")
+    factories = parser.add_mutually_exclusive_group(required=True)
+    factories.add_argument(
+        "--factory", type=int, action="append", help="id завода, можно несколько раз"
+    )
+    factories.add_argument("--all", action="store_true", help="Все заводы")
+    parser.add_argument("--out", default=".", help="Каталог для отчётов")
+    parser.add_argument(
+        "--jobs", type=int, default=os.cpu_count(), help="Сколько процессов генерируют отчёты"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] = None) -> int:
+    """Генерация отчётов по заводам параллельно в нескольких процессах.
+
+    Запуск: `python -m app.reports --year 2024 --month 4 --all --out reports`.
+
+    Returns:
+        int: Код завершения: 0 - все отчёты готовы, 1 - были ошибки.
+    """
+    args = parse_args(argv)
+    os.makedirs(args.out, exist_ok=True)
+    factory_ids = args.factory or asyncio.run(_get_factory_ids())
+    logger.info(
+        f"Генерация отчётов за ({args.year}-{args.month}) (factories={factory_ids}, \
+jobs={args.jobs})"
+    )
+
+    failed = 0
+    start = time.perf_counter()
+    # spawn: у каждого процесса своё подключение к БД и свой цикл событий
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=args.jobs, mp_context=context) as pool:
+        futures = {
+            pool.submit(generate, factory_id, args.year, args.month, args.out): factory_id
+            for factory_id in factory_ids
+        }
+        for future in as_completed(futures):
+            factory_id = futures[future]
+            try:
+                filename, elapsed = future.result()
+            except Exception as ex:
+                failed += 1
+                print(f"factory_id={factory_id}\tошибка: {ex}", file=sys.stderr)
+                continue
+            print(f"factory_id={factory_id}\t{elapsed:.2f} сек\t{filename}")
+    print(
+        f"Готово отчётов: {len(factory_ids) - failed} из {len(factory_ids)} \
+за {time.perf_counter() - start:.2f} сек"
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
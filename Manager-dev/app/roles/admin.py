@@ -1,12 +1,11 @@
-from datetime import date
+from datetime import date, datetime
 
 from aiogram import F, Router
-from aiogram.filters import StateFilter
+from aiogram.filters import Command, CommandObject, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.types import (
+    BufferedInputFile,
     CallbackQuery,
-    FSInputFile,
-    InputMediaDocument,
     Message,
     ReplyKeyboardRemove,
     TelegramObject,
@@ -15,6 +14,8 @@ from aiogram.types import (
 from app import keyboards as kb
 from app.config import labels, messages
 from app.config.db import ActivityLen, FactoryLen, UserLen, WorkerProfileLen
+from app.config.genexcel import ZIP_FILENAME_TEMPLATE
+from app.config.jobs import REPORTS_MODE, JobType
 from app.config.roles import Role
 from app.db import requests
 from app.db.exceptions import AlreadyExistsError, BadFormatError, BadKeyError
@@ -31,11 +32,14 @@ from app.states import (
     SaveReport,
     ShiftReport,
 )
-from app.utils import setup_logger
+from app.utils import csvexport, setup_logger
 from app.utils.chatTools import get_files
-from app.utils.genexcel import GeneratorExcel
+from app.utils.delivery import send_documents, send_zip
 from app.utils.isowner import is_owner
 from app.utils.month import MONTHS, Month, get_month_by_name
+from app.utils.reportcache import get_reports
+from app.utils.scheduler import ReportScheduler
+from app.utils.sender import Sender
 from app.utils.uploader import get_disk_link
 
 logger = setup_logger(__name__)
@@ -317,7 +321,9 @@ async def confirm_edit_shift(message: Message, state: FSMContext):
 
 
 @admin.callback_query(F.data == "confirm_edit_shift_report")
-async def shift_editing(callback: CallbackQuery, state: FSMContext):
+async def shift_editing(
+    callback: CallbackQuery, state: FSMContext, report_scheduler: ReportScheduler
+):
     logger.info(f"shift_editing (from_user={callback.from_user.id})")
     await callback.answer()
     data = await state.get_data()
@@ -328,12 +334,13 @@ async def shift_editing(callback: CallbackQuery, state: FSMContext):
 
     logger.debug(data)
 
-    await requests.correct_worker_position(
+    factory_id, shift_datetime = await requests.correct_worker_position(
         tg_id=callback.from_user.id,
         worker_position_id=int(pos_id),
         new_activity_id=int(new_activity),
         reason=explanation,
     )
+    report_scheduler.refresh(factory_id, shift_datetime.year, shift_datetime.month)
 
     await callback.message.edit_reply_markup(None)
     await callback.message.answer(text=messages.CHANGE_SAVE)
@@ -382,7 +389,7 @@ async def choose_report_date(callback: CallbackQuery, state: FSMContext):
         await callback.message.edit_text(
             text=messages.CHOOSEN_MONTH.format(MONTHS.get(int(data[2])).lower()), reply_markup=None
         )
-        await state.set_data({SaveReport.year: int(data[1]), SaveReport.month: int(data[2])})
+        await state.set_data({"year": int(data[1]), "month": int(data[2])})
         await state.set_state(SaveReport.factory_id)
         await callback.message.answer(
             text=messages.CHOOSE_FACTORY_REPORT, reply_markup=await kb.get_factory_list("report")
@@ -408,7 +415,7 @@ async def input_year_month(message: Message, state: FSMContext):
         month = get_month_by_name(data[1])
         if not month:
             raise ValueError
-        await state.set_data({SaveReport.year: year, SaveReport.month: month})
+        await state.set_data({"year": year, "month": month})
         await state.set_state(SaveReport.factory_id)
         await message.answer(
             text=messages.CHOOSE_FACTORY_REPORT, reply_markup=await kb.get_factory_list("report")
@@ -427,33 +434,156 @@ async def choose_factory_report(callback: CallbackQuery, state: FSMContext):
     data = await state.get_data()
     await state.clear()
     factory_id = callback.data.split("_")[1]
-    objs = []
+    year, month = data.get("year"), data.get("month")
     try:
-        if factory_id:
-            excel = GeneratorExcel(
-                int(factory_id), data.get(SaveReport.year), data.get(SaveReport.month)
+        if factory_id.isdigit():
+            factory_ids = [int(factory_id)]
+        else:
+            factory_ids = [factory.id for factory in await requests.get_factories()]
+        if REPORTS_MODE == "queue":
+            await requests.add_job(
+                JobType.REPORT,
+                {
+                    "chat_id": callback.from_user.id,
+                    "factory_ids": factory_ids,
+                    "year": year,
+                    "month": month,
+                    "zip": factory_id == "zip",
+                },
+            )
+            await callback.message.edit_text(text=messages.REPORT_QUEUED)
+            return
+        reports = get_reports(factory_ids, year, month)
+        if factory_id == "zip":
+            await send_zip(
+                callback.bot,
+                callback.from_user.id,
+                ZIP_FILENAME_TEMPLATE.format(MONTHS[month], year),
+                reports,
             )
-            objs.append((await excel.generate(), excel))
         else:
-            factories = await requests.get_factories()
-            for factory in factories:
-                excel = GeneratorExcel(
-                    factory.id, data.get(SaveReport.year), data.get(SaveReport.month)
-                )
-                objs.append((await excel.generate(), excel))
-        media_group = []
-        for obj in objs:
-            filepath = obj[0]
-            media_group.append(InputMediaDocument(media=FSInputFile(filepath)))
-        await callback.bot.send_media_group(chat_id=callback.from_user.id, media=media_group)
+            await send_documents(callback.bot, callback.from_user.id, reports)
 
     except Exception as ex:
         logger.error(f"Невозможно отправить отчёт:\n{ex}")
         await callback.message.answer(text=messages.CANT_GENERATE_REPORT)
-    finally:
-        logger.debug("Очищение сгенерированных файлов")
-        for obj in objs:
-            await obj[1].free()
+
+
+def parse_year_month(args: str | None) -> tuple[int, int] | None:
+    """Год и месяц из аргументов команды вида `2024 апрель` или `2024 4`."""
+    data = (args or "").split()
+    if len(data) != 2 or not data[0].isdigit():
+        return None
+    month = int(data[1]) if data[1].isdigit() else get_month_by_name(data[1])
+    if month not in MONTHS:
+        return None
+    return int(data[0]), month
+
+
+@admin.message(Command("closemonth"))
+async def close_month(message: Message, state: FSMContext, command: CommandObject):
+    """/closemonth <год> <месяц>. Закрытие месяца по всем предприятиям.
+
+    Args:
+        message (Message): _description_
+        state (FSMContext): _description_
+        command (CommandObject): Команда с годом и месяцем.
+    """
+    logger.info(f"close_month (from_user={message.from_user.id})")
+    year_month = parse_year_month(command.args)
+    if not year_month:
+        await message.answer(text=messages.CLOSE_MONTH_USAGE.format(command.command))
+        return
+    year, month = year_month
+    current = Month.Current()
+    if (year, month) >= (current.year, current.month):
+        await message.answer(text=messages.CLOSE_MONTH_NOT_PAST)
+        return
+
+    positions = 0
+    for factory in await requests.get_factories():
+        positions += await requests.close_month(factory.id, year, month, message.from_user.id)
+    await message.answer(text=messages.MONTH_CLOSED.format(MONTHS[month], year, positions))
+
+
+@admin.message(Command("reopenmonth"))
+async def reopen_month(message: Message, state: FSMContext, command: CommandObject):
+    """/reopenmonth <год> <месяц>. Открытие закрытого месяца по всем предприятиям.
+
+    Args:
+        message (Message): _description_
+        state (FSMContext): _description_
+        command (CommandObject): Команда с годом и месяцем.
+    """
+    logger.info(f"reopen_month (from_user={message.from_user.id})")
+    year_month = parse_year_month(command.args)
+    if not year_month:
+        await message.answer(text=messages.CLOSE_MONTH_USAGE.format(command.command))
+        return
+    year, month = year_month
+
+    reopened = False
+    factories = [*await requests.get_factories(), *await requests.get_factories(deleted=True)]
+    for factory in factories:
+        reopened |= await requests.reopen_month(factory.id, year, month)
+    text = messages.MONTH_REOPENED if reopened else messages.MONTH_NOT_CLOSED
+    await message.answer(text=text.format(MONTHS[month], year))
+
+
+@admin.message(Command("hours"))
+async def month_hours(message: Message, state: FSMContext, command: CommandObject):
+    """/hours [<год> <месяц>]. Сводка часов и смен по предприятиям, по умолчанию за текущий месяц.
+
+    Args:
+        message (Message): _description_
+        state (FSMContext): _description_
+        command (CommandObject): Команда с необязательными годом и месяцем.
+    """
+    logger.info(f"month_hours (from_user={message.from_user.id})")
+    year_month = parse_year_month(command.args)
+    if not year_month:
+        current = Month.Current()
+        year_month = current.year, current.month
+    year, month = year_month
+
+    totals = await requests.get_month_hours(year, month)
+    if not totals:
+        await message.answer(text=messages.HOURS_EMPTY.format(MONTHS[month].lower(), year))
+        return
+    factories = [*await requests.get_factories(), *await requests.get_factories(deleted=True)]
+    names = {factory.id: factory.factory_name for factory in factories}
+    text = messages.HOURS_HEADER.format(MONTHS[month], year)
+    for total in totals:
+        text += messages.HOURS_ROW.format(
+            names.get(total.factory_id), total.workers, total.shifts, total.hours
+        )
+    await message.answer(text=text)
+
+
+@admin.message(Command("export"))
+async def export_positions(message: Message, state: FSMContext, command: CommandObject):
+    """/export <дд.мм.гггг> <дд.мм.гггг>. Выгрузка позиций табелей за период в gzip CSV.
+
+    Args:
+        message (Message): _description_
+        state (FSMContext): _description_
+        command (CommandObject): Команда с началом и концом периода.
+    """
+    logger.info(f"export_positions (from_user={message.from_user.id})")
+    try:
+        date_from, date_to = (
+            datetime.strptime(arg, "%d.%m.%Y").date() for arg in (command.args or "").split()
+        )
+    except ValueError:
+        await message.answer(text=messages.EXPORT_USAGE)
+        return
+
+    total = 0
+    async for filename, content, rows in csvexport.export_positions(date_from, date_to):
+        await message.answer_document(BufferedInputFile(content, filename=filename))
+        total += rows
+    text = messages.EXPORT_DONE.format(total) if total else messages.EXPORT_EMPTY
+    await message.answer(text=text)
 
 
 # ---
@@ -572,7 +702,7 @@ async def confirm_new_master(message: Message, state: FSMContext):
 
 
 @admin.callback_query(F.data.startswith("confirm_add_master_"))
-async def add_master_confirmed(callback: CallbackQuery, state: FSMContext):
+async def add_master_confirmed(callback: CallbackQuery, state: FSMContext, sender: Sender):
     logger.info(f"add_master_confirmed (from_user={callback.from_user.id})")
     _, _, _, id, factory_id, tg_id = callback.data.split("_")
     print(id, tg_id, factory_id)
@@ -584,8 +714,8 @@ async def add_master_confirmed(callback: CallbackQuery, state: FSMContext):
         await callback.message.answer(text=messages.CONFIRM_ADD)
         user = await requests.get_user(int(id), use_tg=False)
 
-        await callback.message.bot.send_message(
-            chat_id=tg_id,
+        sender.notify(
+            chat_id=int(tg_id),
             text=messages.GIVE_MASTER_ROLE.format(user.fullname),
             reply_markup=kb.masterKb,
         )
@@ -712,7 +842,7 @@ async def delete_master_confirm(callback: CallbackQuery, state: FSMContext):
 
 
 @admin.callback_query(F.data.startswith("confirm_delete_master_"))
-async def remove_master(callback: CallbackQuery, state: FSMContext):
+async def remove_master(callback: CallbackQuery, state: FSMContext, sender: Sender):
     logger.info(f"remove_master (from_user={callback.from_user.id})")
     await callback.answer()
     await callback.message.edit_reply_markup(None)
@@ -723,7 +853,7 @@ async def remove_master(callback: CallbackQuery, state: FSMContext):
 
     try:
         await callback.message.answer(text=messages.MASTER_REMOVED)
-        await callback.bot.send_message(
+        sender.notify(
             chat_id=user.tg_id, text=messages.YOU_DISMISSED, reply_markup=ReplyKeyboardRemove()
         )
     except Exception as ex:
@@ -8,12 +8,14 @@ from app import keyboards as kb
 from app.config import labels, messages
 from app.config.roles import Role
 from app.db import requests
+from app.db.exceptions import MonthClosedError
 from app.db.models import Activity, User
 from app.filters import RoleFilter
 from app.roles.admin import admin
 from app.states import ShiftReport
 from app.utils import setup_logger
 from app.utils.chatTools import get_files
+from app.utils.month import MONTHS
 
 logger = setup_logger(__name__)
 master = Router()
@@ -218,6 +220,7 @@ async def shift_choose_woker(callback: CallbackQuery, state: FSMContext):
         activity = await requests.get_activity(int(temp_activity_id))
         workers_activities_list = temp_data.get("workers_activities_list", [])
         workers_activities_list[int(worker_number)][1] = temp_activity_id
+        await state.update_data(workers_activities_list=workers_activities_list)
         await callback.message.edit_text(
             text=messages.EDIT_WORKER_ACTIVITY_SHIFT.format(activity.code), reply_markup=None
         )
@@ -368,9 +371,15 @@ async def save_shift_choise(callback: CallbackQuery, state: FSMContext):
 
     text = messages.SHIFT_HEADER_TOTAL
 
-    for i in range(len(workers_activities_list)):
-        user = await requests.get_user(int(workers_activities_list[i][0]), use_tg=False)
-        activity = await requests.get_activity(int(workers_activities_list[i][1]))
+    users = await requests.get_users_by_ids(
+        [int(worker_id) for worker_id, _ in workers_activities_list]
+    )
+    activities = await requests.get_activities_by_ids(
+        [int(activity_id) for _, activity_id in workers_activities_list]
+    )
+    for worker_id, activity_id in workers_activities_list:
+        user = users[int(worker_id)]
+        activity = activities[int(activity_id)]
         text += messages.WORKER_ACTIVITY_PAIR.format(user.fullname, activity.code)
 
     await callback.message.edit_text(text=text, reply_markup=await kb.confirm_shift_menu(number))
@@ -437,7 +446,6 @@ async def write_shift_to_db(callback: CallbackQuery, state: FSMContext):
     await callback.answer(messages.SHIFT_SAVING, show_alert=True)
 
     data = await state.get_data()
-    await state.clear()
     logger.debug(data)
 
     workers_activities_list = data.get("workers_activities_list", [])
@@ -465,14 +473,24 @@ async def write_shift_to_db(callback: CallbackQuery, state: FSMContext):
     else:
         formated_date = None
 
-    await requests.add_shift(
-        user_id=master_id,
-        factory_id=factory_id,
-        photo_paths=photo_paths,
-        positions=formatted_list,
-        shift_datetime=formated_date,
-    )
+    try:
+        await requests.add_shift(
+            user_id=master_id,
+            factory_id=factory_id,
+            photo_paths=photo_paths,
+            positions=formatted_list,
+            shift_datetime=formated_date,
+        )
+    except MonthClosedError:
+        # Черновик смены сохраняется: после открытия месяца её можно записать повторно
+        shift_month = formated_date or datetime.now()
+        await callback.message.edit_text(
+            text=messages.SHIFT_MONTH_CLOSED.format(MONTHS[shift_month.month], shift_month.year),
+            reply_markup=kb.confirm_write_shift,
+        )
+        return
 
+    await state.clear()
     await callback.message.edit_text(text=messages.SHIFT_SAVED)
 
 
@@ -490,9 +508,8 @@ async def view_shift(callback: CallbackQuery, state: FSMContext):
 
     text = ""
     positions = await requests.get_positions_by_shift_id(time_sheet.id)
-    for worker_position, code in positions:
-        user = await requests.get_user(worker_position.user_id, use_tg=False)
-        text += messages.WORKER_ACTIVITY_PAIR.format(user.fullname, code)
+    for _, code, fullname in positions:
+        text += messages.WORKER_ACTIVITY_PAIR.format(fullname, code)
 
     await callback.message.edit_reply_markup(None)
     await callback.message.answer(text=text, reply_markup=kb.confirm_prev_shift)
@@ -513,7 +530,7 @@ async def confirm_prev_shift(callback: CallbackQuery, state: FSMContext):
     positions = await requests.get_positions_by_shift_id(time_sheet.id)
     formatted_list = [
         [str(worker_position.user_id), str(worker_position.activity_id)]
-        for worker_position, _ in positions
+        for worker_position, _, _ in positions
     ]
     await state.update_data(workers_activities_list=formatted_list)
 
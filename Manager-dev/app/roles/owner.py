@@ -1,5 +1,8 @@
+from html import escape
+
 from aiogram import F, Router
 from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery, Message, ReplyKeyboardRemove, TelegramObject
 
@@ -11,10 +14,12 @@ from app.db import requests
 from app.db.exceptions import BadKeyError
 from app.db.models import User
 from app.db.requests import update_user
+from app.db.stats import stats
 from app.filters import RoleFilter
 from app.states import PickAdmin
 from app.utils import setup_logger
 from app.utils.isowner import is_owner
+from app.utils.sender import Sender
 from app.utils.uploader import get_disk_link
 
 logger = setup_logger(__name__)
@@ -46,6 +51,56 @@ async def owner_instruction(message: Message, state: FSMContext):
     )
 
 
+@owner.message(Command("dbstats"))
+async def db_stats(message: Message, state: FSMContext):
+    """/dbstats. Самые затратные helper'ы и выражения БД.
+
+    Args:
+        message (Message): _description_
+        state (FSMContext): _description_
+    """
+    logger.info(f"db_stats (from_user={message.from_user.id})")
+    if not stats.total:
+        await message.answer(text=messages.DB_STATS_EMPTY)
+        return
+
+    text = messages.DB_STATS_HEADER.format(stats.total)
+    text += messages.DB_STATS_CALLSITES
+    for callsite, stat in stats.top_callsites():
+        text += messages.DB_STATS_ROW.format(
+            f"<code>{escape(callsite)}</code>", stat.count, stat.total_ms, stat.max_ms
+        )
+    text += messages.DB_STATS_STATEMENTS
+    for statement, stat in stats.top_statements(5):
+        text += messages.DB_STATS_ROW.format(
+            f"<code>{escape(statement[:300])}</code>", stat.count, stat.total_ms, stat.max_ms
+        )
+    await message.answer(text=text)
+
+
+@owner.message(Command("broadcast"))
+async def broadcast(message: Message, state: FSMContext, command: CommandObject, sender: Sender):
+    """/broadcast <текст>. Рассылка мастерам и админам через очередь исходящих сообщений.
+
+    Рассылка идёт в фоне, итог приходит отдельным уведомлением.
+
+    Args:
+        message (Message): _description_
+        state (FSMContext): _description_
+        command (CommandObject): Команда с текстом рассылки.
+        sender (Sender): Очередь исходящих сообщений.
+    """
+    logger.info(f"broadcast (from_user={message.from_user.id})")
+    if not command.args:
+        await message.answer(text=messages.BROADCAST_USAGE)
+        return
+
+    users = await requests.get_users_by_role(Role.MASTER | Role.ADMIN)
+    chat_ids = [user.tg_id for user in users if user.tg_id]
+    sender.start_broadcast(chat_ids, command.args, message.chat.id, messages.BROADCAST_DONE)
+    await message.answer(text=messages.BROADCAST_STARTED.format(len(chat_ids)))
+
+
 # Управление админами
 @owner.message(F.text == labels.ADMIN_MANAGE)
 @owner.callback_query(F.data == f"return_manage_{Role.ADMIN}")
@@ -109,7 +164,7 @@ async def add_admin_denied(callback: CallbackQuery, state: FSMContext):
 
 
 @owner.callback_query(F.data == "add_admin_confirm", PickAdmin.name)
-async def add_admin_confirm(callback: CallbackQuery, state: FSMContext):
+async def add_admin_confirm(callback: CallbackQuery, state: FSMContext, sender: Sender):
     logger.info(f"add_admin_confirm (from_user={callback.from_user.id})")
     data = await state.get_data()
     try:
@@ -122,8 +177,8 @@ async def add_admin_confirm(callback: CallbackQuery, state: FSMContext):
         await update_user(tg_id, {User.fullname: data.get("name"), User.role: Role.ADMIN})
         await callback.message.answer(text=messages.CONFIRM_ADD, reply_markup=kb.editingKb)
 
-        await callback.message.bot.send_message(
-            chat_id=data.get("id"),
+        sender.notify(
+            chat_id=tg_id,
             text=messages.GIVE_ADMIN_ROLE.format(data.get("name")),
             reply_markup=kb.adminKb,
         )
@@ -194,7 +249,7 @@ async def dismiss_admin(callback: CallbackQuery, state: FSMContext):
 
 
 @owner.callback_query(F.data.startswith("confirm_dismiss_"))
-async def confirm_dismiss_admin(callback: CallbackQuery, state: FSMContext):
+async def confirm_dismiss_admin(callback: CallbackQuery, state: FSMContext, sender: Sender):
     logger.info(f"confirm_dismiss_admin (from_user={callback.from_user.id})")
     await callback.answer()
     user_tg_id = int(callback.data.split("_")[3])
@@ -202,7 +257,7 @@ async def confirm_dismiss_admin(callback: CallbackQuery, state: FSMContext):
     await requests.update_user(user_tg_id, {User.role: Role.USER})
     try:
         await callback.message.edit_text(text=messages.ADMIN_DELETED, reply_markup=None)
-        await callback.bot.send_message(
+        sender.notify(
             chat_id=user_tg_id, text=messages.YOU_DISMISSED, reply_markup=ReplyKeyboardRemove()
         )
     except Exception as ex:
@@ -0,0 +1,68 @@
+import csv
+import gzip
+import io
+from datetime import date
+from typing import AsyncIterator
+
+from app.config.csvexport import CSV_CHUNK_ROWS, CSV_COLUMNS, CSV_FILENAME_TEMPLATE
+from app.db.requests import stream_positions
+from app.utils import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class _GzipCsvChunk:
+    """gzip CSV файл, который пишется построчно в памяти."""
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+        self.gzip = gzip.GzipFile(fileobj=self.buffer, mode="wb")
+        self.text = io.TextIOWrapper(self.gzip, encoding="utf-8", newline="")
+        self.writer = csv.writer(self.text)
+        self.writer.writerow(CSV_COLUMNS)
+        self.rows = 0
+
+    def write(self, row):
+        self.writer.writerow(row)
+        self.rows += 1
+
+    def close(self) -> bytes:
+        self.text.close()
+        return self.buffer.getvalue()
+
+
+async def export_positions(
+    date_from: date, date_to: date, factory_id: int = None, chunk_rows: int = CSV_CHUNK_ROWS
+) -> AsyncIterator[tuple[str, bytes, int]]:
+    """Выгрузка позиций табелей за период частями gzip CSV.
+
+    Каждая часть - самостоятельный файл с заголовком не больше `chunk_rows` строк.
+    Строки читаются серверным курсором, поэтому в памяти одна часть.
+
+    Args:
+        date_from (date): Первый день периода.
+        date_to (date): Последний день периода (включительно).
+        factory_id (int, optional): id завода. Если не задан - все заводы.
+        chunk_rows (int, optional): Строк в одной части. Defaults to CSV_CHUNK_ROWS.
+
+    Yields:
+        tuple[str, bytes, int]: Имя файла, содержимое и количество строк части.
+    """
+    logger.info(f"Выгрузка позиций за ({date_from} - {date_to}) (factory_id={factory_id})")
+    part = 0
+    chunk = _GzipCsvChunk()
+    async for row in stream_positions(date_from, date_to, factory_id):
+        chunk.write(row)
+        if chunk.rows >= chunk_rows:
+            part += 1
+            yield _filename(date_from, date_to, part), chunk.close(), chunk.rows
+            chunk = _GzipCsvChunk()
+    if chunk.rows:
+        part += 1
+        yield _filename(date_from, date_to, part), chunk.close(), chunk.rows
+
+
+def _filename(date_from: date, date_to: date, part: int) -> str:
+    return CSV_FILENAME_TEMPLATE.format(
+        date_from.strftime("%d-%m-%Y"), date_to.strftime("%d-%m-%Y"), part
+    )
@@ -0,0 +1,102 @@
+import asyncio
+import io
+import zipfile
+from typing import AsyncIterator
+
+from aiogram import Bot
+from aiogram.types import BufferedInputFile, InputMediaDocument
+
+from app.config.bot import MEDIA_GROUP_LIMIT
+from app.utils import setup_logger
+
+logger = setup_logger(__name__)
+
+
+async def _send_batch(bot: Bot, chat_id: int, batch: list[tuple[str, bytes]]):
+    if len(batch) == 1:
+        filename, content = batch[0]
+        await bot.send_document(chat_id, BufferedInputFile(content, filename=filename))
+        return
+    await bot.send_media_group(
+        chat_id,
+        [
+            InputMediaDocument(media=BufferedInputFile(content, filename=filename))
+            for filename, content in batch
+        ],
+    )
+
+
+async def send_documents(
+    bot: Bot, chat_id: int, documents: AsyncIterator[tuple[str, bytes]]
+) -> int:
+    """Отправка документов по мере готовности.
+
+    Пока отправляются одни документы, следующие продолжают готовиться. Всё, что готово
+    к моменту отправки, уходит одной медиагруппой (не больше MEDIA_GROUP_LIMIT).
+
+    Args:
+        bot (Bot): Бот.
+        chat_id (int): Чат.
+        documents (AsyncIterator[tuple[str, bytes]]): Имена файлов и содержимое.
+
+    Returns:
+        int: Количество отправленных документов.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def produce():
+        try:
+            async for document in documents:
+                await queue.put(document)
+        finally:
+            await queue.put(None)
+
+    producer = asyncio.create_task(produce())
+    sent = 0
+    try:
+        done = False
+        while not done:
+            batch = [await queue.get()]
+            while len(batch) < MEDIA_GROUP_LIMIT and not queue.empty():
+                batch.append(queue.get_nowait())
+            if batch[-1] is None:
+                batch.pop()
+                done = True
+            if batch:
+                await _send_batch(bot, chat_id, batch)
+                sent += len(batch)
+        # Ошибка подготовки документов - после отправки уже готовых
+        await producer
+    finally:
+        producer.cancel()
+    logger.debug(f"Отправлено документов (chat_id={chat_id}): {sent}")
+    return sent
+
+
+async def send_zip(
+    bot: Bot, chat_id: int, filename: str, documents: AsyncIterator[tuple[str, bytes]]
+) -> int:
+    """Отправка документов одним zip архивом, собранным в памяти.
+
+    Каждый документ записывается в архив, как только готов.
+
+    Args:
+        bot (Bot): Бот.
+        chat_id (int): Чат.
+        filename (str): Имя архива.
+        documents (AsyncIterator[tuple[str, bytes]]): Имена файлов и содержимое.
+
+    Returns:
+        int: Количество документов в архиве.
+    """
+    buffer = io.BytesIO()
+    count = 0
+    # xlsx уже сжат, повторное сжатие только тратит время
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+        async for name, content in documents:
+            archive.writestr(name, content)
+            count += 1
+    if count:
+        await bot.send_document(chat_id, BufferedInputFile(buffer.getvalue(), filename=filename))
+    logger.debug(f"Отправлен архив (chat_id={chat_id}) из {count} документов")
+    return count
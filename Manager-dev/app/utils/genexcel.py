@@ -1,7 +1,7 @@
-import calendar
 import os
 from datetime import datetime
 
+import numpy as np
 import xlsxwriter
 from xlsxwriter.utility import xl_col_to_name
 
@@ -10,38 +10,40 @@ from app.config.genexcel import (
     CORRECTIONS,
     FILENAME_TEMPLATE,
     MONTH_HEADER,
+    PHOTOS,
     REPORT,
+    REPORT_CONSTANT_MEMORY_ROWS,
     CorrectionFields,
     ReportColumn,
     Styles,
     Table,
     activity_table,
     corrections_table,
+    photos_table,
     report_table,
 )
-from app.db.exceptions import BadKeyError
-from app.db.models import Activity, User, WorkerPositionActual, WorkerProfile
+from app.db.models import Activity, User, WorkerProfile
 from app.db.requests import (
     get_factory,
-    get_profile,
+    get_month_close,
     get_report_activities,
     get_report_corrections,
-    get_report_user_activities,
-    get_report_users,
-    get_shifts_count,
 )
 from app.utils import setup_logger
 from app.utils.month import MONTHS
+from app.utils.reportmodel import ReportModel
 from app.utils.uploader import get_disk_link
+from app.utils.xltable import Formula, TablePlan, write_cells
 
 logger = setup_logger(__name__)
 
 
 class GeneratorExcel:
-    def __init__(self, factory_id: int, year: int, month: int):
+    def __init__(self, factory_id: int, year: int, month: int, directory: str = ""):
         self.year = year
         self.month = month
         self.factory_id = factory_id
+        self.directory = directory
         self.styles = {}
 
     async def free(self):
@@ -53,14 +55,22 @@ class GeneratorExcel:
     async def generate(self) -> str:
         logger.info("Генерация excel файла")
         self.factory = await get_factory(self.factory_id)
+        # Закрытый месяц строится по снимку, а не по текущим данным
+        self.closed = await get_month_close(self.factory_id, self.year, self.month) is not None
 
-        self.filename = FILENAME_TEMPLATE.format(
-            self.factory.factory_name,
-            MONTHS.get(self.month).lower(),
-            self.year,
-            datetime.now().strftime("%d-%m-%Y"),
+        self.filename = os.path.join(
+            self.directory,
+            FILENAME_TEMPLATE.format(
+                self.factory.factory_name,
+                MONTHS.get(self.month).lower(),
+                self.year,
+                datetime.now().strftime("%d-%m-%Y"),
+            ),
         )
-        self.wb = xlsxwriter.Workbook(self.filename)
+        self.model = await ReportModel.load(self.factory_id, self.year, self.month, self.closed)
+        # Большие отчёты пишутся построчно, не держа лист целиком в памяти
+        self.constant_memory = len(self.model.workers) >= REPORT_CONSTANT_MEMORY_ROWS
+        self.wb = xlsxwriter.Workbook(self.filename, {"constant_memory": self.constant_memory})
         logger.debug("Загрузка стилей")
         for style in Styles:
             self.styles[style] = self.wb.add_format(style.value)
@@ -68,6 +78,7 @@ class GeneratorExcel:
         await self.add_activities_sheet()
         await self.add_corrections_sheet()
         await self.add_report_sheet()
+        self.add_photos_sheet()
         self.wb.close()
         return self.filename
 
@@ -81,18 +92,14 @@ class GeneratorExcel:
             )
 
         ws = self.wb.add_worksheet(ACTIVITIES)
-        # Add headers
-        for col, header in enumerate(activity_table[Table.DESC].keys()):
-            ws.write(0, col, header, self.styles.get(Styles.HEADER))
-        # Add body code
+        table = TablePlan.compile(
+            activity_table,
+            self.styles,
+            formats={Activity.code: lambda activity: self.styles.get(activity.id)},
+        )
+        table.write_header(ws, 0, self.styles.get(Styles.HEADER))
         for row, activity in enumerate(activities, start=1):
-            for col, attr in enumerate(activity_table[Table.DESC].values()):
-                # Styles
-                style = self.styles.get(attr[Table.Desc.STYLE])
-                if attr[Table.Desc.MAP] == Activity.code:
-                    style = self.styles.get(activity.id)
-                # ---
-                ws.write(row, col, getattr(activity, attr[Table.Desc.MAP].key), style)
+            table.write(ws, row, activity)
         # Add column widths
         for col, width in activity_table[Table.COLUMN].items():
             ws.set_column(col, width)
@@ -102,21 +109,21 @@ class GeneratorExcel:
         corrections = await get_report_corrections(self.factory_id, self.year, self.month)
         ws = self.wb.add_worksheet(CORRECTIONS)
 
-        # Add headers
-        for col, header in enumerate(corrections_table[Table.DESC].keys()):
-            ws.write(0, col, header, self.styles.get(Styles.HEADER))
-        # Add body code
+        table = TablePlan.compile(
+            corrections_table,
+            self.styles,
+            formats={
+                CorrectionFields.INIT_CODE: lambda correction: self.styles.get(
+                    correction.get(CorrectionFields.INIT_CODE_ID)
+                ),
+                CorrectionFields.NEW_CODE: lambda correction: self.styles.get(
+                    correction.get(CorrectionFields.NEW_CODE_ID)
+                ),
+            },
+        )
+        table.write_header(ws, 0, self.styles.get(Styles.HEADER))
         for row, correction in enumerate(corrections, start=1):
-            for col, attr in enumerate(corrections_table[Table.DESC].values()):
-                # Styles
-                style = self.styles.get(attr[Table.Desc.STYLE])
-                if attr[Table.Desc.MAP] == CorrectionFields.INIT_CODE:
-                    style = self.styles.get(correction.get(CorrectionFields.INIT_CODE_ID))
-                elif attr[Table.Desc.MAP] == CorrectionFields.NEW_CODE:
-                    style = self.styles.get(correction.get(CorrectionFields.NEW_CODE_ID))
-
-                # ---
-                ws.write(row, col, getattr(correction, attr[Table.Desc.MAP]), style)
+            table.write(ws, row, correction)
         # Add column widths
         for col, width in corrections_table[Table.COLUMN].items():
             ws.set_column(col, width)
@@ -125,152 +132,99 @@ class GeneratorExcel:
         logger.debug("Создание листа с report")
         ws = self.wb.add_worksheet(REPORT)
 
-        days_num = calendar.monthrange(self.year, self.month)[1]
+        model = self.model
+        columns = list(report_table[Table.DESC].keys())
+        start_merge_month = columns.index(ReportColumn.DAYS)
+        # Колонки дней с учётом нескольких смен в день
+        days_cols = model.columns
+        end_fill_table = len(columns) + days_cols - 2
+
+        # Строки листа пишутся строго по порядку: в режиме constant_memory строка,
+        # после которой уже записана следующая, сбрасывается на диск
+        for row, height in report_table[Table.ROW].items():
+            ws.set_row(row, height)
+        ws.merge_range(
+            0, 0, 0, end_fill_table, self.factory.company_name, self.styles.get(Styles.TITLE)
+        )
+        ws.merge_range(
+            1, 0, 1, end_fill_table, self.factory.factory_name, self.styles.get(Styles.TITLE)
+        )
+
         # Add headers
-        before_days = True
-        start_merge_month = 0
-        end_fill_table = 0
-        shifts = await get_shifts_count(self.factory_id, self.year, self.month)
-        offsets = [0] * (days_num + 1)
-        for i in range(1, days_num + 1):
-            offsets[i] = offsets[i - 1] + shifts.get(i - 1, 1) - 1
-        for col, header in enumerate(report_table[Table.DESC].keys()):
-            if header != ReportColumn.DAYS:
-                col_i = col if before_days else days_num + col - 1 + offsets[i + 1]
-                end_fill_table = col_i
-                ws.merge_range(
-                    2,
-                    col_i,
-                    3,
-                    col_i,
-                    header,
-                    self.styles.get(Styles.HEADER_REPORT if before_days else Styles.HEADER_90),
-                )
-            else:
-                before_days = False
-                start_merge_month = col
-                for i in range(days_num):
-                    count = shifts.get(i + 1, 1)
-                    col_i = col + i + offsets[i + 1]
-                    if count != 1:
-                        ws.merge_range(
-                            3,
-                            col_i,
-                            3,
-                            col_i + count - 1,
-                            i + 1,
-                            self.styles.get(Styles.HEADER_REPORT),
-                        )
-                    else:
-                        ws.write(
-                            3,
-                            col_i,
-                            i + 1,
-                            self.styles.get(Styles.HEADER_REPORT),
-                        )
-        days_num += offsets[-1]
+        headers = []
+        for col, header in enumerate(columns):
+            if header == ReportColumn.DAYS:
+                continue
+            before_days = col < start_merge_month
+            col_i = col if before_days else col + days_cols - 1
+            headers.append(
+                (col_i, header, Styles.HEADER_REPORT if before_days else Styles.HEADER_90)
+            )
         ws.merge_range(
             2,
             start_merge_month,
             2,
-            start_merge_month + days_num - 1,
+            start_merge_month + days_cols - 1,
             MONTH_HEADER[0].format(MONTHS[self.month], self.year),
             self.styles.get(MONTH_HEADER[1]),
         )
-        ws.merge_range(
-            0, 0, 0, end_fill_table, self.factory.company_name, self.styles.get(Styles.TITLE)
-        )
-        ws.merge_range(
-            1, 0, 1, end_fill_table, self.factory.factory_name, self.styles.get(Styles.TITLE)
-        )
+        if self.constant_memory:
+            # Объединение на две строки записало бы строку 2 после строки 3, поэтому
+            # заголовок - две ячейки без границы между ними
+            for col_i, header, style in headers:
+                ws.write(2, col_i, header, self.split_style(style, "bottom"))
+        else:
+            for col_i, header, style in headers:
+                ws.merge_range(2, col_i, 3, col_i, header, self.styles.get(style))
+        for i in range(model.days_num):
+            count = int(model.day_counts[i])
+            col_i = start_merge_month + int(model.day_start[i])
+            if count != 1:
+                ws.merge_range(
+                    3,
+                    col_i,
+                    3,
+                    col_i + count - 1,
+                    i + 1,
+                    self.styles.get(Styles.HEADER_REPORT),
+                )
+            else:
+                ws.write(
+                    3,
+                    col_i,
+                    i + 1,
+                    self.styles.get(Styles.HEADER_REPORT),
+                )
+        if self.constant_memory:
+            for col_i, _, style in headers:
+                ws.write_blank(3, col_i, None, self.split_style(style, "top"))
+        days_num = days_cols
 
-        users_res = await get_report_users(self.factory_id, self.year, self.month)
         START_WITH = 4
-        row = 0
-        col = 0
-        last_row = len(users_res) + START_WITH + 1
-        for row, (user, is_master) in enumerate(users_res, start=START_WITH):
-            user: User
-            for col, attr in enumerate(report_table[Table.DESC].values()):
-                obj_key = attr[Table.Desc.MAP]
-                style = self.styles.get(attr[Table.Desc.STYLE])
-                match obj_key:
-                    case ReportColumn.NUM:
-                        ws.write(row, col, row - START_WITH + 1, style)
-                    case User.fullname:
-                        ws.write(row, col, getattr(user, obj_key.key), style)
-                    case WorkerProfile.job:
-                        if is_master:
-                            style = self.styles.get(Styles.MASTER)
-                        try:
-                            profile = await get_profile(user.id, self.year, self.month)
-                        except BadKeyError as e:
-                            logger.debug(e)
-                            profile = await get_profile(user.id)
-                        ws.write(row, col, getattr(profile, obj_key.key), style)
-                    case WorkerPositionActual.activity_id:
-                        activities = await get_report_user_activities(
-                            self.factory_id, user.id, self.year, self.month
-                        )
-                        # Set boarders
-                        for day in range(1, days_num + 1):
-                            ws.write_blank(
-                                row, col + day - 1, None, self.styles.get(Styles.BORDERS)
-                            )
-                        day = 0
-                        offset_local = 0
-                        col_i = 0
-                        for activity, act_date, link in activities:
-                            activity: Activity
-                            act_date: datetime
-                            style = self.styles.get(activity.id)
-                            if day != act_date.day:
-                                day = act_date.day
-                                offset_local = 0
-                                col_i = col + day + offsets[day] - 1
-                            else:
-                                offset_local += 1
-                                col_i = col + day + offsets[day] - 1 + offset_local
-                            ws.write_number(row, col_i, activity.duration, style)
-                            ws.write_url(
-                                last_row,
-                                col_i,
-                                link,
-                                string="Фото наряда",
-                                cell_format=self.styles.get(Styles.LINK_90),
-                            )
-
-                    case ReportColumn.SHIFT:
-                        ws.write_formula(
-                            row,
-                            col + days_num - 1,
-                            f"=COUNT(D{row+1}:{xl_col_to_name(days_num + col - 2)}{row+1})",
-                            style,
-                        )
-                    case ReportColumn.HOURS:
-                        ws.write_formula(
-                            row,
-                            col + days_num - 1,
-                            f"=SUM(D{row+1}:{xl_col_to_name(days_num + col - 3)}{row+1})",
-                            style,
-                        )
-                    case WorkerProfile.rate:
-                        try:
-                            profile = await get_profile(user.id, self.year, self.month)
-                        except BadKeyError as e:
-                            logger.debug(e)
-                            profile = await get_profile(user.id)
-                        ws.write_number(
-                            row, col + days_num - 1, getattr(profile, obj_key.key), style
-                        )
-                    case ReportColumn.SALARY:
-                        ws.write_formula(
-                            row,
-                            col + days_num - 1,
-                            f"={xl_col_to_name(days_num + col - 3)}{row+1}*\
-                                {xl_col_to_name(days_num + col - 2)}{row+1}",
-                            style,
-                        )
+        before, after = self.compile_report_table(start_merge_month, START_WITH)
+        # Формат ячейки дня по activity_id, 0 - пустая ячейка с границами
+        day_styles = {
+            activity_id: self.styles.get(activity_id)
+            for activity_id in np.unique(model.activity_ids).tolist()
+        } | {0: self.styles.get(Styles.BORDERS)}
+        row = START_WITH - 1
+        col = len(columns) - 1
+        last_row = len(model.workers) + START_WITH + 1
+        for i, durations in enumerate(model.durations):
+            row = i + START_WITH
+            before_values, before_formats = before.row(i)
+            after_values, after_formats = after.row(i)
+            write_cells(
+                ws,
+                row,
+                0,
+                before_values
+                + np.where(np.isnan(durations), None, durations).tolist()
+                + after_values,
+                before_formats
+                + [day_styles[activity_id] for activity_id in model.activity_ids[i].tolist()]
+                + after_formats,
+            )
         row += 1
         col += days_num - 1
         ws.write_formula(
@@ -278,6 +232,7 @@ class GeneratorExcel:
             col,
             f"=SUM({xl_col_to_name(col)}5:{xl_col_to_name(col)}{row})",
             self.styles.get(Styles.TOTAL),
+            model.total_salary,
         )
         ws.merge_range(last_row, 0, last_row, 2, None)
         ws.write_url(
@@ -287,6 +242,21 @@ class GeneratorExcel:
             string="Ссылка на диск",
             cell_format=self.styles.get(Styles.LINK),
         )
+        # Ссылки на фото нарядов - отдельной строкой после итогов. Сами ссылки - на листе
+        # фото, здесь только переход к строке наряда колонки
+        photo_rows = {}
+        for row, photo in enumerate(model.photos, start=2):
+            photo_rows.setdefault(photo.link, row)
+        for col_i, link in enumerate(model.links, start=start_merge_month):
+            if not link:
+                continue
+            ws.write_url(
+                last_row,
+                col_i,
+                f"internal:'{PHOTOS}'!A{photo_rows[link]}",
+                string="Фото наряда",
+                cell_format=self.styles.get(Styles.LINK_90),
+            )
         # Add column widths
         before_columns = -1
         for col, width in report_table[Table.COLUMN].items():
@@ -301,6 +271,85 @@ class GeneratorExcel:
             else:
                 before_columns += 1
                 ws.set_column(col, width)
-        # Add row heights
-        for row, height in report_table[Table.ROW].items():
-            ws.set_row(row, height)
+
+    def add_photos_sheet(self):
+        logger.debug("Создание листа с photos")
+        ws = self.wb.add_worksheet(PHOTOS)
+        table = TablePlan.compile(photos_table, self.styles)
+        table.write_header(ws, 0, self.styles.get(Styles.HEADER))
+        for row, photo in enumerate(self.model.photos, start=1):
+            table.write(ws, row, photo)
+        # Add column widths
+        for col, width in photos_table[Table.COLUMN].items():
+            ws.set_column(col, width)
+
+    def compile_report_table(self, days_col: int, start_row: int) -> tuple[TablePlan, TablePlan]:
+        """Колонки листа отчёта до и после дней месяца.
+
+        Объект строки - индекс рабочего в модели отчёта.
+
+        Args:
+            days_col (int): Первая колонка дней месяца.
+            start_row (int): Строка первого рабочего.
+
+        Returns:
+            tuple[TablePlan, TablePlan]: Колонки до и после дней месяца.
+        """
+        workers = self.model.workers
+        desc = list(report_table[Table.DESC].items())
+        styles = {key: self.styles.get(style) for _, (key, style) in desc}
+        first_day = xl_col_to_name(days_col)
+        last_day = xl_col_to_name(days_col + self.model.columns - 1)
+        after_days = {
+            key: xl_col_to_name(col)
+            for col, (_, (key, _)) in enumerate(
+                desc[days_col + 1 :], start=days_col + self.model.columns
+            )
+        }
+        hours, rate = after_days[ReportColumn.HOURS], after_days[WorkerProfile.rate]
+        # Посчитанные итоги пишутся как значения формул: просмотрщики без пересчёта
+        # (превью Telegram, мобильные приложения, парсеры) видят их сразу
+        shifts = self.model.shifts.tolist()
+        hours_values = self.model.hours.tolist()
+        salary = self.model.salary.tolist()
+
+        values = {
+            ReportColumn.NUM: lambda i: i + 1,
+            User.fullname: lambda i: workers[i][0].fullname,
+            WorkerProfile.job: lambda i: workers[i][2].job,
+            ReportColumn.SHIFT: lambda i: Formula(
+                f"=COUNT({first_day}{start_row + i + 1}:{last_day}{start_row + i + 1})",
+                shifts[i],
+            ),
+            ReportColumn.HOURS: lambda i: Formula(
+                f"=SUM({first_day}{start_row + i + 1}:{last_day}{start_row + i + 1})",
+                hours_values[i],
+            ),
+            WorkerProfile.rate: lambda i: workers[i][2].rate,
+            ReportColumn.SALARY: lambda i: Formula(
+                f"={hours}{start_row + i + 1}*{rate}{start_row + i + 1}", salary[i]
+            ),
+        }
+        formats = {
+            WorkerProfile.job: lambda i: (
+                self.styles.get(Styles.MASTER) if workers[i][1] else styles[WorkerProfile.job]
+            )
+        }
+        return (
+            TablePlan.compile({Table.DESC: dict(desc[:days_col])}, self.styles, values, formats),
+            TablePlan.compile(
+                {Table.DESC: dict(desc[days_col + 1 :])}, self.styles, values, formats
+            ),
+        )
+
+    def split_style(self, style: Styles, border: str):
+        """Стиль половины заголовка без границы с другой половиной.
+
+        Args:
+            style (Styles): Стиль заголовка.
+            border (str): Убираемая граница: "top" или "bottom".
+        """
+        key = (style, border)
+        if key not in self.styles:
+            self.styles[key] = self.wb.add_format(style.value | {border: 0})
+        return self.styles[key]
@@ -1,4 +1,4 @@
-from datetime import date
+from datetime import date, datetime
 
 MONTHS = {
     1: "Январь",
@@ -22,6 +22,21 @@ def get_month_by_name(name: str) -> int:
     )
 
 
+def month_bounds(year: int, month: int) -> tuple[datetime, datetime]:
+    """Границы месяца [начало, начало следующего).
+
+    Args:
+        year (int): Год.
+        month (int): Месяц.
+
+    Returns:
+        tuple[datetime, datetime]: Начало месяца и начало следующего месяца.
+    """
+    start = datetime(year, month, 1)
+    end = datetime(year + month // 12, month % 12 + 1, 1)
+    return start, end
+
+
 class Month:
     class Next:
         def __init__(self):
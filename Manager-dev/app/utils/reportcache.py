@@ -0,0 +1,87 @@
+import asyncio
+import os
+import shutil
+import tempfile
+from typing import AsyncIterator
+
+from app.config.genexcel import REPORT_FORMAT_VERSION
+from app.db import requests
+from app.utils import setup_logger
+from app.utils.genexcel import GeneratorExcel
+
+logger = setup_logger(__name__)
+
+
+# Отчёты, которые сейчас готовятся: (factory_id, year, month) -> задача
+_in_flight: dict[tuple[int, int, int], asyncio.Task] = {}
+
+
+async def get_report(factory_id: int, year: int, month: int) -> tuple[str, bytes]:
+    """Отчёт завода за месяц: из кэша, если данные не менялись, иначе новый.
+
+    Одновременные запросы одного отчёта ждут одну общую генерацию и получают одно и то
+    же содержимое.
+
+    Args:
+        factory_id (int): id завода.
+        year (int): Год.
+        month (int): Месяц.
+
+    Returns:
+        tuple[str, bytes]: Имя файла и содержимое xlsx.
+    """
+    key = (factory_id, year, month)
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.create_task(_get_report(factory_id, year, month))
+        _in_flight[key] = task
+        task.add_done_callback(lambda _: _in_flight.pop(key, None))
+    else:
+        logger.info(f"Отчёт (factory_id={factory_id}) за ({year}-{month}) уже готовится")
+    # Отмена одного из ожидающих не должна прерывать генерацию для остальных
+    return await asyncio.shield(task)
+
+
+async def _get_report(factory_id: int, year: int, month: int) -> tuple[str, bytes]:
+    version = await requests.get_report_version(
+        factory_id, year, month, salt=str(REPORT_FORMAT_VERSION)
+    )
+    cached = await requests.get_cached_report(factory_id, year, month)
+    if cached and cached.version == version:
+        logger.info(f"Отчёт (factory_id={factory_id}) за ({year}-{month}) взят из кэша")
+        return cached.filename, cached.content
+
+    logger.info(f"Генерация отчёта (factory_id={factory_id}) за ({year}-{month})")
+    # Отдельный каталог на генерацию: тот же отчёт может одновременно строить другой
+    # процесс (бот или app.worker), и файл с тем же именем не должен перезаписываться
+    directory = tempfile.mkdtemp(prefix="report_")
+    try:
+        filepath = await GeneratorExcel(factory_id, year, month, directory).generate()
+        with open(filepath, "rb") as file:
+            content = file.read()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    filename = os.path.basename(filepath)
+    try:
+        await requests.set_cached_report(factory_id, year, month, version, filename, content)
+    except Exception as ex:
+        logger.error(f"Не удалось сохранить отчёт в кэш:\n{ex}")
+    return filename, content
+
+
+async def get_reports(
+    factory_ids: list[int], year: int, month: int
+) -> AsyncIterator[tuple[str, bytes]]:
+    """Отчёты заводов за месяц по одному, по мере готовности.
+
+    Args:
+        factory_ids (list[int]): id заводов.
+        year (int): Год.
+        month (int): Месяц.
+
+    Yields:
+        tuple[str, bytes]: Имя файла и содержимое xlsx.
+    """
+    for factory_id in factory_ids:
+        yield await get_report(factory_id, year, month)
@@ -0,0 +1,124 @@
+import calendar
+from datetime import datetime
+from typing import NamedTuple, Sequence
+
+import numpy as np
+from sqlalchemy.engine.row import Row
+
+from app.db.models import PayrollWorker, User, WorkerProfile
+from app.db.requests import get_report_positions, get_report_workers, get_shifts_count
+from app.utils import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class Photo(NamedTuple):
+    """Фото наряда."""
+
+    datetime: datetime
+    link: str
+
+
+class ReportModel:
+    """Месячный отчёт завода как матрица рабочие × колонки смен.
+
+    В каждом дне столько колонок, сколько в нём было смен (минимум одна). Ячейка -
+    длительность и код позиции рабочего, пустая ячейка - NaN и код 0. Итоги считаются
+    по матрице, поэтому доступны без пересчёта в Excel.
+
+    Args:
+        year (int): Год.
+        month (int): Месяц.
+        shifts (dict[int, int]): {день: количество смен}.
+        workers (list[tuple[User, bool, WorkerProfile | PayrollWorker]]): Строки отчёта.
+        positions (Sequence[Row]): Позиции (user_id, activity_id, duration, datetime, link),
+            упорядоченные по рабочему и времени смены.
+    """
+
+    def __init__(
+        self,
+        year: int,
+        month: int,
+        shifts: dict[int, int],
+        workers: list[tuple[User, bool, WorkerProfile | PayrollWorker]],
+        positions: Sequence[Row],
+    ):
+        self.year = year
+        self.month = month
+        self.workers = workers
+        self.days_num = calendar.monthrange(year, month)[1]
+        self.day_counts = np.array([shifts.get(day, 1) for day in range(1, self.days_num + 1)])
+        # Первая колонка каждого дня относительно начала колонок месяца
+        self.day_start = np.concatenate(([0], np.cumsum(self.day_counts)[:-1]))
+        self.columns = int(self.day_counts.sum())
+
+        self.durations = np.full((len(workers), self.columns), np.nan)
+        self.activity_ids = np.zeros((len(workers), self.columns), dtype=np.int64)
+        # Ссылка на фото наряда для каждой колонки
+        self.links = np.full(self.columns, None, dtype=object)
+        # Фото нарядов месяца, по одному на наряд, по времени смены
+        self.photos = sorted(
+            {Photo(position.datetime, position.link) for position in positions if position.link}
+        )
+        self._fill(positions)
+
+        self.shifts = np.count_nonzero(~np.isnan(self.durations), axis=1)
+        self.hours = np.nansum(self.durations, axis=1)
+        self.rates = np.array([float(profile.rate) for _, _, profile in workers])
+        self.salary = self.hours * self.rates
+        self.total_salary = float(self.salary.sum())
+
+    @classmethod
+    async def load(
+        cls, factory_id: int, year: int, month: int, snapshot: bool = False
+    ) -> "ReportModel":
+        """Загрузка модели из БД.
+
+        Args:
+            factory_id (int): id завода.
+            year (int): Год.
+            month (int): Месяц.
+            snapshot (bool, optional): Читать из снимка закрытого месяца. Defaults to False.
+
+        Returns:
+            ReportModel: Модель отчёта.
+        """
+        logger.debug(f"Загрузка модели отчёта (factory_id={factory_id}) за ({year}-{month})")
+        return cls(
+            year,
+            month,
+            await get_shifts_count(factory_id, year, month),
+            await get_report_workers(factory_id, year, month, snapshot),
+            await get_report_positions(factory_id, year, month, snapshot),
+        )
+
+    def _fill(self, positions: Sequence[Row]):
+        if not positions or not self.workers:
+            return
+        user_ids = np.array([position.user_id for position in positions])
+        days = np.array([position.datetime.day for position in positions])
+        # Номер позиции рабочего внутри дня: позиции отсортированы по рабочему и времени
+        keys = user_ids * 32 + days
+        index = np.arange(len(keys))
+        starts = np.concatenate(([True], keys[1:] != keys[:-1]))
+        slots = index - np.maximum.accumulate(np.where(starts, index, 0))
+        cols = np.minimum(self.day_start[days - 1] + slots, self.columns - 1)
+
+        # Строки рабочих идут по ФИО, позиции - по id: строка находится поиском по id
+        worker_ids = np.array([user.id for user, _, _ in self.workers])
+        unique_ids, worker_rows = np.unique(worker_ids, return_inverse=True)
+        unique_rows = np.minimum(np.searchsorted(unique_ids, user_ids), len(unique_ids) - 1)
+        known = unique_ids[unique_rows] == user_ids
+        unique_rows, cols = unique_rows[known], cols[known]
+
+        durations = np.full((len(unique_ids), self.columns), np.nan)
+        durations[unique_rows, cols] = [
+            float(position.duration) for position, ok in zip(positions, known) if ok
+        ]
+        activity_ids = np.zeros((len(unique_ids), self.columns), dtype=np.int64)
+        activity_ids[unique_rows, cols] = [
+            position.activity_id for position, ok in zip(positions, known) if ok
+        ]
+        self.durations = durations[worker_rows]
+        self.activity_ids = activity_ids[worker_rows]
+        self.links[cols] = [position.link for position, ok in zip(positions, known) if ok]
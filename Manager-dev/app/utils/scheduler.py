@@ -0,0 +1,115 @@
+import asyncio
+from datetime import date, datetime, timedelta
+
+from app.config.jobs import (
+    REPORT_PREGEN_DAYS,
+    REPORT_PREGEN_HOUR,
+    REPORT_REFRESH_DELAY_SEC,
+    REPORTS_MODE,
+    JobType,
+)
+from app.db import requests
+from app.utils import setup_logger
+from app.utils.month import Month
+from app.utils.reportcache import get_report
+
+logger = setup_logger(__name__)
+
+
+class ReportScheduler:
+    """Заблаговременная генерация отчётов за прошлый месяц.
+
+    В первые REPORT_PREGEN_DAYS дней месяца в REPORT_PREGEN_HOUR часов отчёты всех
+    заводов за прошлый месяц генерируются в кэш отчётов, и запрос админа отдаётся из
+    кэша. Правка позиции прошлого месяца перегенерирует отчёт только её завода.
+    При REPORTS_MODE=queue генерация ставится в очередь задач app.worker.
+    Если процессов бота несколько, цикл подготовки выполняет тот, кто первым отметил
+    его в report_pregen, остальные его пропускают.
+    """
+
+    def __init__(self):
+        self._dirty: set[tuple[int, int, int]] = set()
+        self._changed = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    async def start(self):
+        logger.info(
+            f"Запуск подготовки отчётов (hour={REPORT_PREGEN_HOUR}, days={REPORT_PREGEN_DAYS})"
+        )
+        self._tasks = [
+            asyncio.create_task(self._pregenerate_loop()),
+            asyncio.create_task(self._refresh_loop()),
+        ]
+
+    async def close(self):
+        logger.info("Остановка подготовки отчётов")
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def refresh(self, factory_id: int, year: int, month: int):
+        """Перегенерация отчёта завода после правки.
+
+        Заранее готовится только прошлый месяц, правки других месяцев пропускаются.
+
+        Args:
+            factory_id (int): id завода.
+            year (int): Год правки.
+            month (int): Месяц правки.
+        """
+        prev = Month.Prev()
+        if (year, month) != (prev.year, prev.month):
+            return
+        self._dirty.add((factory_id, year, month))
+        self._changed.set()
+
+    async def _generate(self, factory_id: int, year: int, month: int):
+        try:
+            if REPORTS_MODE == "queue":
+                await requests.add_job(
+                    JobType.REPORT_CACHE,
+                    {"factory_id": factory_id, "year": year, "month": month},
+                )
+            else:
+                await get_report(factory_id, year, month)
+        except Exception as ex:
+            logger.error(
+                f"Не удалось подготовить отчёт (factory_id={factory_id}) за ({year}-{month}):\n\
+{ex}"
+            )
+
+    @staticmethod
+    def _next_run(now: datetime) -> datetime:
+        run = now.replace(hour=REPORT_PREGEN_HOUR, minute=0, second=0, microsecond=0)
+        return run if run > now else run + timedelta(days=1)
+
+    async def _pregenerate_loop(self):
+        while True:
+            now = datetime.now()
+            await asyncio.sleep((self._next_run(now) - now).total_seconds())
+            if datetime.now().day > REPORT_PREGEN_DAYS:
+                continue
+            try:
+                if not await requests.claim_report_pregen(date.today()):
+                    logger.info("Отчёты готовит другой процесс")
+                    continue
+                await self._pregenerate()
+            except Exception as ex:
+                logger.error(f"Не удалось подготовить отчёты:\n{ex}")
+
+    async def _pregenerate(self):
+        prev = Month.Prev()
+        logger.info(f"Подготовка отчётов за ({prev.year}-{prev.month})")
+        for factory in await requests.get_factories():
+            await self._generate(factory.id, prev.year, prev.month)
+
+    async def _refresh_loop(self):
+        while True:
+            await self._changed.wait()
+            # Правки, внесённые подряд, собираются в одну генерацию
+            await asyncio.sleep(REPORT_REFRESH_DELAY_SEC)
+            self._changed.clear()
+            dirty, self._dirty = self._dirty, set()
+            for factory_id, year, month in sorted(dirty):
+                logger.info(f"Обновление отчёта (factory_id={factory_id}) за ({year}-{month})")
+                await self._generate(factory_id, year, month)
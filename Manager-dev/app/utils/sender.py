@@ -0,0 +1,291 @@
+import asyncio
+import itertools
+from enum import IntEnum
+from time import monotonic
+from typing import Any, Dict, Iterable, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import Message
+
+from app.config.bot import (
+    SEND_CHAT_BURST,
+    SEND_CHAT_RATE,
+    SEND_GLOBAL_RATE,
+    SEND_WORKERS,
+)
+from app.utils import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class Priority(IntEnum):
+    """Приоритет исходящего сообщения. Меньше - раньше."""
+
+    INTERACTIVE = 0
+    NOTIFICATION = 1
+    BROADCAST = 2
+
+
+class TokenBucket:
+    """Ведро токенов.
+
+    Args:
+        rate (float): Токенов в секунду.
+        capacity (float): Размер ведра (допустимый всплеск).
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = monotonic()
+
+    def _refill(self):
+        now = monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Сколько секунд ждать до следующего токена (0 - токен есть)."""
+        self._refill()
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+    def give_back(self):
+        """Возврат неиспользованного токена, не больше размера ведра."""
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+
+class Sender:
+    """Очередь исходящих сообщений с учётом лимитов Telegram.
+
+    Сообщения отправляются в порядке приоритета с общим ограничением скорости и
+    ограничением на чат. При `RetryAfter` отправка приостанавливается на указанное
+    время, а сообщение возвращается в очередь.
+
+    Args:
+        bot (Bot): Бот.
+        global_rate (float): Сообщений в секунду всего.
+        chat_rate (float): Сообщений в секунду в один чат.
+        chat_burst (float): Сколько сообщений подряд можно отправить в один чат.
+        workers (int): Сколько запросов к Bot API выполняется одновременно.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        global_rate: float = SEND_GLOBAL_RATE,
+        chat_rate: float = SEND_CHAT_RATE,
+        chat_burst: float = SEND_CHAT_BURST,
+        workers: int = SEND_WORKERS,
+    ):
+        self.bot = bot
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+        self.workers_num = workers
+        self.queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self.paused_until = 0.0
+        self._seq = itertools.count()
+        self._lock = asyncio.Lock()
+        self._workers: list[asyncio.Task] = []
+        self._broadcasts: set[asyncio.Task] = set()
+        self._closed = False
+
+    async def start(self):
+        logger.info("Запуск очереди исходящих сообщений")
+        self._closed = False
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers_num)]
+
+    async def close(self):
+        logger.info("Остановка очереди исходящих сообщений")
+        self._closed = True
+        tasks = [*self._broadcasts, *self._workers]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        # Ожидающие отправки сообщения уже не уйдут: отменяем их, чтобы не зависли ждущие
+        while not self.queue.empty():
+            *_, future = self.queue.get_nowait()
+            future.cancel()
+            self.queue.task_done()
+
+    def _put(self, priority: Priority, chat_id: int, kwargs: dict, future: asyncio.Future):
+        if self._closed:
+            future.cancel()
+            return
+        self.queue.put_nowait((priority, next(self._seq), chat_id, kwargs, future))
+
+    def _enqueue(self, chat_id: int, priority: Priority, kwargs: dict) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._put(priority, chat_id, kwargs | {"chat_id": chat_id}, future)
+        return future
+
+    async def _acquire_global(self):
+        """Ожидание токена общего ведра и окончания паузы после `RetryAfter`."""
+        async with self._lock:
+            while True:
+                pause = self.paused_until - monotonic()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+                    continue
+                delay = self.global_bucket.delay()
+                if not delay:
+                    break
+                await asyncio.sleep(delay)
+            self.global_bucket.take()
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Токен берётся после появления сообщения: свободный worker не должен держать
+            # токен, пока ждёт очередь, иначе общая скорость ниже заданной
+            item = await self.queue.get()
+            try:
+                await self._acquire_global()
+            finally:
+                # Пока ждали токен, могло прийти сообщение важнее: берём лучшее из очереди.
+                # При остановке сообщение возвращается в очередь и отменяется в close
+                self.queue.put_nowait(item)
+                self.queue.task_done()
+            priority, _, chat_id, kwargs, future = self.queue.get_nowait()
+            try:
+                if future.done():
+                    self.global_bucket.give_back()
+                    continue
+                chat_bucket = self.chat_buckets.setdefault(
+                    chat_id, TokenBucket(self.chat_rate, self.chat_burst)
+                )
+                delay = chat_bucket.delay()
+                if delay:
+                    # Чат исчерпал свой лимит: не держим очередь, вернём сообщение позже
+                    self.global_bucket.give_back()
+                    loop.call_later(delay, self._put, priority, chat_id, kwargs, future)
+                    continue
+                chat_bucket.take()
+                # Пауза могла начаться, пока сообщение ждало токен
+                pause = self.paused_until - monotonic()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+                future.set_result(await self.bot.send_message(**kwargs))
+            except TelegramRetryAfter as ex:
+                logger.warning(f"Превышен лимит Telegram, пауза {ex.retry_after} сек")
+                self.paused_until = monotonic() + ex.retry_after
+                self._put(priority, chat_id, kwargs, future)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as ex:
+                future.set_exception(ex)
+            finally:
+                self.queue.task_done()
+                self._cleanup_buckets()
+
+    def _cleanup_buckets(self):
+        # Полное ведро чата эквивалентно новому, его можно не хранить
+        if len(self.chat_buckets) < 1000:
+            return
+        for chat_id, bucket in list(self.chat_buckets.items()):
+            bucket.delay()
+            if bucket.tokens >= bucket.capacity:
+                del self.chat_buckets[chat_id]
+
+    async def send_message(
+        self, chat_id: int, text: str, priority: Priority = Priority.INTERACTIVE, **kwargs: Any
+    ) -> Message:
+        """Отправка сообщения через очередь с ожиданием результата.
+
+        Args:
+            chat_id (int): Чат.
+            text (str): Текст.
+            priority (Priority, optional): Приоритет. Defaults to Priority.INTERACTIVE.
+
+        Returns:
+            Message: Отправленное сообщение.
+        """
+        return await self._enqueue(chat_id, priority, kwargs | {"text": text})
+
+    def notify(self, chat_id: int, text: str, **kwargs: Any) -> asyncio.Future:
+        """Уведомление без ожидания отправки. Ошибки только логируются.
+
+        Args:
+            chat_id (int): Чат.
+            text (str): Текст.
+
+        Returns:
+            asyncio.Future: Результат отправки.
+        """
+        future = self._enqueue(chat_id, Priority.NOTIFICATION, kwargs | {"text": text})
+
+        def log_error(future: asyncio.Future):
+            if not future.cancelled() and future.exception():
+                logger.error(
+                    f"Не удалось отправить уведомление (chat_id={chat_id}):\n\
+{future.exception()}"
+                )
+
+        future.add_done_callback(log_error)
+        return future
+
+    async def broadcast(self, chat_ids: Iterable[int], text: str, **kwargs: Any) -> int:
+        """Рассылка с наименьшим приоритетом.
+
+        Args:
+            chat_ids (Iterable[int]): Чаты.
+            text (str): Текст.
+
+        Returns:
+            int: Количество доставленных сообщений.
+        """
+        futures = [
+            self._enqueue(chat_id, Priority.BROADCAST, kwargs | {"text": text})
+            for chat_id in chat_ids
+        ]
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        failed: Optional[BaseException] = None
+        delivered = 0
+        for result in results:
+            if isinstance(result, BaseException):
+                failed = result
+            else:
+                delivered += 1
+        if failed:
+            logger.warning(
+                f"Рассылка: доставлено {delivered} из {len(futures)}, последняя ошибка:\n{failed}"
+            )
+        return delivered
+
+    def start_broadcast(
+        self, chat_ids: Iterable[int], text: str, report_chat_id: int, report: str, **kwargs: Any
+    ) -> asyncio.Task:
+        """Рассылка в фоне с уведомлением о результате.
+
+        Задача принадлежит очереди и отменяется при её остановке.
+
+        Args:
+            chat_ids (Iterable[int]): Чаты.
+            text (str): Текст.
+            report_chat_id (int): Чат, куда прислать итог.
+            report (str): Шаблон итога, форматируется (доставлено, всего).
+
+        Returns:
+            asyncio.Task: Задача рассылки.
+        """
+        chat_ids = list(chat_ids)
+
+        async def run():
+            delivered = await self.broadcast(chat_ids, text, **kwargs)
+            self.notify(report_chat_id, report.format(delivered, len(chat_ids)))
+
+        task = asyncio.create_task(run())
+        self._broadcasts.add(task)
+        task.add_done_callback(self._broadcasts.discard)
+        return task
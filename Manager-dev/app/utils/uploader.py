@@ -6,6 +6,7 @@ from typing import AsyncGenerator
 
 import yadisk
 
+from app.config.bot import TELEGRAM_API_URL
 from app.db.models import Factory
 from app.utils import setup_logger
 from app.utils.month import MONTHS
@@ -19,7 +20,9 @@ async def yadisk_session() -> AsyncGenerator[yadisk.AsyncClient, None]:
     yield client
 
 
-TELEGRAM_API = f"https://api.telegram.org/file/bot{os.getenv('TOKEN_BOT')}/"
+TELEGRAM_API = (
+    f"{TELEGRAM_API_URL or 'https://api.telegram.org'}/file/bot{os.getenv('TOKEN_BOT')}/"
+)
 DESTINATION = "app:/{company}/{factory}/{master}/{year}/{month}/{day}/{time}/{number}.png"
 
 ATTEMPTS_PHOTO_UPLOAD = 10
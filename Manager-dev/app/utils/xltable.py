@@ -0,0 +1,117 @@
+from dataclasses import dataclass
+from operator import attrgetter
+from typing import Any, Callable
+
+from xlsxwriter.format import Format
+from xlsxwriter.worksheet import Worksheet
+
+from app.config.genexcel import Table
+
+
+@dataclass
+class Formula:
+    """Формула ячейки и её посчитанное значение."""
+
+    formula: str
+    value: Any = 0
+
+
+def write_cells(ws: Worksheet, row: int, col: int, values: list, formats: list[Format]):
+    """Запись строки: подряд идущие ячейки с одним форматом - одним `write_row`.
+
+    Args:
+        ws (Worksheet): Лист.
+        row (int): Строка.
+        col (int): Первая колонка.
+        values (list): Значения ячеек. None - пустая ячейка, Formula - формула.
+        formats (list[Format]): Форматы ячеек.
+    """
+    start = 0
+    for end in range(1, len(values) + 1):
+        if (
+            end < len(values)
+            and formats[end] is formats[start]
+            and not isinstance(values[start], Formula)
+            and not isinstance(values[end], Formula)
+        ):
+            continue
+        value = values[start]
+        if isinstance(value, Formula):
+            ws.write_formula(row, col + start, value.formula, formats[start], value.value)
+        else:
+            ws.write_row(row, col + start, values[start:end], formats[start])
+        start = end
+
+
+class TablePlan:
+    """Описание таблицы из app.config.genexcel, скомпилированное в функции колонок.
+
+    Ключи и стили разбираются один раз при компиляции. Запись строки - вызов
+    готовых функций значения и формата для каждой колонки и `write_cells`.
+
+    Args:
+        headers (list[str]): Заголовки колонок.
+        values (list[Callable]): Функции значения колонки от объекта строки.
+        formats (list[Format | Callable]): Формат колонки или функция формата от объекта строки.
+    """
+
+    def __init__(
+        self, headers: list[str], values: list[Callable], formats: list[Format | Callable]
+    ):
+        self.headers = headers
+        self.values = values
+        self.formats = [None if callable(fmt) else fmt for fmt in formats]
+        self.dynamic_formats = [(col, fmt) for col, fmt in enumerate(formats) if callable(fmt)]
+
+    @classmethod
+    def compile(
+        cls,
+        table: dict,
+        styles: dict,
+        values: dict[Any, Callable] = None,
+        formats: dict[Any, Callable] = None,
+    ) -> "TablePlan":
+        """Компиляция описания таблицы.
+
+        Args:
+            table (dict): Описание вида {Table.DESC: {заголовок: (ключ, стиль)}}.
+            styles (dict): Загруженные форматы книги.
+            values (dict[Any, Callable], optional): Функции значения для ключей, которые не
+                являются атрибутами объекта строки. По умолчанию - атрибут по ключу.
+            formats (dict[Any, Callable], optional): Функции формата для колонок, формат
+                которых зависит от строки. По умолчанию - формат стиля колонки.
+
+        Returns:
+            TablePlan: Скомпилированная таблица.
+        """
+        values = values or {}
+        formats = formats or {}
+        headers, value_funcs, format_funcs = [], [], []
+        for header, (key, style) in table[Table.DESC].items():
+            headers.append(header)
+            value = values.get(key)
+            if value is None:
+                value = attrgetter(key if isinstance(key, str) else key.key)
+            value_funcs.append(value)
+            format_funcs.append(formats.get(key) or styles.get(style))
+        return cls(headers, value_funcs, format_funcs)
+
+    def row(self, obj) -> tuple[list, list[Format]]:
+        """Значения и форматы ячеек строки.
+
+        Args:
+            obj: Объект строки.
+
+        Returns:
+            tuple[list, list[Format]]: Значения и форматы.
+        """
+        formats = self.formats.copy()
+        for col, fmt in self.dynamic_formats:
+            formats[col] = fmt(obj)
+        return [value(obj) for value in self.values], formats
+
+    def write_header(self, ws: Worksheet, row: int, fmt: Format, col: int = 0):
+        ws.write_row(row, col, self.headers, fmt)
+
+    def write(self, ws: Worksheet, row: int, obj, col: int = 0):
+        write_cells(ws, row, col, *self.row(obj))
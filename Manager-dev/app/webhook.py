@@ -0,0 +1,119 @@
+import asyncio
+import signal
+from typing import Any
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from app.config.bot import (
+    WEBHOOK_HOST,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET,
+    WEBHOOK_SHUTDOWN_TIMEOUT_SEC,
+    WEBHOOK_URL,
+)
+from app.utils import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class InFlightRequestHandler(SimpleRequestHandler):
+    """Обработчик webhook с учётом принятых, но ещё не обработанных обновлений.
+
+    Обновление учитывается с момента приёма, в том числе пока оно ждёт своей очереди
+    в UserOrderMiddleware или свободного места под UPDATES_CONCURRENCY.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    async def _background_feed_update(self, bot: Bot, update: dict[str, Any]) -> None:
+        self.count += 1
+        self.idle.clear()
+        try:
+            await super()._background_feed_update(bot, update)
+        finally:
+            self._done()
+
+    def _done(self):
+        self.count -= 1
+        if not self.count:
+            self.idle.set()
+
+
+def create_app(dp: Dispatcher, bot: Bot) -> tuple[web.Application, InFlightRequestHandler]:
+    """aiohttp приложение, принимающее обновления от Telegram.
+
+    Запросы без верного `X-Telegram-Bot-Api-Secret-Token` отклоняются.
+
+    Args:
+        dp (Dispatcher): Диспетчер.
+        bot (Bot): Бот.
+
+    Returns:
+        tuple[web.Application, InFlightRequestHandler]: Приложение и обработчик webhook.
+    """
+    app = web.Application()
+    handler = InFlightRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET)
+    handler.register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    return app, handler
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, allowed_updates: list[str]):
+    """Запуск бота в режиме webhook до SIGINT/SIGTERM.
+
+    Без WEBHOOK_SECRET не запускается: иначе обновления мог бы прислать кто угодно.
+    При остановке сервер перестаёт принимать запросы, ждёт обработки уже принятых
+    обновлений (не дольше WEBHOOK_SHUTDOWN_TIMEOUT_SEC) и только затем закрывается.
+
+    Args:
+        dp (Dispatcher): Диспетчер.
+        bot (Bot): Бот.
+        allowed_updates (list[str]): Типы обновлений, которые присылает Telegram.
+
+    Raises:
+        RuntimeError: Не задан WEBHOOK_SECRET.
+    """
+    if not WEBHOOK_SECRET:
+        raise RuntimeError("Режим webhook требует WEBHOOK_SECRET")
+
+    async def on_startup(bot: Bot):
+        logger.info(f"Установка webhook {WEBHOOK_URL}{WEBHOOK_PATH}")
+        await bot.set_webhook(
+            url=WEBHOOK_URL + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=allowed_updates,
+        )
+
+    if WEBHOOK_URL:
+        dp.startup.register(on_startup)
+
+    app, in_flight = create_app(dp, bot)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=WEBHOOK_HOST, port=WEBHOOK_PORT)
+    await site.start()
+    logger.info(f"Webhook сервер слушает {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        logger.info("Остановка webhook сервера")
+        await site.stop()
+        # Даём стартовать задачам обновлений, принятых перед остановкой
+        await asyncio.sleep(0)
+        try:
+            await asyncio.wait_for(in_flight.idle.wait(), WEBHOOK_SHUTDOWN_TIMEOUT_SEC)
+        except asyncio.TimeoutError:
+            logger.warning(f"Не дождались обработки {in_flight.count} обновлений")
+        await runner.cleanup()
@@ -0,0 +1,174 @@
+import asyncio
+import signal
+from datetime import datetime, timedelta
+
+from aiogram import Bot
+
+from app.__main__ import create_bot
+from app.config import messages
+from app.config.db import JobLen
+from app.config.genexcel import ZIP_FILENAME_TEMPLATE
+from app.config.jobs import (
+    JOB_CONCURRENCY,
+    JOB_HEARTBEAT_SEC,
+    JOB_MAX_ATTEMPTS,
+    JOB_POLL_INTERVAL_SEC,
+    JOB_RETRY_DELAY_SEC,
+    JobType,
+)
+from app.db import requests
+from app.db.models import Job, db_init, engine
+from app.db.stats import setup_db_stats
+from app.utils import setup_logger
+from app.utils.delivery import send_documents, send_zip
+from app.utils.month import MONTHS
+from app.utils.reportcache import get_report, get_reports
+
+logger = setup_logger(__name__)
+
+
+async def run_report(bot: Bot, args: dict):
+    """Генерация отчётов и отправка их в чат.
+
+    Args:
+        bot (Bot): Бот.
+        args (dict): chat_id, factory_ids, year, month и zip - отправить одним архивом.
+    """
+    year, month = args["year"], args["month"]
+    reports = get_reports(args["factory_ids"], year, month)
+    if args.get("zip"):
+        await send_zip(
+            bot, args["chat_id"], ZIP_FILENAME_TEMPLATE.format(MONTHS[month], year), reports
+        )
+    else:
+        await send_documents(bot, args["chat_id"], reports)
+
+
+async def run_report_cache(bot: Bot, args: dict):
+    """Генерация отчёта в кэш без отправки.
+
+    Args:
+        bot (Bot): Бот.
+        args (dict): factory_id, year, month.
+    """
+    await get_report(args["factory_id"], args["year"], args["month"])
+
+
+# Обработчики задач и сообщение пользователю, если задача так и не выполнилась
+HANDLERS = {
+    JobType.REPORT: (run_report, messages.CANT_GENERATE_REPORT),
+    JobType.REPORT_CACHE: (run_report_cache, None),
+}
+
+
+async def heartbeat(job: Job, task: asyncio.Task):
+    """Продление аренды задачи, пока она выполняется.
+
+    Если задачу уже взял другой worker, выполнение `task` отменяется, чтобы отчёт не
+    был отправлен дважды.
+
+    Args:
+        job (Job): Выполняемая задача.
+        task (asyncio.Task): Задача asyncio с обработчиком.
+    """
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_SEC)
+        try:
+            extended = await requests.extend_job(job.id, job.attempts)
+        except Exception as ex:
+            logger.error(f"Не удалось продлить аренду задачи (id={job.id}):\n{ex}")
+            continue
+        if not extended:
+            logger.error(f"Аренда задачи (id={job.id}, attempts={job.attempts}) потеряна")
+            task.cancel()
+            return
+
+
+async def run_job(bot: Bot, job: Job):
+    logger.info(f"Выполнение задачи (id={job.id}, type={job.type}, attempts={job.attempts})")
+    handler, fail_message = HANDLERS.get(job.type, (None, None))
+    try:
+        if handler is None:
+            raise ValueError(f"Неизвестный тип задачи {job.type}")
+        if job.attempts > JOB_MAX_ATTEMPTS:
+            # Задача вернулась после падения worker'а на последней попытке
+            raise RuntimeError("Превышено количество попыток")
+        task = asyncio.create_task(handler(bot, job.args))
+        lease = asyncio.create_task(heartbeat(job, task))
+        try:
+            await task
+        finally:
+            lease.cancel()
+    except asyncio.CancelledError:
+        if not task.cancelled() or asyncio.current_task().cancelling():
+            raise
+        # Аренду потеряли: задачей теперь владеет другой worker
+        logger.info(f"Задача (id={job.id}, attempts={job.attempts}) прервана")
+        return
+    except Exception as ex:
+        logger.error(f"Задача (id={job.id}) завершилась ошибкой:\n{ex}")
+        retry_at = None
+        if handler is not None and job.attempts < JOB_MAX_ATTEMPTS:
+            retry_at = datetime.now() + timedelta(seconds=JOB_RETRY_DELAY_SEC * job.attempts)
+        finished = await requests.finish_job(
+            job.id, job.attempts, (str(ex) or repr(ex))[: JobLen.error], retry_at
+        )
+        if finished and retry_at is None and fail_message and job.args.get("chat_id"):
+            await bot.send_message(job.args["chat_id"], fail_message)
+        return
+    if not await requests.finish_job(job.id, job.attempts):
+        logger.warning(f"Задача (id={job.id}) выполнена после потери аренды")
+        return
+    logger.info(f"Задача (id={job.id}) выполнена")
+
+
+async def work(bot: Bot, stop: asyncio.Event):
+    """Выполнение задач из очереди по одной до остановки.
+
+    Args:
+        bot (Bot): Бот.
+        stop (asyncio.Event): Событие остановки. Текущая задача доделывается.
+    """
+    while not stop.is_set():
+        try:
+            job = await requests.take_job()
+        except Exception as ex:
+            logger.error(f"Не удалось получить задачу:\n{ex}")
+            job = None
+        if job is None:
+            try:
+                await asyncio.wait_for(stop.wait(), JOB_POLL_INTERVAL_SEC)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        try:
+            await run_job(bot, job)
+        except Exception as ex:
+            # Задача вернётся в очередь после окончания аренды
+            logger.error(f"Не удалось завершить задачу (id={job.id}):\n{ex}")
+
+
+async def main():
+    """Процесс, выполняющий фоновые задачи. Запуск: `python -m app.worker`."""
+    setup_db_stats(engine)
+    await db_init()
+    bot = create_bot()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    logger.info(f"Старт worker'а (concurrency={JOB_CONCURRENCY})")
+    try:
+        await asyncio.gather(*(work(bot, stop) for _ in range(JOB_CONCURRENCY)))
+    finally:
+        logger.info("Остановка worker'а")
+        await bot.session.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except Exception as ex:
+        logger.critical(ex)